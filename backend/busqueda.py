@@ -0,0 +1,573 @@
+import os
+import re
+import html
+import logging
+import unicodedata
+from functools import lru_cache
+from typing import Any, Dict, Iterable, List, Optional, Sequence
+from sqlalchemy import bindparam, text
+from sqlalchemy.orm import Session
+from database import engine
+from models import LibroDigital, Nota
+from persistencia_masiva import en_lotes
+
+logger = logging.getLogger("ArcaBusqueda")
+
+# Texto extraído que se indexa por libro (las primeras páginas bastan para encontrarlo)
+BUSQUEDA_MAX_TEXTO = int(os.getenv("BUSQUEDA_MAX_TEXTO", "20000"))
+
+# Peso de cada columna en el ranking: una coincidencia en el título vale más que en el texto
+PESOS = {"titulo": 10.0, "autor": 6.0, "etiquetas": 4.0, "descripcion": 1.5, "texto": 1.0}
+COLUMNAS = tuple(PESOS)
+# Con términos muy frecuentes (p.ej. "dios" en una biblioteca teológica) ordenar todas las
+# coincidencias del texto costaría cientos de ms: se puntúan como mucho estas candidatas
+BUSQUEDA_CANDIDATOS_TEXTO = int(os.getenv("BUSQUEDA_CANDIDATOS_TEXTO", "2000"))
+
+# --- Análisis de texto (español) ---
+# Se hace en Python y no en el motor: SQLite no trae stemmer en español y así FTS5 y
+# Postgres indexan exactamente los mismos términos (y el resaltado coincide con ambos).
+
+PALABRAS_VACIAS = frozenset("""
+a al algo algunas algunos ante antes como con contra cual cuando de del desde donde durante e el ella
+ellas ellos en entre era es esa esas ese eso esos esta estas este esto estos fue ha hay la las le les lo
+los mas me mi mis muy nada ni no nos o os otra otras otro otros para pero poco por porque que quien
+quienes se sea ser si sin sobre son su sus tambien tanto te todo todos tu un una uno unos y ya yo
+""".split())
+
+_SUFIJOS = ("amientos", "imientos", "aciones", "uciones", "amiento", "imiento", "idades", "mente",
+            "acion", "ucion", "adora", "ador", "ancia", "encia", "idad", "ismo", "ista", "able", "ible")
+
+_PALABRA = re.compile(r"\w+")
+_BLOQUES_OCULTOS = re.compile(r"<(script|style)\b.*?</\1\s*>", re.S | re.I)
+_ETIQUETA = re.compile(r"<[^>]+>")
+_IDS = bindparam("ids", expanding=True)
+
+def plegar(texto: str) -> str:
+    """Minúsculas y sin tildes ("Teología" -> "teologia")."""
+    texto = unicodedata.normalize("NFKD", texto.casefold())
+    return "".join(c for c in texto if not unicodedata.combining(c))
+
+def raiz(palabra: str) -> str:
+    """Stemmer ligero para español: plurales, sufijos derivativos frecuentes y vocal de género.
+
+    "profetas", "profeta" -> "profet"; "oraciones", "oracion" -> "oracion"; "luces" -> "luz".
+    """
+    if len(palabra) <= 3 or palabra.isdigit():
+        return palabra
+    if palabra.endswith("ces"):
+        palabra = palabra[:-3] + "z"
+    elif palabra.endswith("es") and len(palabra) > 4 and palabra[-3] not in "aeiou":
+        palabra = palabra[:-2]
+    elif palabra.endswith("s"):
+        palabra = palabra[:-1]
+    for sufijo in _SUFIJOS:
+        if palabra.endswith(sufijo) and len(palabra) - len(sufijo) >= 3:
+            palabra = palabra[:-len(sufijo)]
+            break
+    if len(palabra) > 4 and palabra[-1] in "aeo":
+        palabra = palabra[:-1]
+    return palabra
+
+# Las palabras se repiten mucho (Zipf): se memoriza el análisis de cada una
+_raiz = lru_cache(maxsize=65536)(raiz)
+
+def analizar(texto: Optional[str]) -> List[str]:
+    """Raíces indexables de un texto, en orden (sin palabras vacías)."""
+    if not texto:
+        return []
+    return [_raiz(p) for p in _PALABRA.findall(plegar(texto)) if p not in PALABRAS_VACIAS]
+
+@lru_cache(maxsize=65536)
+def _raiz_palabra(palabra: str) -> str:
+    return _raiz(plegar(palabra))
+
+def texto_de_html(contenido: Optional[str]) -> str:
+    """Texto plano de un HTML (cuerpo de una nota): sin etiquetas y con las entidades resueltas."""
+    if not contenido:
+        return ""
+    contenido = _ETIQUETA.sub(" ", _BLOQUES_OCULTOS.sub(" ", contenido))
+    return " ".join(html.unescape(contenido).split())
+
+def terminos_consulta(consulta: str) -> List[str]:
+    """Raíces únicas de la consulta, conservando el orden."""
+    return list(dict.fromkeys(analizar(consulta)))
+
+def coincidencias(palabras: Sequence[str], terminos: Iterable[str], prefijo: Optional[str] = None) -> List[int]:
+    """Posiciones de las palabras cuya raíz es uno de los términos (o empieza por prefijo)."""
+    buscados = set(terminos)
+    aciertos = []
+    for i, palabra in enumerate(palabras):
+        r = _raiz_palabra(palabra)
+        if r in buscados or (prefijo and r.startswith(prefijo)):
+            aciertos.append(i)
+    return aciertos
+
+def mejor_ventana(aciertos: Sequence[int], ancho: int) -> int:
+    """Inicio de la ventana de `ancho` palabras que contiene más aciertos (aciertos ordenados, no vacíos)."""
+    mejor, inicio, j = 0, aciertos[0], 0
+    for i, a in enumerate(aciertos):
+        while aciertos[j] < a - ancho + 1:
+            j += 1
+        if i - j + 1 > mejor:
+            mejor, inicio = i - j + 1, aciertos[j]
+    return inicio
+
+def resaltar(texto: Optional[str], terminos: Sequence[str], prefijo: Optional[str] = None,
+             ancho: int = 30, max_caracteres: int = 5000) -> Optional[str]:
+    """Fragmento de ~ancho palabras alrededor de la zona con más coincidencias, con <mark>.
+
+    El texto se escapa (HTML seguro); prefijo es el último término de la consulta,
+    que también casa por prefijo mientras se escribe. Solo se examinan los primeros
+    max_caracteres (el fragmento es orientativo; el ranking ya lo hizo el índice).
+    """
+    if not texto:
+        return None
+    palabras = list(_PALABRA.finditer(texto, 0, max_caracteres))
+    aciertos = coincidencias([m.group() for m in palabras], terminos, prefijo)
+    if not aciertos:
+        return None
+
+    inicio = max(0, mejor_ventana(aciertos, ancho) - 3)
+    fin = min(len(palabras), inicio + ancho)
+    marcadas = set(aciertos)
+
+    partes, posicion = [], palabras[inicio].start()
+    for i in range(inicio, fin):
+        m = palabras[i]
+        partes.append(html.escape(texto[posicion:m.start()]))
+        palabra = html.escape(m.group())
+        partes.append(f"<mark>{palabra}</mark>" if i in marcadas else palabra)
+        posicion = m.end()
+    fragmento = " ".join("".join(partes).split())
+    if inicio > 0:
+        fragmento = "… " + fragmento
+    if fin < len(palabras):
+        fragmento += " …"
+    return fragmento
+
+# --- Índice ---
+
+class IndiceBusqueda:
+    """Índice de texto completo de libros_digitales (metadatos + texto extraído).
+
+    SQLite: tabla virtual FTS5 libros_fts (rowid = id del libro), ranking bm25.
+    Postgres: tabla libros_busqueda con un tsvector ponderado (A-D) e índice GIN, ranking ts_rank.
+    En ambos se guardan las raíces ya analizadas; el texto original se conserva
+    (sin indexar) para construir los fragmentos resaltados.
+    """
+
+    def __init__(self, engine=engine):
+        self.engine = engine
+        self.motor = engine.dialect.name
+        self._preparado = False
+
+    def preparar(self):
+        """Crea las estructuras del índice si no existen (idempotente)."""
+        if self._preparado:
+            return
+        with self.engine.begin() as conn:
+            if self.motor == "sqlite":
+                conn.execute(text(
+                    "CREATE VIRTUAL TABLE IF NOT EXISTS libros_fts USING fts5("
+                    "titulo, autor, etiquetas, descripcion, texto, original UNINDEXED, "
+                    "tokenize='unicode61 remove_diacritics 2', prefix='2 3')"
+                ))
+            elif self.motor == "postgresql":
+                conn.execute(text(
+                    "CREATE TABLE IF NOT EXISTS libros_busqueda ("
+                    "id INTEGER PRIMARY KEY, documento TSVECTOR NOT NULL, original TEXT)"
+                ))
+                conn.execute(text(
+                    "CREATE INDEX IF NOT EXISTS ix_libros_busqueda_documento ON libros_busqueda USING GIN (documento)"
+                ))
+            else:
+                logger.warning(f"Búsqueda de texto completo no disponible para {self.motor}: se usará LIKE.")
+        self._preparado = True
+
+    @property
+    def disponible(self) -> bool:
+        if self.motor not in ("sqlite", "postgresql"):
+            return False
+        self.preparar()
+        return True
+
+    # --- Mantenimiento (sin commit: van en la transacción de quien llama) ---
+
+    def _originales(self, db: Session, ids: List[int]) -> Dict[int, str]:
+        tabla, columna = ("libros_fts", "rowid") if self.motor == "sqlite" else ("libros_busqueda", "id")
+        originales = {}
+        for lote in en_lotes(ids):
+            filas = db.execute(text(f"SELECT {columna}, original FROM {tabla} WHERE {columna} IN :ids")
+                               .bindparams(_IDS), {"ids": list(lote)})
+            originales.update({id_libro: original for id_libro, original in filas if original})
+        return originales
+
+    def indexar(self, db: Session, ids: Iterable[int], textos: Optional[Dict[int, str]] = None):
+        """(Re)indexa los libros dados. textos: texto extraído por id; si falta, se conserva el ya indexado."""
+        if not self.disponible:
+            return
+        ids = list(ids)
+        if not ids:
+            return
+        textos = dict(textos or {})
+        faltan = [i for i in ids if i not in textos]
+        if faltan:
+            textos.update({i: t for i, t in self._originales(db, faltan).items() if i not in textos})
+
+        for lote in en_lotes(ids):
+            libros = db.query(LibroDigital.id, LibroDigital.titulo, LibroDigital.autor,
+                              LibroDigital.etiquetas, LibroDigital.descripcion) \
+                .filter(LibroDigital.id.in_(lote)).all()
+            filas = []
+            for libro in libros:
+                original = (textos.get(libro.id) or "")[:BUSQUEDA_MAX_TEXTO] or None
+                fila = {c: " ".join(analizar(getattr(libro, c))) for c in COLUMNAS if c != "texto"}
+                fila.update(id=libro.id, texto=" ".join(analizar(original)), original=original)
+                filas.append(fila)
+            self._escribir(db, lote, filas)
+
+    def _escribir(self, db: Session, ids, filas: List[Dict[str, Any]]):
+        if self.motor == "sqlite":
+            db.execute(text("DELETE FROM libros_fts WHERE rowid IN :ids").bindparams(_IDS), {"ids": list(ids)})
+            if filas:
+                db.execute(text(
+                    "INSERT INTO libros_fts (rowid, titulo, autor, etiquetas, descripcion, texto, original) "
+                    "VALUES (:id, :titulo, :autor, :etiquetas, :descripcion, :texto, :original)"
+                ), filas)
+        else:
+            db.execute(text("DELETE FROM libros_busqueda WHERE id IN :ids").bindparams(_IDS), {"ids": list(ids)})
+            if filas:
+                db.execute(text(
+                    "INSERT INTO libros_busqueda (id, documento, original) VALUES (:id, "
+                    "setweight(to_tsvector('simple', :titulo), 'A') || "
+                    "setweight(to_tsvector('simple', :autor || ' ' || :etiquetas), 'B') || "
+                    "setweight(to_tsvector('simple', :descripcion), 'C') || "
+                    "setweight(to_tsvector('simple', :texto), 'D'), :original)"
+                ), filas)
+
+    def eliminar(self, db: Session, ids: Iterable[int]):
+        if not self.disponible:
+            return
+        for lote in en_lotes(list(ids)):
+            self._escribir(db, lote, [])
+
+    def reconciliar(self, db: Session) -> Dict[str, int]:
+        """Indexa los libros que faltan y borra del índice los que ya no existen. Hace commit por lotes.
+
+        Se llama al terminar escaneos y sincronizaciones (que insertan y borran en bloque)
+        y al arrancar, para construir el índice de una base de datos existente.
+        """
+        if not self.disponible:
+            return {"indexados": 0, "eliminados": 0}
+        tabla, columna = ("libros_fts", "rowid") if self.motor == "sqlite" else ("libros_busqueda", "id")
+        en_indice = {i for (i,) in db.execute(text(f"SELECT {columna} FROM {tabla}"))}
+        en_db = {i for (i,) in db.query(LibroDigital.id)}
+        faltan, sobran = sorted(en_db - en_indice), sorted(en_indice - en_db)
+        for lote in en_lotes(faltan):
+            self.indexar(db, lote)
+            db.commit()
+        self.eliminar(db, sobran)
+        db.commit()
+        if faltan or sobran:
+            logger.info(f"Índice de búsqueda: {len(faltan)} libros indexados, {len(sobran)} eliminados.")
+        return {"indexados": len(faltan), "eliminados": len(sobran)}
+
+    # --- Consulta ---
+
+    def buscar(self, db: Session, consulta: str, limite: int = 20, categoria: str = None,
+               formato: str = None) -> List[Dict[str, Any]]:
+        """Libros que contienen todos los términos (el último también como prefijo), por relevancia."""
+        terminos = terminos_consulta(consulta)
+        if not terminos:
+            return []
+        filtros, parametros = [], {"limite": limite}
+        if categoria:
+            filtros.append("l.categoria = :categoria")
+            parametros["categoria"] = categoria
+        if formato:
+            filtros.append("l.formato = :formato")
+            parametros["formato"] = formato.lower()
+        where = "".join(f" AND {f}" for f in filtros)
+
+        if not self.disponible:
+            return self._buscar_like(db, consulta, limite, categoria, formato)
+
+        # Dos fases: 1) coincidencias en título/autor/etiquetas (las de más peso), ordenadas
+        # por relevancia; 2) si no llenan la página, coincidencias en el resto del texto,
+        # puntuando solo las primeras BUSQUEDA_CANDIDATOS_TEXTO en lugar de todas.
+        puntuaciones = self._consultar(db, terminos, where, parametros, solo_metadatos=True, limite=limite)
+        if len(puntuaciones) < limite:
+            candidatas = self._consultar(db, terminos, where, parametros, solo_metadatos=False,
+                                         limite=BUSQUEDA_CANDIDATOS_TEXTO)
+            for id_libro, puntuacion in sorted(candidatas.items(), key=lambda c: -c[1]):
+                if len(puntuaciones) >= limite:
+                    break
+                puntuaciones.setdefault(id_libro, puntuacion)
+
+        tabla, columna = ("libros_fts", "rowid") if self.motor == "sqlite" else ("libros_busqueda", "id")
+        filas = {fila.id: fila for fila in db.execute(text(
+            f"SELECT l.id, l.ruta, l.titulo, l.autor, l.categoria, l.formato, l.descripcion, i.original "
+            f"FROM libros_digitales l JOIN {tabla} i ON i.{columna} = l.id WHERE l.id IN :ids"
+        ).bindparams(_IDS), {"ids": list(puntuaciones)})}
+
+        resultados = []
+        for id_libro, puntuacion in puntuaciones.items():
+            fila = filas.get(id_libro)
+            if fila is None:
+                continue
+            fragmento = None
+            for campo in (fila.original, fila.descripcion):
+                fragmento = resaltar(campo, terminos, prefijo=terminos[-1])
+                if fragmento:
+                    break
+            resultados.append({
+                "id": fila.id,
+                "ruta": fila.ruta,
+                "titulo": fila.titulo,
+                "titulo_resaltado": resaltar(fila.titulo, terminos, prefijo=terminos[-1], ancho=50) or
+                                    html.escape(fila.titulo or ""),
+                "autor": fila.autor,
+                "categoria": fila.categoria,
+                "formato": fila.formato,
+                "puntuacion": round(float(puntuacion), 4),
+                "fragmento": fragmento,
+            })
+        return resultados
+
+    def _consultar(self, db: Session, terminos: List[str], where: str, parametros: Dict[str, Any],
+                   solo_metadatos: bool, limite: int) -> Dict[int, float]:
+        """{id: puntuación} de una fase. En la de texto no se ordena: se toman `limite` coincidencias."""
+        parametros = {**parametros, "limite": limite}
+        if self.motor == "sqlite":
+            # "a" "b" "c"* : todos los términos, el último por prefijo (búsqueda mientras se escribe)
+            expresion = " ".join(f'"{t}"' for t in terminos[:-1]) + f' "{terminos[-1]}"*'
+            parametros["q"] = f"{{titulo autor etiquetas}} : ({expresion})" if solo_metadatos else expresion
+            pesos = ", ".join(str(PESOS[c]) for c in COLUMNAS)
+            orden = " ORDER BY puntuacion DESC" if solo_metadatos else ""
+            # CROSS JOIN fija el orden en SQLite: primero el MATCH, luego los filtros por fila
+            union = " CROSS JOIN libros_digitales l ON l.id = f.rowid" if where else ""
+            filas = db.execute(text(
+                f"SELECT f.rowid, -bm25(libros_fts, {pesos}, 0.0) AS puntuacion "
+                f"FROM libros_fts f{union} WHERE libros_fts MATCH :q{where}{orden} LIMIT :limite"
+            ), parametros)
+        else:
+            # Peso A = título, B = autor y etiquetas (ver _escribir)
+            sufijo = "AB" if solo_metadatos else ""
+            parametros["q"] = " & ".join([f"{t}:{sufijo}" if sufijo else t for t in terminos[:-1]] +
+                                         [f"{terminos[-1]}:*{sufijo}"])
+            orden = " ORDER BY puntuacion DESC" if solo_metadatos else ""
+            union = " JOIN libros_digitales l ON l.id = b.id" if where else ""
+            filas = db.execute(text(
+                f"SELECT b.id, ts_rank(b.documento, q, 1) AS puntuacion "
+                f"FROM libros_busqueda b{union}, to_tsquery('simple', :q) q "
+                f"WHERE b.documento @@ q{where}{orden} LIMIT :limite"
+            ), parametros)
+        return {id_libro: puntuacion for id_libro, puntuacion in filas}
+
+    def documentos(self, db: Session, consulta: str, limite: int = 20) -> List[Any]:
+        """Libros con texto extraído que contienen alguno de los términos, por relevancia.
+
+        Para el asistente (RAG): una pregunta en lenguaje natural rara vez contiene todas
+        sus palabras en un mismo libro, así que aquí los términos se combinan con OR.
+        Filas con id, titulo, autor, hash_md5, original y puntuacion.
+        """
+        terminos = terminos_consulta(consulta)
+        if not terminos or not self.disponible:
+            return []
+        if self.motor == "sqlite":
+            pesos = ", ".join(str(PESOS[c]) for c in COLUMNAS)
+            sql = (f"SELECT l.id, l.titulo, l.autor, l.hash_md5, f.original, "
+                   f"-bm25(libros_fts, {pesos}, 0.0) AS puntuacion "
+                   f"FROM libros_fts f CROSS JOIN libros_digitales l ON l.id = f.rowid "
+                   f"WHERE libros_fts MATCH :q AND f.original IS NOT NULL ORDER BY puntuacion DESC LIMIT :limite")
+            q = " OR ".join(f'"{t}"' for t in terminos)
+        else:
+            sql = ("SELECT l.id, l.titulo, l.autor, l.hash_md5, b.original, ts_rank(b.documento, q, 1) AS puntuacion "
+                   "FROM libros_busqueda b JOIN libros_digitales l ON l.id = b.id, to_tsquery('simple', :q) q "
+                   "WHERE b.documento @@ q AND b.original IS NOT NULL ORDER BY puntuacion DESC LIMIT :limite")
+            q = " | ".join(terminos)
+        return db.execute(text(sql), {"q": q, "limite": limite}).all()
+
+    @staticmethod
+    def _buscar_like(db: Session, consulta: str, limite: int, categoria: str, formato: str):
+        """Motores sin texto completo: coincidencia simple en título y autor, sin ranking."""
+        patron = f"%{consulta.strip()}%"
+        q = db.query(LibroDigital).filter(LibroDigital.titulo.ilike(patron) | LibroDigital.autor.ilike(patron))
+        if categoria:
+            q = q.filter(LibroDigital.categoria == categoria)
+        if formato:
+            q = q.filter(LibroDigital.formato == formato.lower())
+        return [{"id": l.id, "ruta": l.ruta, "titulo": l.titulo, "titulo_resaltado": html.escape(l.titulo or ""),
+                 "autor": l.autor, "categoria": l.categoria, "formato": l.formato, "puntuacion": 0.0,
+                 "fragmento": None} for l in q.limit(limite)]
+
+    def estadisticas(self, db: Session) -> Dict[str, Any]:
+        if not self.disponible:
+            return {"motor": self.motor, "documentos": 0}
+        tabla = "libros_fts" if self.motor == "sqlite" else "libros_busqueda"
+        return {"motor": self.motor, "documentos": db.execute(text(f"SELECT COUNT(*) FROM {tabla}")).scalar()}
+
+# Peso de cada columna del índice de notas
+PESOS_NOTAS = {"titulo": 10.0, "palabras_clave": 5.0, "cuerpo": 1.0}
+
+class IndiceNotas:
+    """Índice de texto completo del cuaderno: título, palabras clave y cuerpo sin HTML.
+
+    Misma estructura que IndiceBusqueda: FTS5 notas_fts (rowid = id de la nota) en SQLite,
+    tsvector ponderado con GIN (notas_busqueda) en Postgres. Guarda la fecha_actualizacion
+    indexada ("version") para que reconciliar detecte también notas cambiadas fuera de la API.
+    """
+
+    def __init__(self, engine=engine):
+        self.engine = engine
+        self.motor = engine.dialect.name
+        self.tabla, self.columna_id = ("notas_fts", "rowid") if self.motor == "sqlite" else ("notas_busqueda", "id")
+        self._preparado = False
+
+    def preparar(self):
+        """Crea las estructuras del índice si no existen (idempotente)."""
+        if self._preparado:
+            return
+        with self.engine.begin() as conn:
+            if self.motor == "sqlite":
+                conn.execute(text(
+                    "CREATE VIRTUAL TABLE IF NOT EXISTS notas_fts USING fts5("
+                    "titulo, palabras_clave, cuerpo, original UNINDEXED, version UNINDEXED, "
+                    "tokenize='unicode61 remove_diacritics 2', prefix='2 3')"
+                ))
+            elif self.motor == "postgresql":
+                conn.execute(text(
+                    "CREATE TABLE IF NOT EXISTS notas_busqueda ("
+                    "id INTEGER PRIMARY KEY, documento TSVECTOR NOT NULL, original TEXT, version TEXT)"
+                ))
+                conn.execute(text(
+                    "CREATE INDEX IF NOT EXISTS ix_notas_busqueda_documento ON notas_busqueda USING GIN (documento)"
+                ))
+        self._preparado = True
+
+    @property
+    def disponible(self) -> bool:
+        if self.motor not in ("sqlite", "postgresql"):
+            return False
+        self.preparar()
+        return True
+
+    # --- Mantenimiento (sin commit: van en la transacción de quien llama) ---
+
+    def indexar(self, db: Session, notas: Iterable[Any]):
+        """(Re)indexa notas (objetos Nota, ya con id: llamar tras flush())."""
+        if not self.disponible:
+            return
+        filas = []
+        for nota in notas:
+            cuerpo = texto_de_html(nota.contenido_html)
+            filas.append({
+                "id": nota.id,
+                "titulo": " ".join(analizar(nota.titulo)),
+                "palabras_clave": " ".join(analizar(nota.palabras_clave)),
+                "cuerpo": " ".join(analizar(cuerpo)),
+                "original": cuerpo or None,
+                "version": str(nota.fecha_actualizacion),
+            })
+        for lote in en_lotes(filas):
+            self._escribir(db, [f["id"] for f in lote], lote)
+
+    def _escribir(self, db: Session, ids, filas: List[Dict[str, Any]]):
+        db.execute(text(f"DELETE FROM {self.tabla} WHERE {self.columna_id} IN :ids").bindparams(_IDS),
+                   {"ids": list(ids)})
+        if not filas:
+            return
+        if self.motor == "sqlite":
+            db.execute(text(
+                "INSERT INTO notas_fts (rowid, titulo, palabras_clave, cuerpo, original, version) "
+                "VALUES (:id, :titulo, :palabras_clave, :cuerpo, :original, :version)"
+            ), filas)
+        else:
+            db.execute(text(
+                "INSERT INTO notas_busqueda (id, documento, original, version) VALUES (:id, "
+                "setweight(to_tsvector('simple', :titulo), 'A') || "
+                "setweight(to_tsvector('simple', :palabras_clave), 'B') || "
+                "setweight(to_tsvector('simple', :cuerpo), 'D'), :original, :version)"
+            ), filas)
+
+    def eliminar(self, db: Session, ids: Iterable[int]):
+        if not self.disponible:
+            return
+        for lote in en_lotes(list(ids)):
+            self._escribir(db, lote, [])
+
+    def reconciliar(self, db: Session) -> Dict[str, int]:
+        """Reindexa las notas nuevas o cambiadas desde que se indexaron y quita las borradas. Hace commit."""
+        if not self.disponible:
+            return {"indexadas": 0, "eliminadas": 0}
+        en_indice = dict(db.execute(text(f"SELECT {self.columna_id}, version FROM {self.tabla}")).all())
+        en_db = {id_nota: str(fecha) for id_nota, fecha in db.query(Nota.id, Nota.fecha_actualizacion)}
+        cambiadas = [i for i, version in en_db.items() if en_indice.get(i) != version]
+        sobran = [i for i in en_indice if i not in en_db]
+        for lote in en_lotes(cambiadas):
+            self.indexar(db, db.query(Nota).filter(Nota.id.in_(lote)))
+            db.commit()
+        self.eliminar(db, sobran)
+        db.commit()
+        if cambiadas or sobran:
+            logger.info(f"Índice de notas: {len(cambiadas)} notas indexadas, {len(sobran)} eliminadas.")
+        return {"indexadas": len(cambiadas), "eliminadas": len(sobran)}
+
+    # --- Consulta ---
+
+    def buscar(self, db: Session, consulta: str, user_id: Optional[str] = None,
+               limite: int = 20) -> List[Dict[str, Any]]:
+        """Notas del usuario (sin usuario: las notas sin dueño) con todos los términos, por relevancia."""
+        terminos = terminos_consulta(consulta)
+        if not terminos:
+            return []
+        if not self.disponible:
+            return self._buscar_like(db, consulta, user_id, limite)
+
+        # Mismo alcance que el listado del cuaderno
+        usuario = "n.user_id = :user_id" if user_id else "n.user_id IS NULL"
+        parametros = {"user_id": user_id, "limite": limite}
+        if self.motor == "sqlite":
+            parametros["q"] = " ".join(f'"{t}"' for t in terminos[:-1]) + f' "{terminos[-1]}"*'
+            pesos = ", ".join(str(p) for p in PESOS_NOTAS.values())
+            sql = (f"SELECT f.rowid AS id, -bm25(notas_fts, {pesos}, 0.0, 0.0) AS puntuacion, f.original "
+                   f"FROM notas_fts f CROSS JOIN notas n ON n.id = f.rowid "
+                   f"WHERE notas_fts MATCH :q AND {usuario} ORDER BY puntuacion DESC LIMIT :limite")
+        else:
+            parametros["q"] = " & ".join(terminos[:-1] + [f"{terminos[-1]}:*"])
+            sql = (f"SELECT b.id, ts_rank(b.documento, q, 1) AS puntuacion, b.original "
+                   f"FROM notas_busqueda b JOIN notas n ON n.id = b.id, to_tsquery('simple', :q) q "
+                   f"WHERE b.documento @@ q AND {usuario} ORDER BY puntuacion DESC LIMIT :limite")
+        coincidencias_notas = db.execute(text(sql), parametros).all()
+
+        notas = {nota.id: nota for nota in db.query(
+            Nota.id, Nota.titulo, Nota.previsualización, Nota.palabras_clave, Nota.es_favorita, Nota.es_sistema,
+            Nota.fecha_creacion, Nota.fecha_actualizacion, Nota.version
+        ).filter(Nota.id.in_([c.id for c in coincidencias_notas]))}
+        resultados = []
+        for c in coincidencias_notas:
+            nota = notas.get(c.id)
+            if nota is None:
+                continue
+            resultados.append({
+                **nota._asdict(),
+                "titulo_resaltado": resaltar(nota.titulo, terminos, prefijo=terminos[-1], ancho=50) or
+                                    html.escape(nota.titulo or ""),
+                "puntuacion": round(float(c.puntuacion), 4),
+                "fragmento": resaltar(c.original, terminos, prefijo=terminos[-1]),
+            })
+        return resultados
+
+    @staticmethod
+    def _buscar_like(db: Session, consulta: str, user_id: Optional[str], limite: int):
+        patron = f"%{consulta.strip()}%"
+        q = db.query(Nota).filter(Nota.user_id == user_id if user_id else Nota.user_id.is_(None)) \
+            .filter(Nota.titulo.ilike(patron) | Nota.contenido_html.ilike(patron))
+        return [{"id": n.id, "titulo": n.titulo, "previsualización": n.previsualización,
+                 "palabras_clave": n.palabras_clave, "es_favorita": n.es_favorita, "es_sistema": n.es_sistema,
+                 "fecha_creacion": n.fecha_creacion, "fecha_actualizacion": n.fecha_actualizacion, "version": n.version, "titulo_resaltado": html.escape(n.titulo or ""),
+                 "puntuacion": 0.0, "fragmento": None}
+                for n in q.order_by(Nota.fecha_actualizacion.desc()).limit(limite)]
+
+indice_busqueda = IndiceBusqueda()
+indice_notas = IndiceNotas()
@@ -0,0 +1,68 @@
+import time
+import threading
+import unicodedata
+from collections import OrderedDict
+from typing import Any, Dict, Hashable, Optional
+
+def normalizar_texto(texto: str) -> str:
+    """Forma canónica para usar un texto como clave de caché.
+
+    Minúsculas, sin tildes, espacios colapsados y sin signos de puntuación en
+    los extremos: "¿Qué es la Gracia? " y "que es la gracia" dan la misma clave.
+    """
+    texto = unicodedata.normalize("NFKD", texto.casefold())
+    texto = "".join(c for c in texto if not unicodedata.combining(c))
+    return " ".join(texto.split()).strip("¿?¡!.,;: ")
+
+class CacheLRU:
+    """LRU en memoria, thread-safe, con expiración (TTL) opcional y contadores de aciertos."""
+
+    def __init__(self, max_entradas: int = 1024, ttl_segundos: Optional[float] = None):
+        self.max_entradas = max_entradas
+        self.ttl_segundos = ttl_segundos
+        self._datos: "OrderedDict[Hashable, tuple]" = OrderedDict()  # clave -> (expira_en, valor)
+        self._lock = threading.Lock()
+        self.aciertos = 0
+        self.fallos = 0
+
+    def obtener(self, clave: Hashable, defecto: Any = None, contar_fallo: bool = True) -> Any:
+        """Valor de la clave o `defecto`. Con contar_fallo=False un fallo no suma al contador
+        (para consultas previas que luego repite quien de verdad resuelve la clave)."""
+        with self._lock:
+            entrada = self._datos.get(clave)
+            if entrada is not None:
+                expira_en, valor = entrada
+                if expira_en is None or expira_en > time.monotonic():
+                    self._datos.move_to_end(clave)
+                    self.aciertos += 1
+                    return valor
+                del self._datos[clave]
+            if contar_fallo:
+                self.fallos += 1
+            return defecto
+
+    def guardar(self, clave: Hashable, valor: Any):
+        expira_en = time.monotonic() + self.ttl_segundos if self.ttl_segundos else None
+        with self._lock:
+            self._datos[clave] = (expira_en, valor)
+            self._datos.move_to_end(clave)
+            while len(self._datos) > self.max_entradas:
+                self._datos.popitem(last=False)
+
+    def invalidar(self, clave: Optional[Hashable] = None):
+        """Borra una clave, o toda la caché si no se indica ninguna."""
+        with self._lock:
+            if clave is None:
+                self._datos.clear()
+            else:
+                self._datos.pop(clave, None)
+
+    def estadisticas(self) -> Dict[str, Any]:
+        with self._lock:
+            total = self.aciertos + self.fallos
+            return {
+                "entradas": len(self._datos),
+                "aciertos": self.aciertos,
+                "fallos": self.fallos,
+                "tasa_aciertos": round(self.aciertos / total, 3) if total else 0.0,
+            }
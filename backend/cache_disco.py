@@ -0,0 +1,186 @@
+import os
+import re
+import asyncio
+import uuid
+import logging
+import threading
+import anyio
+from collections import OrderedDict
+from functools import partial
+from pathlib import Path
+from typing import Any, AsyncIterator, Callable, Dict, Optional
+
+logger = logging.getLogger("ArcaCacheDisco")
+
+DRIVE_CACHE_DIR = os.getenv("DRIVE_CACHE_DIR", "./cache_drive")
+DRIVE_CACHE_MAX_MB = int(os.getenv("DRIVE_CACHE_MAX_MB", "2048"))
+
+# Un archivo que ocupe más de esta fracción de la caché no se guarda (vaciaría el resto)
+FRACCION_MAX_ARCHIVO = 4
+
+_ID_VALIDO = re.compile(r"^[A-Za-z0-9_-]+$")
+
+class CacheDisco:
+    """LRU de archivos descargados, en disco y acotada en bytes.
+
+    La clave es (file_id, md5Checksum): si el archivo cambia en Drive cambia el md5
+    y la copia vieja simplemente deja de usarse hasta que el LRU la desaloja.
+    Las escrituras van a un ".parcial" y se renombran al terminar, así que nunca se
+    sirve un archivo a medias. Todo acceso a disco desde las rutas async va en hilos, y el
+    directorio se crea (y se indexa) la primera vez que se usa, no al importar.
+    """
+
+    def __init__(self, directorio: str = DRIVE_CACHE_DIR, max_bytes: int = DRIVE_CACHE_MAX_MB * 1024 * 1024):
+        self.directorio = Path(directorio)
+        self.max_bytes = max_bytes
+        self._entradas: "OrderedDict[str, int]" = OrderedDict()  # nombre -> bytes, del menos al más reciente
+        self._total = 0
+        self._lock = threading.Lock()
+        self._llenando = set()
+        self._tareas = set()  # referencias a los llenados en segundo plano (evita que el GC los corte)
+        self.aciertos = 0
+        self.fallos = 0
+        self._cargada = False
+        self._lock_carga = threading.Lock()
+
+    def _preparar(self):
+        """Crea el directorio y carga el índice la primera vez (bloqueante: llamar en un hilo)."""
+        if self._cargada:
+            return
+        with self._lock_carga:
+            if not self._cargada:
+                self._cargar()
+                self._cargada = True
+
+    def _cargar(self):
+        """Reconstruye el índice desde disco (orden LRU por mtime) y limpia parciales huérfanos."""
+        self.directorio.mkdir(parents=True, exist_ok=True)
+        archivos = []
+        for ruta in self.directorio.iterdir():
+            if ruta.suffix == ".parcial":
+                ruta.unlink(missing_ok=True)
+            elif ruta.is_file():
+                stat = ruta.stat()
+                archivos.append((stat.st_mtime, ruta.name, stat.st_size))
+        with self._lock:
+            for _, nombre, tamano in sorted(archivos):
+                self._entradas[nombre] = tamano
+                self._total += tamano
+            self._desalojar()
+
+    @staticmethod
+    def nombre(file_id: str, md5: Optional[str]) -> Optional[str]:
+        """Nombre en disco, o None si la combinación no es cacheable."""
+        if not md5 or not _ID_VALIDO.match(file_id) or not _ID_VALIDO.match(md5):
+            return None
+        return f"{file_id}_{md5}"
+
+    def admite(self, tamano: Optional[int]) -> bool:
+        return tamano is not None and 0 < tamano <= self.max_bytes // FRACCION_MAX_ARCHIVO
+
+    async def obtener(self, file_id: str, md5: Optional[str]) -> Optional[Path]:
+        """Ruta local del archivo si está en caché (y lo marca como recién usado)."""
+        return await anyio.to_thread.run_sync(self._obtener, file_id, md5)
+
+    def _obtener(self, file_id: str, md5: Optional[str]) -> Optional[Path]:
+        self._preparar()
+        nombre = self.nombre(file_id, md5)
+        with self._lock:
+            if nombre is None or nombre not in self._entradas:
+                self.fallos += 1
+                return None
+            self._entradas.move_to_end(nombre)
+            self.aciertos += 1
+        ruta = self.directorio / nombre
+        try:
+            # El mtime es el "último uso" con el que se reconstruye el orden al reiniciar
+            os.utime(ruta)
+        except FileNotFoundError:
+            with self._lock:
+                self._total -= self._entradas.pop(nombre, 0)
+            return None
+        return ruta
+
+    def _confirmar(self, nombre: str, temporal: Path):
+        tamano = temporal.stat().st_size
+        os.replace(temporal, self.directorio / nombre)
+        with self._lock:
+            self._total += tamano - self._entradas.pop(nombre, 0)
+            self._entradas[nombre] = tamano
+            self._desalojar()
+
+    def _desalojar(self):
+        while self._total > self.max_bytes and self._entradas:
+            nombre, tamano = self._entradas.popitem(last=False)
+            self._total -= tamano
+            (self.directorio / nombre).unlink(missing_ok=True)
+            logger.info(f"Caché de disco: desalojado {nombre} ({tamano / 1024 / 1024:.1f} MB)")
+
+    async def guardar_mientras_envia(self, file_id: str, md5: str, partes: AsyncIterator[bytes]) -> AsyncIterator[bytes]:
+        """Reenvía las partes y a la vez las escribe en caché.
+
+        Si el cliente corta la descarga antes del final, el parcial se descarta.
+        """
+        nombre = self.nombre(file_id, md5)
+        with self._lock:
+            ocupado = nombre is None or nombre in self._llenando
+            if not ocupado:
+                self._llenando.add(nombre)
+        if ocupado:
+            async for parte in partes:
+                yield parte
+            return
+
+        temporal = self.directorio / f"{nombre}.{uuid.uuid4().hex}.parcial"
+        completo = False
+        try:
+            await anyio.to_thread.run_sync(self._preparar)
+            # Cada write va a un hilo: un PDF de cientos de MB no bloquea el event loop
+            async with await anyio.open_file(temporal, "wb") as f:
+                async for parte in partes:
+                    await f.write(parte)
+                    yield parte
+            completo = True
+        finally:
+            with self._lock:
+                self._llenando.discard(nombre)
+            # Blindado: si el cliente cortó (cancelación), el parcial se borra igualmente
+            with anyio.CancelScope(shield=True):
+                if completo:
+                    await anyio.to_thread.run_sync(self._confirmar, nombre, temporal)
+                else:
+                    await anyio.to_thread.run_sync(partial(temporal.unlink, missing_ok=True))
+
+    async def llenar(self, file_id: str, md5: str, abrir: Callable[[], AsyncIterator[bytes]]):
+        """Descarga completa en segundo plano (p.ej. tras servir un Range sin caché)."""
+        await anyio.to_thread.run_sync(self._preparar)
+        nombre = self.nombre(file_id, md5)
+        with self._lock:
+            if nombre is None or nombre in self._llenando or nombre in self._entradas:
+                return
+        try:
+            async for _ in self.guardar_mientras_envia(file_id, md5, abrir()):
+                pass
+        except Exception as e:
+            logger.warning(f"No se pudo guardar {file_id} en la caché de disco: {e}")
+
+    def programar_llenado(self, file_id: str, md5: str, abrir: Callable[[], AsyncIterator[bytes]]):
+        """Lanza llenar() sin esperar, desde una ruta async."""
+        tarea = asyncio.get_running_loop().create_task(self.llenar(file_id, md5, abrir))
+        self._tareas.add(tarea)
+        tarea.add_done_callback(self._tareas.discard)
+
+    def estadisticas(self) -> Dict[str, Any]:
+        self._preparar()
+        with self._lock:
+            total = self.aciertos + self.fallos
+            return {
+                "archivos": len(self._entradas),
+                "mb_usados": round(self._total / 1024 / 1024, 1),
+                "mb_maximos": round(self.max_bytes / 1024 / 1024, 1),
+                "aciertos": self.aciertos,
+                "fallos": self.fallos,
+                "tasa_aciertos": round(self.aciertos / total, 3) if total else 0.0,
+            }
+
+cache_drive = CacheDisco()
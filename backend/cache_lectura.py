@@ -0,0 +1,89 @@
+"""Caché de lectura para respuestas JSON compartidas (iguales para todos los usuarios).
+
+El catálogo digital y la nota de sistema cambian solo al sincronizar con Drive, al escanear
+la biblioteca local o al editar la nota. Cada respuesta se serializa una vez a bytes con un
+ETag fuerte (sha256 del cuerpo, el mismo en todos los workers) y se sirve tal cual, o como
+304 si el cliente ya la tiene. Quien cambia esos datos invalida su grupo.
+
+Las versiones comprimidas (gzip, brotli) se calculan la primera vez que se piden y se
+guardan en la misma entrada, cada una con su ETag.
+"""
+import os
+import hashlib
+import logging
+import threading
+from dataclasses import dataclass, field
+from typing import Any, Callable, Dict, Hashable, Optional
+from cache import CacheLRU
+from respuestas_json import codificar_json, comprimir
+
+logger = logging.getLogger("ArcaCacheLectura")
+
+CACHE_LECTURA_MAX = int(os.getenv("CACHE_LECTURA_MAX", "256"))
+# Red de seguridad: con varios workers la invalidación solo llega al proceso que hizo el cambio
+CACHE_LECTURA_TTL = float(os.getenv("CACHE_LECTURA_TTL", "300"))
+
+GRUPO_CATALOGO = "catalogo"
+GRUPO_NOTA_SISTEMA = "nota_sistema"
+
+@dataclass(frozen=True)
+class RespuestaCacheada:
+    cuerpo: bytes
+    etag: str
+    cabeceras: Dict[str, str] = field(default_factory=dict)
+    comprimidas: Dict[str, bytes] = field(default_factory=dict, compare=False, repr=False)
+
+    def cuerpo_codificado(self, codificacion: Optional[str]) -> bytes:
+        """Cuerpo en la codificación pedida (None = sin comprimir); se comprime una sola vez."""
+        if not codificacion:
+            return self.cuerpo
+        if codificacion not in self.comprimidas:
+            self.comprimidas[codificacion] = comprimir(self.cuerpo, codificacion, cacheada=True)
+        return self.comprimidas[codificacion]
+
+    def etag_codificado(self, codificacion: Optional[str]) -> str:
+        """ETag fuerte de esa codificación: cada variante tiene bytes distintos."""
+        return f'{self.etag[:-1]}-{codificacion}"' if codificacion else self.etag
+
+def serializar(contenido: Any, cabeceras: Optional[Dict[str, str]] = None) -> RespuestaCacheada:
+    """JSON compacto como el de JSONResponse de FastAPI, con su ETag.
+
+    El ETag cubre también las cabeceras cacheadas (p.ej. X-Total-Count): una página igual con
+    otro total no debe responderse con 304.
+    """
+    cabeceras = cabeceras or {}
+    cuerpo = codificar_json(contenido)
+    huella = hashlib.sha256(cuerpo)
+    for nombre, valor in sorted(cabeceras.items()):
+        huella.update(f"\n{nombre}: {valor}".encode("utf-8"))
+    return RespuestaCacheada(cuerpo, f'"{huella.hexdigest()[:32]}"', cabeceras)
+
+class CacheLectura:
+    def __init__(self, max_entradas: int = CACHE_LECTURA_MAX, ttl_segundos: float = CACHE_LECTURA_TTL):
+        self._entradas = CacheLRU(max_entradas, ttl_segundos=ttl_segundos)
+        # La generación forma parte de la clave: invalidar un grupo es pasar a la siguiente, y
+        # una respuesta calculada antes de invalidar se guarda con la vieja (ya inalcanzable)
+        self._generaciones: Dict[str, int] = {}
+        self._lock = threading.Lock()
+
+    def obtener(self, grupo: str, clave: Hashable, calcular: Callable[[], RespuestaCacheada]) -> RespuestaCacheada:
+        """Respuesta cacheada; si no está, la produce calcular() y se guarda."""
+        with self._lock:
+            clave = (grupo, self._generaciones.get(grupo, 0), clave)
+        entrada = self._entradas.obtener(clave)
+        if entrada is None:
+            entrada = calcular()
+            self._entradas.guardar(clave, entrada)
+        return entrada
+
+    def invalidar(self, grupo: str):
+        with self._lock:
+            self._generaciones[grupo] = self._generaciones.get(grupo, 0) + 1
+        logger.info(f"Caché de lectura '{grupo}' invalidada.")
+
+    def estadisticas(self) -> Dict[str, Any]:
+        with self._lock:
+            generaciones = dict(self._generaciones)
+        return {**self._entradas.estadisticas(), "invalidaciones": generaciones}
+
+cache_lectura = CacheLectura()
@@ -0,0 +1,43 @@
+import os
+import logging
+from functools import partial
+from typing import AsyncIterator, Callable, Dict, Iterator, TypeVar
+import anyio
+
+logger = logging.getLogger("ArcaConcurrencia")
+
+T = TypeVar("T")
+
+# Máximo de llamadas simultáneas a cada servicio externo. Una petición que supera
+# el límite espera su turno en el event loop, sin ocupar un hilo del threadpool.
+LIMITES_UPSTREAM: Dict[str, int] = {
+    "gemini": int(os.getenv("LIMITE_GEMINI", "8")),
+    "vectorial": int(os.getenv("LIMITE_VECTORIAL", "8")),
+    "drive": int(os.getenv("LIMITE_DRIVE", "16")),
+    "isbn": int(os.getenv("LIMITE_ISBN", "32")),
+}
+
+_limitadores: Dict[str, anyio.CapacityLimiter] = {}
+
+def limitador(upstream: str) -> anyio.CapacityLimiter:
+    """Semáforo del servicio externo (se crea al primer uso)."""
+    if upstream not in _limitadores:
+        _limitadores[upstream] = anyio.CapacityLimiter(LIMITES_UPSTREAM[upstream])
+    return _limitadores[upstream]
+
+async def en_hilo(upstream: str, funcion: Callable[..., T], *args, **kwargs) -> T:
+    """Ejecuta una llamada bloqueante (SDK síncrono) en un hilo propio del upstream.
+
+    Los hilos salen del limitador del upstream y no del threadpool por defecto de
+    Starlette: un Gemini lento ya no deja sin hilos a las rutas de la base de datos.
+    """
+    return await anyio.to_thread.run_sync(partial(funcion, *args, **kwargs), limiter=limitador(upstream))
+
+async def iterar_en_hilo(upstream: str, iterador: Iterator[T]) -> AsyncIterator[T]:
+    """Consume un generador síncrono desde el event loop, un next() por hilo."""
+    fin = object()
+    while True:
+        elemento = await en_hilo(upstream, next, iterador, fin)
+        if elemento is fin:
+            break
+        yield elemento
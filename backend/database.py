@@ -1,5 +1,5 @@
 import os
-from sqlalchemy import create_engine
+from sqlalchemy import create_engine, event
 from sqlalchemy.orm import sessionmaker
 from dotenv import load_dotenv
 
@@ -8,24 +8,67 @@ load_dotenv()
 
 # Prioridad: 1. DATABASE_URL (Railway/Vercel) 2. SQLite local para desarrollo si no hay env
 DATABASE_URL = os.getenv("DATABASE_URL")
+# Réplica de solo lectura (opcional): búsquedas del catálogo. Sin ella se lee de la principal
+DATABASE_READ_URL = os.getenv("DATABASE_READ_URL")
 
 # Si no hay URL de Postgres, usamos una local temporal para no romper el desarrollo
 if not DATABASE_URL:
     DATABASE_URL = "sqlite:///./el_arca_local.db"
     print("⚠️ DATABASE_URL no encontrada. Usando SQLite local para desarrollo.")
 
-# Para Postgres en Railway a veces se necesita corregir el prefijo postgresql://
-if DATABASE_URL.startswith("postgres://"):
-    DATABASE_URL = DATABASE_URL.replace("postgres://", "postgresql://", 1)
+# Pool de conexiones: el threadpool de FastAPI y los hilos de en_hilo() piden conexiones a la
+# vez; con el defecto de SQLAlchemy (5 + 10) las ráfagas esperaban en pool_timeout
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "10"))
+DB_MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", "20"))
+DB_POOL_TIMEOUT = float(os.getenv("DB_POOL_TIMEOUT", "30"))
+# Menor que el cierre por inactividad del proveedor (Neon/Render cortan conexiones ociosas)
+DB_POOL_RECYCLE = int(os.getenv("DB_POOL_RECYCLE", "1800"))
+# pre_ping cuesta un SELECT 1 por checkout; sin él, una conexión cortada da un error por petición
+DB_POOL_PRE_PING = os.getenv("DB_POOL_PRE_PING", "true").lower() == "true"
 
-if DATABASE_URL.startswith("sqlite"):
-    engine = create_engine(DATABASE_URL, connect_args={"check_same_thread": False})
-else:
+# SQLite: WAL deja leer mientras el escaneo escribe (con el diario por defecto cada commit
+# bloqueaba a los lectores de /notas) y synchronous=NORMAL solo sincroniza en los checkpoints
+SQLITE_JOURNAL_MODE = os.getenv("SQLITE_JOURNAL_MODE", "WAL")
+SQLITE_SYNCHRONOUS = os.getenv("SQLITE_SYNCHRONOUS", "NORMAL")
+SQLITE_MMAP_MB = int(os.getenv("SQLITE_MMAP_MB", "256"))
+SQLITE_CACHE_MB = int(os.getenv("SQLITE_CACHE_MB", "64"))
+# Un escritor que encuentra otro escritor espera hasta este tiempo antes de "database is locked"
+SQLITE_BUSY_TIMEOUT = float(os.getenv("SQLITE_BUSY_TIMEOUT", "15"))
+
+def _pragmas_sqlite(conexion, _registro):
+    cursor = conexion.cursor()
+    cursor.execute(f"PRAGMA journal_mode={SQLITE_JOURNAL_MODE}")
+    cursor.execute(f"PRAGMA synchronous={SQLITE_SYNCHRONOUS}")
+    cursor.execute(f"PRAGMA mmap_size={SQLITE_MMAP_MB * 1024 * 1024}")
+    # Negativo = KiB (positivo serían páginas)
+    cursor.execute(f"PRAGMA cache_size={-SQLITE_CACHE_MB * 1024}")
+    cursor.close()
+
+def crear_engine(url: str):
+    """Engine con el pool configurado; en SQLite, además, los PRAGMA de cada conexión."""
+    # Para Postgres en Railway a veces se necesita corregir el prefijo postgresql://
+    if url.startswith("postgres://"):
+        url = url.replace("postgres://", "postgresql://", 1)
+    # LIFO: se reutilizan las conexiones recientes y las sobrantes caducan solas
+    pool = {"pool_size": DB_POOL_SIZE, "max_overflow": DB_MAX_OVERFLOW, "pool_timeout": DB_POOL_TIMEOUT,
+            "pool_use_lifo": True}
+    if url.startswith("sqlite"):
+        en_memoria = url in ("sqlite://", "sqlite:///:memory:")
+        motor = create_engine(url, connect_args={"check_same_thread": False, "timeout": SQLITE_BUSY_TIMEOUT},
+                              **({} if en_memoria else pool))
+        event.listen(motor, "connect", _pragmas_sqlite)
+        return motor
     # pool_pre_ping=True es CRÍTICO para Neon/Render (Postgres)
     # Verifica que la conexión siga viva antes de usarla, evitando "SSL connection closed"
-    engine = create_engine(DATABASE_URL, pool_pre_ping=True, pool_recycle=1800)
+    return create_engine(url, pool_pre_ping=DB_POOL_PRE_PING, pool_recycle=DB_POOL_RECYCLE, **pool)
+
+engine = crear_engine(DATABASE_URL)
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
+# Lecturas que toleran unos instantes de retraso de la réplica (nunca leer-lo-que-escribí)
+engine_lectura = crear_engine(DATABASE_READ_URL) if DATABASE_READ_URL else engine
+SessionLectura = sessionmaker(autocommit=False, autoflush=False, bind=engine_lectura)
+
 def obtener_db():
     db = SessionLocal()
     try:
@@ -33,6 +76,54 @@ def obtener_db():
     finally:
         db.close()
 
+def obtener_db_lectura():
+    """Sesión de la réplica (DATABASE_READ_URL) o de la principal si no hay réplica."""
+    db = SessionLectura()
+    try:
+        yield db
+    finally:
+        db.close()
+
+def estado_pools() -> dict:
+    """Conexiones en uso y libres de cada pool (para /sistema/metricas)."""
+    estado = {"escritura": engine.pool.status()}
+    if engine_lectura is not engine:
+        estado["lectura"] = engine_lectura.pool.status()
+    return estado
+
 def inicializar_base_de_datos():
+    """Deja el esquema al día (ver migraciones.py). Con la base ya migrada es una sola consulta.
+
+    Devuelve las claves de configuracion que necesita el arranque (p.ej. la huella de la nota de sistema).
+    """
+    from migraciones import migrar
+    return migrar()
+
+def crear_indices_faltantes():
+    """create_all no añade índices nuevos a tablas que ya existían: se crean aquí.
+
+    Se llama tras las migraciones de columnas; si aun así un índice no se puede
+    crear, se avisa y se sigue con los demás.
+    """
     from models import Base
-    Base.metadata.create_all(bind=engine)
+    for tabla in Base.metadata.sorted_tables:
+        for indice in tabla.indexes:
+            try:
+                indice.create(bind=engine, checkfirst=True)
+            except Exception as e:
+                print(f"⚠️ Índice {indice.name} pendiente: {e}")
+
+def obtener_configuracion(db, clave: str, defecto=None):
+    """Valor guardado en la tabla configuracion (o `defecto` si no existe)."""
+    from models import Configuracion
+    fila = db.query(Configuracion.valor).filter(Configuracion.clave == clave).first()
+    return fila.valor if fila else defecto
+
+def guardar_configuracion(db, clave: str, valor: str, descripcion: str = None):
+    """Crea o actualiza una clave de configuracion. No hace commit."""
+    from models import Configuracion
+    fila = db.query(Configuracion).filter(Configuracion.clave == clave).first()
+    if fila:
+        fila.valor = valor
+    else:
+        db.add(Configuracion(clave=clave, valor=valor, descripcion=descripcion))
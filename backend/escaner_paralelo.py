@@ -0,0 +1,496 @@
+import os
+import time
+import queue
+import logging
+import threading
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, FIRST_COMPLETED, wait
+from pathlib import Path
+from sqlalchemy.orm import Session
+from models import LibroDigital, ManifiestoEscaneo
+from procesador_archivos import ProcesadorArchivos, EXTENSIONES_SOPORTADAS
+from busqueda import indice_busqueda
+
+logger = logging.getLogger("ArcaEscaner")
+
+# Configuración del pipeline (sobrescribible por entorno)
+NUM_PROCESOS = int(os.getenv("SCAN_WORKERS", "0")) or os.cpu_count() or 1
+TAMANO_COLA = int(os.getenv("SCAN_QUEUE_SIZE", "256"))
+TAMANO_LOTE = int(os.getenv("SCAN_BATCH_SIZE", "50"))
+
+TAMANO_COLA_FRAGMENTOS = int(os.getenv("SCAN_CHUNK_QUEUE_SIZE", "512"))
+
+# Formatos que se fragmentan completos para RAG
+EXTENSIONES_FRAGMENTABLES = {".pdf", ".docx", ".epub", ".pptx", ".txt"}
+
+# Marca de fin para el hilo escritor
+_FIN = object()
+
+# Estado de cada proceso worker, inyectado una sola vez por el initializer
+_hashes_conocidos = frozenset()
+_cola_fragmentos = None
+_sin_fragmentar = {}
+
+def _inicializar_worker(hashes: frozenset, cola_fragmentos=None, sin_fragmentar: dict = None):
+    global _hashes_conocidos, _cola_fragmentos, _sin_fragmentar
+    _hashes_conocidos = hashes
+    _cola_fragmentos = cola_fragmentos
+    _sin_fragmentar = sin_fragmentar or {}
+
+class _SumideroCola:
+    """Sumidero de ingesta que reenvía fragmentos al proceso principal."""
+
+    def __init__(self, cola):
+        self.cola = cola
+
+    def agregar(self, id_libro: str, texto: str, metadatos: dict):
+        # La cola es acotada: si el buffer de Chroma va atrasado, el worker espera
+        self.cola.put({"id_libro": id_libro, "texto": texto, "metadatos": metadatos})
+
+def descubrir_archivos(directorio: str) -> list:
+    """Recorre un subárbol con os.scandir y devuelve (ruta, tamaño, mtime_ns, inodo) de los compatibles.
+
+    Solo hace stat: ningún archivo se abre en esta fase.
+    """
+    encontrados = []
+    pendientes = [directorio]
+    while pendientes:
+        actual = pendientes.pop()
+        try:
+            with os.scandir(actual) as entradas:
+                for entrada in entradas:
+                    if entrada.is_dir(follow_symlinks=False):
+                        pendientes.append(entrada.path)
+                    elif entrada.is_file() and os.path.splitext(entrada.name)[1].lower() in EXTENSIONES_SOPORTADAS:
+                        st = entrada.stat()
+                        encontrados.append((entrada.path, st.st_size, st.st_mtime_ns, st.st_ino))
+        except OSError as e:
+            logger.warning(f"No se pudo recorrer {actual}: {e}")
+    return encontrados
+
+def procesar_archivo(entrada: tuple, ruta_raiz: str, hash_en_ruta: str = None) -> dict:
+    """Hash + extracción de texto de un archivo. Se ejecuta en un proceso worker.
+
+    hash_en_ruta: hash del libro que ya hay en DB para esta ruta (None si no hay ninguno).
+    """
+    ruta, tamano, mtime_ns, inodo = entrada
+    archivo = Path(ruta)
+    resultado = {
+        "ruta": str(archivo.relative_to(ruta_raiz)),
+        "nombre_archivo": archivo.name,
+        "tamano_bytes": tamano,
+        "mtime_ns": mtime_ns,
+        "inodo": inodo,
+        "hash_md5": None,
+        "texto": "",
+        "conocido": False,
+        "fragmentos": 0,
+        "fragmentado": False,
+        "error": None,
+    }
+    try:
+        resultado["hash_md5"] = ProcesadorArchivos.calcular_md5(archivo)
+        # Si ya está en DB no gastamos CPU extrayendo texto, salvo que la ruta tenga un libro
+        # con otro contenido: ese libro se actualiza y necesita el texto nuevo
+        resultado["conocido"] = resultado["hash_md5"] in _hashes_conocidos and \
+            hash_en_ruta in (None, resultado["hash_md5"])
+        if not resultado["conocido"]:
+            resultado["texto"] = ProcesadorArchivos.extraer_texto(archivo)
+    except Exception as e:
+        resultado["error"] = str(e)
+        return resultado
+
+    # Libro completo para RAG: los fragmentos salen en streaming, nunca el libro entero en RAM
+    if _cola_fragmentos is None:
+        return resultado
+    hash_val = resultado["hash_md5"]
+    if archivo.suffix.lower() not in EXTENSIONES_FRAGMENTABLES or \
+            (hash_val in _hashes_conocidos and hash_val not in _sin_fragmentar):
+        # Nada que fragmentar, o ese contenido ya tiene sus fragmentos
+        resultado["fragmentado"] = True
+        return resultado
+    metadatos = {
+        "titulo": archivo.stem,
+        "autor": "Desconocido",
+        # Contenido ya en DB (sin texto extraído): la categoría que tiene guardada
+        "categoria": _sin_fragmentar.get(hash_val) or ProcesadorArchivos.clasificar(resultado["texto"]),
+        "formato": archivo.suffix.lower().replace(".", ""),
+    }
+    try:
+        resultado["fragmentos"] = ProcesadorArchivos.ingerir_documento(
+            archivo, hash_val, metadatos, _SumideroCola(_cola_fragmentos)
+        )
+        # Solo entregados al buffer: el libro se marca cuando Chroma confirma los lotes
+        resultado["fragmentado"] = True
+    except Exception as e:
+        logger.error(f"Error fragmentando {archivo}: {e}")
+    return resultado
+
+class EscritorLotes(threading.Thread):
+    """Único consumidor de la cola: actualiza el manifiesto e inserta en DB por lotes."""
+
+    def __init__(self, db: Session, cola: queue.Queue, hashes_existentes: set, manifiesto: dict,
+                 libros_por_ruta: dict, tamano_lote: int = TAMANO_LOTE):
+        super().__init__(name="arca-escritor", daemon=True)
+        self.db = db
+        self.cola = cola
+        self.hashes_existentes = hashes_existentes
+        self.manifiesto = manifiesto
+        self.libros_por_ruta = libros_por_ruta
+        self.tamano_lote = tamano_lote
+        self.nuevos = 0
+        self.actualizados = 0
+        self.errores = 0
+        # (ruta, hash) de archivos cuyo contenido ya estaba en DB: candidatos a "movidos"
+        self.conocidos = []
+        # Hashes anteriores de archivos cuyo contenido cambió: sus vectores quedan obsoletos
+        self.hashes_reemplazados = []
+
+    def run(self):
+        lote = []
+        while True:
+            resultado = self.cola.get()
+            if resultado is _FIN:
+                break
+            lote.append(resultado)
+            if len(lote) >= self.tamano_lote:
+                self._guardar(lote)
+                lote = []
+        if lote:
+            self._guardar(lote)
+
+    def _guardar(self, lote: list):
+        inserciones_manifiesto, cambios_manifiesto = [], []
+        nuevos, modificados = [], []
+        for r in lote:
+            fila = {
+                "ruta": r["ruta"],
+                "tamano_bytes": r["tamano_bytes"],
+                "mtime_ns": r["mtime_ns"],
+                "inodo": r["inodo"],
+                "hash_md5": r["hash_md5"],
+            }
+            previo = self.manifiesto.get(r["ruta"])
+            if previo:
+                fila["id"] = previo[0]
+                cambios_manifiesto.append(fila)
+                if previo[4] and previo[4] != r["hash_md5"]:
+                    self.hashes_reemplazados.append(previo[4])
+            else:
+                inserciones_manifiesto.append(fila)
+
+            hash_val = r["hash_md5"]
+            if r["ruta"] in self.libros_por_ruta and not r["conocido"]:
+                # Contenido nuevo en la ruta de un libro existente: se actualiza esa fila,
+                # aunque el hash nuevo ya esté en DB (p.ej. se copió encima otro libro)
+                self.hashes_existentes.add(hash_val)
+                modificados.append(r)
+                continue
+            if r["conocido"] or hash_val in self.hashes_existentes:
+                # Contenido ya indexado (o duplicado dentro de la misma pasada)
+                self.conocidos.append((r["ruta"], hash_val))
+                continue
+            self.hashes_existentes.add(hash_val)
+            nuevos.append(r)
+
+        libros = [
+            LibroDigital(
+                ruta=r["ruta"],
+                nombre_archivo=r["nombre_archivo"],
+                titulo=Path(r["nombre_archivo"]).stem,
+                formato=Path(r["nombre_archivo"]).suffix.lower().replace(".", ""),
+                tamano_bytes=r["tamano_bytes"],
+                categoria=ProcesadorArchivos.clasificar(r["texto"]),
+                hash_md5=r["hash_md5"],
+                descripcion=r["texto"][:500]
+            )
+            for r in nuevos
+        ]
+        try:
+            self.db.bulk_insert_mappings(ManifiestoEscaneo, inserciones_manifiesto)
+            self.db.bulk_update_mappings(ManifiestoEscaneo, cambios_manifiesto)
+            # Mismo archivo, contenido distinto: se actualiza la fila existente (conserva su ID)
+            self.db.bulk_update_mappings(LibroDigital, [
+                {
+                    "id": self.libros_por_ruta[r["ruta"]],
+                    "tamano_bytes": r["tamano_bytes"],
+                    "hash_md5": r["hash_md5"],
+                    "descripcion": r["texto"][:500],
+                    "fragmentado": False,
+                }
+                for r in modificados
+            ])
+            self.db.add_all(libros)
+            self.db.flush()
+            # Índice de texto completo con el texto extraído (en la misma transacción)
+            textos = {libro.id: r["texto"] for libro, r in zip(libros, nuevos)}
+            textos.update({self.libros_por_ruta[r["ruta"]]: r["texto"] for r in modificados})
+            indice_busqueda.indexar(self.db, list(textos), textos)
+            self.db.commit()
+        except Exception as e:
+            logger.error(f"Error guardando lote de {len(lote)} archivos: {e}")
+            self.db.rollback()
+            self.errores += len(nuevos) + len(modificados)
+            return
+
+        self.nuevos += len(nuevos)
+        self.actualizados += len(modificados)
+        if nuevos or modificados:
+            logger.info(f"Lote guardado: {len(nuevos)} nuevos, {len(modificados)} actualizados ({self.nuevos} nuevos en total)")
+
+class EscanerParalelo:
+    @staticmethod
+    def escanear(db: Session, ruta_raiz: str, servicio_vectorial=None, num_procesos: int = NUM_PROCESOS) -> dict:
+        """Escaneo incremental de la biblioteca local.
+
+        1. Descubrimiento (solo stat) repartido por subárbol en el pool de procesos.
+        2. Comparación con el manifiesto: solo se hashean archivos cuya firma stat cambió.
+        3. Hash + extracción en el pool; un solo hilo escribe en DB por lotes y los
+           workers envían el libro completo fragmentado al buffer de Chroma.
+        4. Conciliación de archivos movidos y eliminados con LibroDigital.
+        5. Con servicio_vectorial, los libros cuyos fragmentos confirmó Chroma se marcan
+           como fragmentados. Los que aún no lo están (fragmentación fallida, lotes
+           descartados, o indexados antes de existir la marca) se vuelven a fragmentar
+           en el siguiente escaneo aunque el archivo no haya cambiado.
+        """
+        inicio = time.perf_counter()
+        raiz = os.path.abspath(ruta_raiz)
+        if not os.path.isdir(raiz):
+            logger.error(f"Ruta de biblioteca no encontrada: {raiz}")
+            return {}
+
+        hashes = frozenset(h for (h,) in db.query(LibroDigital.hash_md5).all() if h)
+        manifiesto = {
+            m.ruta: (m.id, m.tamano_bytes, m.mtime_ns, m.inodo, m.hash_md5)
+            for m in db.query(ManifiestoEscaneo.id, ManifiestoEscaneo.ruta, ManifiestoEscaneo.tamano_bytes,
+                              ManifiestoEscaneo.mtime_ns, ManifiestoEscaneo.inodo, ManifiestoEscaneo.hash_md5)
+        }
+        libros_por_ruta, hashes_por_ruta = {}, {}
+        for id_libro, ruta, hash_md5 in db.query(LibroDigital.id, LibroDigital.ruta, LibroDigital.hash_md5) \
+                .filter(LibroDigital.categoria != "Nube (Drive)"):
+            libros_por_ruta[ruta] = id_libro
+            hashes_por_ruta[ruta] = hash_md5
+        # Contenido en DB cuyo libro completo aún no está en Chroma: hash -> categoría
+        sin_fragmentar = {}
+        if servicio_vectorial:
+            sin_fragmentar = {
+                h: categoria
+                for h, categoria in db.query(LibroDigital.hash_md5, LibroDigital.categoria)
+                .filter(LibroDigital.hash_md5 != None, LibroDigital.fragmentado.isnot(True))
+            }
+
+        estadisticas = {"archivos": 0, "sin_cambios": 0, "hasheados": 0, "bytes": 0, "fragmentos": 0,
+                        "ya_indexados": 0, "refragmentados": 0, "movidos": 0, "eliminados": 0, "errores": 0}
+        cola = queue.Queue(maxsize=TAMANO_COLA)
+        escritor = EscritorLotes(db, cola, set(hashes), manifiesto, libros_por_ruta)
+        movidos = []  # (ruta_vieja, ruta_nueva)
+        solo_fragmentar = set()  # Rutas sin cambios que solo se releen para fragmentarlas
+        fragmentados = set()  # Hashes cuyos fragmentos entraron completos al buffer
+        en_vuelo = set()
+        # Ventana de tareas pendientes: evita cargar en memoria miles de futuros
+        limite_en_vuelo = num_procesos * 4
+
+        def drenar():
+            completados, _ = wait(en_vuelo, return_when=FIRST_COMPLETED)
+            for futuro in completados:
+                en_vuelo.discard(futuro)
+                resultado = futuro.result()
+                if resultado["error"]:
+                    estadisticas["errores"] += 1
+                    logger.error(f"Error procesando {resultado['ruta']}: {resultado['error']}")
+                    continue
+                if resultado["fragmentado"]:
+                    fragmentados.add(resultado["hash_md5"])
+                if resultado["ruta"] in solo_fragmentar:
+                    # El manifiesto y la fila ya están al día: no pasa por el escritor
+                    estadisticas["refragmentados"] += 1
+                    continue
+                estadisticas["hasheados"] += 1
+                estadisticas["bytes"] += resultado["tamano_bytes"]
+                if resultado["conocido"]:
+                    estadisticas["ya_indexados"] += 1
+                # Bloquea si el escritor va atrasado (contrapresión)
+                cola.put(resultado)
+
+        # "spawn": la API corre hilos (uvicorn, escritor) y fork con hilos no es seguro
+        contexto = multiprocessing.get_context("spawn")
+
+        # Los workers fragmentan el libro completo y lo envían por una cola acotada;
+        # un hilo la vacía en el buffer de Chroma, que sube los lotes en segundo plano
+        buffer_vectorial, cola_fragmentos, hilo_fragmentos = None, None, None
+        if servicio_vectorial:
+            buffer_vectorial = servicio_vectorial.buffer_ingesta()
+            cola_fragmentos = contexto.Queue(maxsize=TAMANO_COLA_FRAGMENTOS)
+            hilo_fragmentos = threading.Thread(
+                target=EscanerParalelo._consumir_fragmentos, args=(cola_fragmentos, buffer_vectorial, estadisticas),
+                name="arca-fragmentos", daemon=True
+            )
+            hilo_fragmentos.start()
+
+        try:
+            with ProcessPoolExecutor(max_workers=num_procesos, mp_context=contexto,
+                                     initializer=_inicializar_worker,
+                                     initargs=(hashes, cola_fragmentos, sin_fragmentar)) as pool:
+                # 1. Descubrimiento paralelo: un subárbol de primer nivel por tarea
+                subdirectorios, descubiertos = [], []
+                with os.scandir(raiz) as entradas:
+                    for entrada in entradas:
+                        if entrada.is_dir(follow_symlinks=False):
+                            subdirectorios.append(entrada.path)
+                        elif entrada.is_file() and os.path.splitext(entrada.name)[1].lower() in EXTENSIONES_SOPORTADAS:
+                            st = entrada.stat()
+                            descubiertos.append((entrada.path, st.st_size, st.st_mtime_ns, st.st_ino))
+                for parcial in pool.map(descubrir_archivos, subdirectorios):
+                    descubiertos.extend(parcial)
+                estadisticas["archivos"] = len(descubiertos)
+
+                # 2. Diferencias contra el manifiesto
+                por_ruta = {os.path.relpath(d[0], raiz): d for d in descubiertos}
+                desaparecidos = {ruta: datos for ruta, datos in manifiesto.items() if ruta not in por_ruta}
+                # Un rename dentro del mismo disco conserva inodo, tamaño y mtime
+                firmas_desaparecidas = {(d[3], d[1], d[2]): ruta for ruta, d in desaparecidos.items()}
+                pendientes = []
+                for ruta, (ruta_abs, tamano, mtime_ns, inodo) in por_ruta.items():
+                    previo = manifiesto.get(ruta)
+                    if previo and previo[1:4] == (tamano, mtime_ns, inodo):
+                        estadisticas["sin_cambios"] += 1
+                        if previo[4] in sin_fragmentar:
+                            solo_fragmentar.add(ruta)
+                            pendientes.append((ruta_abs, tamano, mtime_ns, inodo))
+                        continue
+                    ruta_vieja = None if previo else firmas_desaparecidas.pop((inodo, tamano, mtime_ns), None)
+                    if ruta_vieja:
+                        movidos.append((ruta_vieja, ruta))
+                        continue
+                    pendientes.append((ruta_abs, tamano, mtime_ns, inodo))
+
+                # 3. Hash + extracción solo de lo que cambió
+                escritor.start()
+                try:
+                    for entrada in pendientes:
+                        while len(en_vuelo) >= limite_en_vuelo:
+                            drenar()
+                        en_vuelo.add(pool.submit(procesar_archivo, entrada, raiz,
+                                                 hashes_por_ruta.get(os.path.relpath(entrada[0], raiz))))
+                    while en_vuelo:
+                        drenar()
+                finally:
+                    cola.put(_FIN)
+                    escritor.join()
+        finally:
+            # Tras cerrar el pool: los workers ya volcaron todos sus fragmentos a la cola
+            if cola_fragmentos is not None:
+                cola_fragmentos.put(None)
+                hilo_fragmentos.join()
+                buffer_vectorial.close()
+
+        if buffer_vectorial:
+            # Tras close(): solo cuenta lo que Chroma confirmó
+            completos = fragmentados - buffer_vectorial.libros_fallidos
+            try:
+                EscanerParalelo._marcar_fragmentados(db, completos)
+            except Exception as e:
+                logger.error(f"Error marcando libros fragmentados: {e}")
+                db.rollback()
+
+        # 4. Conciliación: movidos detectados por hash (p.ej. copiados entre discos)
+        rutas_movidas = {vieja for vieja, _ in movidos}
+        desaparecidos_por_hash = {d[4]: ruta for ruta, d in desaparecidos.items() if ruta not in rutas_movidas}
+        movidos_por_hash = []
+        for ruta_nueva, hash_val in escritor.conocidos:
+            ruta_vieja = desaparecidos_por_hash.pop(hash_val, None)
+            if ruta_vieja:
+                movidos_por_hash.append((ruta_vieja, ruta_nueva))
+                rutas_movidas.add(ruta_vieja)
+        eliminados = [ruta for ruta in desaparecidos if ruta not in rutas_movidas]
+
+        try:
+            EscanerParalelo._conciliar(db, raiz, movidos, movidos_por_hash, eliminados, manifiesto, por_ruta)
+            estadisticas["movidos"] = len(movidos) + len(movidos_por_hash)
+            estadisticas["eliminados"] = len(eliminados)
+        except Exception as e:
+            logger.error(f"Error conciliando archivos movidos/eliminados: {e}")
+            db.rollback()
+
+        if servicio_vectorial:
+            obsoletos = set(escritor.hashes_reemplazados) | {manifiesto[ruta][4] for ruta in eliminados}
+            EscanerParalelo._purgar_vectores(db, servicio_vectorial, obsoletos)
+
+        segundos = max(time.perf_counter() - inicio, 1e-9)
+        estadisticas["nuevos"] = escritor.nuevos
+        estadisticas["actualizados"] = escritor.actualizados
+        estadisticas["errores"] += escritor.errores
+        if buffer_vectorial:
+            estadisticas["vectorial"] = buffer_vectorial.estadisticas()
+        estadisticas["segundos"] = round(segundos, 2)
+        estadisticas["archivos_por_segundo"] = round(estadisticas["archivos"] / segundos, 1)
+        estadisticas["mb_por_segundo"] = round(estadisticas["bytes"] / (1024 * 1024) / segundos, 1)
+        logger.info(
+            f"📊 Escaneo terminado: {estadisticas['archivos']} archivos ({estadisticas['sin_cambios']} sin cambios, "
+            f"{estadisticas['nuevos']} nuevos, {estadisticas['fragmentos']} fragmentos, {estadisticas['refragmentados']} refragmentados, {estadisticas['movidos']} movidos, {estadisticas['eliminados']} eliminados, "
+            f"{estadisticas['errores']} errores) en {estadisticas['segundos']} s — "
+            f"{estadisticas['archivos_por_segundo']} archivos/s, {estadisticas['mb_por_segundo']} MB/s"
+        )
+        return estadisticas
+
+    @staticmethod
+    def _consumir_fragmentos(cola_fragmentos, buffer_vectorial, estadisticas: dict):
+        """Vacía la cola de fragmentos de los workers en el buffer de ingesta."""
+        while True:
+            fragmento = cola_fragmentos.get()
+            if fragmento is None:
+                return
+            try:
+                buffer_vectorial.agregar(**fragmento)
+                estadisticas["fragmentos"] += 1
+            except Exception as e:
+                buffer_vectorial.libros_fallidos.add(fragmento["id_libro"])
+                logger.error(f"Error encolando fragmento para Chroma: {e}")
+
+    @staticmethod
+    def _marcar_fragmentados(db: Session, hashes: set, tamano_lote: int = 500):
+        """Marca como fragmentados los libros con esos hashes (los vectores van por hash)."""
+        hashes = list(hashes)
+        for i in range(0, len(hashes), tamano_lote):
+            db.query(LibroDigital).filter(LibroDigital.hash_md5.in_(hashes[i:i + tamano_lote])) \
+                .update({"fragmentado": True}, synchronize_session=False)
+        db.commit()
+
+    @staticmethod
+    def _purgar_vectores(db: Session, servicio_vectorial, hashes: set):
+        """Borra de Chroma los libros cuyo contenido ya no existe en ninguna ruta local."""
+        hashes.discard(None)
+        if not hashes:
+            return
+        vigentes = {h for (h,) in db.query(ManifiestoEscaneo.hash_md5).filter(ManifiestoEscaneo.hash_md5.in_(hashes))}
+        for hash_val in hashes - vigentes:
+            try:
+                servicio_vectorial.eliminar_libro(hash_val)
+            except Exception as e:
+                logger.error(f"Error borrando vectores obsoletos de {hash_val}: {e}")
+
+    @staticmethod
+    def _conciliar(db: Session, raiz: str, movidos: list, movidos_por_hash: list, eliminados: list,
+                   manifiesto: dict, por_ruta: dict):
+        """Aplica en DB los movimientos y eliminaciones detectados en la pasada."""
+        for ruta_vieja, ruta_nueva in movidos + movidos_por_hash:
+            db.query(LibroDigital).filter(LibroDigital.ruta == ruta_vieja).update(
+                {"ruta": ruta_nueva, "nombre_archivo": os.path.basename(ruta_nueva)},
+                synchronize_session=False
+            )
+
+        # Movidos por rename: el manifiesto conserva el hash, solo cambia la ruta
+        db.bulk_update_mappings(ManifiestoEscaneo, [
+            {"id": manifiesto[vieja][0], "ruta": nueva, "mtime_ns": por_ruta[nueva][2]}
+            for vieja, nueva in movidos
+        ])
+        # Movidos por hash: el escritor ya registró la ruta nueva en el manifiesto
+        rutas_a_olvidar = [vieja for vieja, _ in movidos_por_hash] + eliminados
+        if rutas_a_olvidar:
+            db.query(ManifiestoEscaneo).filter(ManifiestoEscaneo.ruta.in_(rutas_a_olvidar)).delete(synchronize_session=False)
+        if eliminados:
+            db.query(LibroDigital).filter(
+                LibroDigital.ruta.in_(eliminados),
+                LibroDigital.categoria != "Nube (Drive)"
+            ).delete(synchronize_session=False)
+        db.commit()
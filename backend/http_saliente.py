@@ -0,0 +1,140 @@
+import os
+import random
+import asyncio
+import logging
+import threading
+from dataclasses import dataclass
+from typing import Dict, Optional
+from urllib.parse import urlsplit
+import httpx
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+logger = logging.getLogger("ArcaHTTP")
+# httpx registra cada petición en INFO: demasiado ruido (y CPU) con la concurrencia alta
+logging.getLogger("httpx").setLevel(logging.WARNING)
+
+# HTTP/2 es opcional: necesita el paquete h2 (httpx[http2])
+try:
+    import h2  # noqa: F401
+    HTTP2_DISPONIBLE = True
+except ImportError:
+    HTTP2_DISPONIBLE = False
+
+TIMEOUT_HTTP = float(os.getenv("HTTP_TIMEOUT", "10"))
+# Conexiones ociosas que se mantienen abiertas (el defecto de httpx, 5 s, las cierra entre clics)
+KEEPALIVE_SEGUNDOS = float(os.getenv("HTTP_KEEPALIVE", "90"))
+CONEXIONES_POR_HOST = int(os.getenv("HTTP_POOL_SIZE", "32"))
+
+# Códigos que merece la pena reintentar (sobrecarga o fallo transitorio del servidor)
+ESTADOS_REINTENTABLES = {429, 500, 502, 503, 504}
+
+@dataclass(frozen=True)
+class ConfigHost:
+    timeout: httpx.Timeout
+    reintentos: int = 2
+
+CONFIG_POR_DEFECTO = ConfigHost(httpx.Timeout(TIMEOUT_HTTP))
+
+# Descargas de Drive: conexión rápida o nada, pero el cuerpo puede tardar en llegar
+CONFIG_HOSTS: Dict[str, ConfigHost] = {
+    "www.googleapis.com": ConfigHost(httpx.Timeout(TIMEOUT_HTTP, connect=5, read=60), reintentos=2),
+    "oauth2.googleapis.com": ConfigHost(httpx.Timeout(TIMEOUT_HTTP, connect=5), reintentos=3),
+    "openlibrary.org": ConfigHost(httpx.Timeout(5, connect=3), reintentos=1),
+}
+
+def config_host(url: str) -> ConfigHost:
+    return CONFIG_HOSTS.get(urlsplit(str(url)).hostname, CONFIG_POR_DEFECTO)
+
+def timeout_requests(url: str):
+    """El timeout del host en el formato (conexión, lectura) de requests."""
+    timeout = config_host(url).timeout
+    return timeout.connect, timeout.read
+
+def espera_reintento(intento: int) -> float:
+    """Backoff exponencial con jitter (0.2 s, 0.4 s, 0.8 s... ±50 %)."""
+    return 0.2 * (2 ** intento) * random.uniform(0.5, 1.5)
+
+# --- Cliente asíncrono ---
+
+_cliente_http: Optional[httpx.AsyncClient] = None
+
+def cliente_http() -> httpx.AsyncClient:
+    """Cliente asíncrono compartido: un pool keep-alive por host y HTTP/2 si está disponible."""
+    global _cliente_http
+    if _cliente_http is None or _cliente_http.is_closed:
+        _cliente_http = httpx.AsyncClient(
+            http2=HTTP2_DISPONIBLE,
+            timeout=CONFIG_POR_DEFECTO.timeout,
+            follow_redirects=True,
+            # Sin tope global: la concurrencia ya la acotan los limitadores de concurrencia.py
+            limits=httpx.Limits(max_connections=None, max_keepalive_connections=CONEXIONES_POR_HOST,
+                                keepalive_expiry=KEEPALIVE_SEGUNDOS)
+        )
+    return _cliente_http
+
+async def cerrar_cliente_http():
+    global _cliente_http
+    if _cliente_http is not None:
+        await _cliente_http.aclose()
+        _cliente_http = None
+
+async def peticion(metodo: str, url: str, stream: bool = False, **opciones) -> httpx.Response:
+    """Petición con el timeout y los reintentos del host de destino.
+
+    Solo reintenta métodos idempotentes (GET/HEAD). Con stream=True devuelve la
+    respuesta sin leer el cuerpo: quien llama debe cerrarla (aclose).
+    """
+    config = config_host(url)
+    opciones.setdefault("timeout", config.timeout)
+    cliente = cliente_http()
+    reintentos = config.reintentos if metodo.upper() in ("GET", "HEAD") else 0
+
+    for intento in range(reintentos + 1):
+        ultimo = intento == reintentos
+        try:
+            respuesta = await cliente.send(cliente.build_request(metodo, url, **opciones), stream=stream)
+        except httpx.TransportError as e:
+            if ultimo:
+                raise
+            logger.warning(f"{metodo} {urlsplit(url).hostname} falló ({e!r}), reintentando...")
+        else:
+            if respuesta.status_code not in ESTADOS_REINTENTABLES or ultimo:
+                return respuesta
+            await respuesta.aclose()
+            logger.warning(f"{metodo} {urlsplit(url).hostname} respondió {respuesta.status_code}, reintentando...")
+        await asyncio.sleep(espera_reintento(intento))
+
+# --- Sesión síncrona (código que aún usa requests: scripts, escaneos en segundo plano) ---
+
+_sesion_http: Optional[requests.Session] = None
+_lock_sesion = threading.Lock()
+
+class _AdaptadorHost(HTTPAdapter):
+    """Aplica el timeout del host de destino cuando quien llama no pasa uno (requests no tiene por defecto)."""
+
+    def send(self, request, timeout=None, **opciones):
+        if timeout is None:
+            timeout = timeout_requests(request.url)
+        return super().send(request, timeout=timeout, **opciones)
+
+def _adaptador(config: ConfigHost) -> HTTPAdapter:
+    reintentos = Retry(total=config.reintentos, backoff_factor=0.2, status_forcelist=sorted(ESTADOS_REINTENTABLES),
+                       allowed_methods={"GET", "HEAD"})
+    return _AdaptadorHost(pool_connections=8, pool_maxsize=CONEXIONES_POR_HOST, max_retries=reintentos)
+
+def sesion_http() -> requests.Session:
+    """requests.Session compartida con pool keep-alive y el timeout/reintentos de CONFIG_HOSTS."""
+    global _sesion_http
+    with _lock_sesion:
+        if _sesion_http is None:
+            sesion = requests.Session()
+            adaptador = _adaptador(CONFIG_POR_DEFECTO)
+            sesion.mount("https://", adaptador)
+            sesion.mount("http://", adaptador)
+            # requests elige el prefijo montado más largo: cada host configurado con sus reintentos
+            for host, config in CONFIG_HOSTS.items():
+                sesion.mount(f"https://{host}", _adaptador(config))
+            _sesion_http = sesion
+        return _sesion_http
@@ -0,0 +1,302 @@
+import os
+import json
+import sqlite3
+import logging
+import threading
+import numpy as np
+from typing import List, Dict, Any, Optional, Tuple
+from servicio_vectorial import BackendVectorial
+
+logger = logging.getLogger("ArcaIndiceLocal")
+
+# Sondas IVF por consulta: más sondas = mejor recall, más latencia
+NPROBE = int(os.getenv("VECTOR_LOCAL_NPROBE", "8"))
+# Por debajo de este tamaño la búsqueda exacta es igual de rápida y no se entrena IVF
+MIN_ENTRENAMIENTO = int(os.getenv("VECTOR_LOCAL_MIN_TRAIN", "2048"))
+CAPACIDAD_INICIAL = 1024
+
+class IndiceLocal(BackendVectorial):
+    """Índice ANN embebido: IVF plano sobre NumPy, persistido en disco.
+
+    - vectores.f32: matriz float32 (capacidad x dimensión) abierta con memmap,
+      así que el índice no tiene que caber en RAM para abrirse.
+    - centroides.npy: centroides de k-means esférico que reparten las filas en
+      listas invertidas; la consulta solo recorre las NPROBE listas más cercanas.
+    - registros.db: SQLite con id, libro, documento y metadatos de cada fila.
+
+    Los vectores se guardan normalizados (similitud coseno = producto punto) y
+    las distancias se devuelven como 1 - coseno, igual que Chroma con "cosine".
+    Borrar o reemplazar marca la fila como inactiva; el hueco no se reutiliza.
+    """
+
+    def __init__(self, ruta: str, funcion_embedding=None, nprobe: int = NPROBE):
+        self.ruta = ruta
+        self.nprobe = nprobe
+        self._funcion_embedding = funcion_embedding
+        self._lock = threading.RLock()
+        os.makedirs(ruta, exist_ok=True)
+
+        self._db = sqlite3.connect(os.path.join(ruta, "registros.db"), check_same_thread=False)
+        self._db.execute("""
+            CREATE TABLE IF NOT EXISTS fragmentos (
+                fila INTEGER PRIMARY KEY,
+                id TEXT NOT NULL,
+                id_libro TEXT,
+                documento TEXT,
+                metadatos TEXT,
+                lista INTEGER DEFAULT -1,
+                activo INTEGER DEFAULT 1
+            )
+        """)
+        self._db.execute("CREATE INDEX IF NOT EXISTS ix_fragmentos_id ON fragmentos (id)")
+        self._db.execute("CREATE INDEX IF NOT EXISTS ix_fragmentos_libro ON fragmentos (id_libro)")
+        self._db.commit()
+
+        config = self._leer_config()
+        self.dimension: Optional[int] = config.get("dimension")
+        self.capacidad: int = config.get("capacidad", 0)
+        self.filas: int = config.get("filas", 0)
+        self.vivos_al_entrenar: int = config.get("vivos_al_entrenar", 0)
+        self.vectores: Optional[np.memmap] = None
+        if self.dimension:
+            self.vectores = np.memmap(self._ruta("vectores.f32"), dtype=np.float32, mode="r+",
+                                      shape=(self.capacidad, self.dimension))
+
+        ruta_centroides = self._ruta("centroides.npy")
+        self.centroides: Optional[np.ndarray] = np.load(ruta_centroides) if os.path.exists(ruta_centroides) else None
+
+        # Estado en memoria reconstruido desde SQLite: id -> fila, máscara de vivos y listas invertidas
+        self._fila_por_id: Dict[str, int] = {}
+        self._id_por_fila: Dict[int, str] = {}
+        self._vivos = np.zeros(self.capacidad, dtype=bool)
+        self._listas: List[List[int]] = [[] for _ in range(len(self.centroides))] if self.centroides is not None else []
+        for fila, id_fragmento, lista in self._db.execute("SELECT fila, id, lista FROM fragmentos WHERE activo = 1"):
+            self._fila_por_id[id_fragmento] = fila
+            self._id_por_fila[fila] = id_fragmento
+            self._vivos[fila] = True
+            if 0 <= lista < len(self._listas):
+                self._listas[lista].append(fila)
+
+    # --- Persistencia ---
+
+    def _ruta(self, nombre: str) -> str:
+        return os.path.join(self.ruta, nombre)
+
+    def _leer_config(self) -> Dict[str, Any]:
+        try:
+            with open(self._ruta("config.json"), "r", encoding="utf-8") as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return {}
+
+    def _guardar_config(self):
+        temporal = self._ruta("config.json.tmp")
+        with open(temporal, "w", encoding="utf-8") as f:
+            json.dump({
+                "dimension": self.dimension,
+                "capacidad": self.capacidad,
+                "filas": self.filas,
+                "vivos_al_entrenar": self.vivos_al_entrenar,
+            }, f)
+        os.replace(temporal, self._ruta("config.json"))
+
+    def _asegurar_capacidad(self, necesarias: int):
+        if self.filas + necesarias <= self.capacidad:
+            return
+        nueva = max(CAPACIDAD_INICIAL, self.capacidad * 2)
+        while nueva < self.filas + necesarias:
+            nueva *= 2
+        if self.vectores is not None:
+            self.vectores.flush()
+            self.vectores = None
+        with open(self._ruta("vectores.f32"), "ab") as f:
+            f.truncate(nueva * self.dimension * 4)
+        self.vectores = np.memmap(self._ruta("vectores.f32"), dtype=np.float32, mode="r+",
+                                  shape=(nueva, self.dimension))
+        vivos = np.zeros(nueva, dtype=bool)
+        vivos[:self.capacidad] = self._vivos
+        self._vivos = vivos
+        self.capacidad = nueva
+
+    # --- Embeddings ---
+
+    def embeber(self, textos: List[str]) -> np.ndarray:
+        if self._funcion_embedding is None:
+            # Mismo modelo que usa Chroma por defecto (all-MiniLM-L6-v2, ONNX local)
+            from chromadb.utils.embedding_functions import DefaultEmbeddingFunction
+            self._funcion_embedding = DefaultEmbeddingFunction()
+        return np.asarray(self._funcion_embedding(textos), dtype=np.float32)
+
+    @staticmethod
+    def _normalizar(matriz: np.ndarray) -> np.ndarray:
+        normas = np.linalg.norm(matriz, axis=-1, keepdims=True)
+        return matriz / np.maximum(normas, 1e-12)
+
+    # --- Escritura ---
+
+    def agregar_vectores(self, ids: List[str], vectores: np.ndarray, documentos: List[str],
+                         metadatos: List[Dict[str, Any]]):
+        """Inserta (o reemplaza) filas con vectores ya calculados."""
+        vectores = self._normalizar(np.asarray(vectores, dtype=np.float32))
+        with self._lock:
+            if self.dimension is None:
+                self.dimension = vectores.shape[1]
+            elif vectores.shape[1] != self.dimension:
+                raise ValueError(f"Dimensión {vectores.shape[1]} incompatible con el índice ({self.dimension}).")
+
+            reemplazadas = [self._fila_por_id[i] for i in ids if i in self._fila_por_id]
+            self._desactivar(reemplazadas)
+
+            self._asegurar_capacidad(len(ids))
+            inicio = self.filas
+            filas = range(inicio, inicio + len(ids))
+            self.vectores[inicio:inicio + len(ids)] = vectores
+            self.vectores.flush()
+
+            listas = self._asignar(vectores) if self.centroides is not None else np.full(len(ids), -1)
+            self._db.executemany(
+                "INSERT INTO fragmentos (fila, id, id_libro, documento, metadatos, lista) VALUES (?, ?, ?, ?, ?, ?)",
+                [
+                    (fila, id_fragmento, str(meta.get("id_libro", "")), doc, json.dumps(meta, ensure_ascii=False), int(lista))
+                    for fila, id_fragmento, doc, meta, lista in zip(filas, ids, documentos, metadatos, listas)
+                ]
+            )
+            self._db.commit()
+            for fila, id_fragmento, lista in zip(filas, ids, listas):
+                self._fila_por_id[id_fragmento] = fila
+                self._id_por_fila[fila] = id_fragmento
+                self._vivos[fila] = True
+                if lista >= 0:
+                    self._listas[lista].append(fila)
+            self.filas += len(ids)
+            self._guardar_config()
+
+            # Re-entrenar cuando el índice se ha multiplicado por 4 desde el último k-means
+            vivos = len(self._fila_por_id)
+            if vivos >= MIN_ENTRENAMIENTO and vivos >= 4 * max(self.vivos_al_entrenar, 1):
+                self.entrenar()
+
+    def _desactivar(self, filas: List[int]):
+        if not filas:
+            return
+        self._db.executemany("UPDATE fragmentos SET activo = 0 WHERE fila = ?", [(f,) for f in filas])
+        for fila in filas:
+            self._fila_por_id.pop(self._id_por_fila.pop(fila), None)
+        self._vivos[filas] = False
+        # Las listas invertidas filtran por la máscara de vivos; no hace falta podarlas aquí
+
+    # --- IVF ---
+
+    def _asignar(self, vectores: np.ndarray) -> np.ndarray:
+        return np.argmax(vectores @ self.centroides.T, axis=1)
+
+    def entrenar(self, num_listas: Optional[int] = None, iteraciones: int = 10, muestra: int = 50_000):
+        """k-means esférico sobre una muestra de vectores vivos y reasignación de todas las filas."""
+        with self._lock:
+            vivos = np.flatnonzero(self._vivos[:self.filas])
+            if len(vivos) == 0:
+                return
+            num_listas = num_listas or max(1, int(np.sqrt(len(vivos))))
+            rng = np.random.default_rng(0)
+            indices_muestra = np.sort(rng.choice(vivos, size=min(muestra, len(vivos)), replace=False))
+            datos = np.asarray(self.vectores[indices_muestra])
+            centroides = datos[rng.choice(len(datos), size=min(num_listas, len(datos)), replace=False)].copy()
+
+            for _ in range(iteraciones):
+                asignacion = np.argmax(datos @ centroides.T, axis=1)
+                for k in range(len(centroides)):
+                    miembros = datos[asignacion == k]
+                    # Cluster vacío: se re-siembra con un punto al azar
+                    centroides[k] = miembros.sum(axis=0) if len(miembros) else datos[rng.integers(len(datos))]
+                centroides = self._normalizar(centroides)
+
+            self.centroides = centroides.astype(np.float32)
+            np.save(self._ruta("centroides.npy"), self.centroides)
+
+            self._listas = [[] for _ in range(len(self.centroides))]
+            actualizaciones = []
+            for inicio in range(0, len(vivos), 65_536):
+                bloque = vivos[inicio:inicio + 65_536]
+                for fila, lista in zip(bloque.tolist(), self._asignar(np.asarray(self.vectores[bloque])).tolist()):
+                    self._listas[lista].append(fila)
+                    actualizaciones.append((lista, fila))
+            self._db.executemany("UPDATE fragmentos SET lista = ? WHERE fila = ?", actualizaciones)
+            self._db.commit()
+            self.vivos_al_entrenar = len(vivos)
+            self._guardar_config()
+            logger.info(f"Índice IVF entrenado: {len(self.centroides)} listas para {len(vivos)} vectores.")
+
+    # --- Búsqueda ---
+
+    def buscar_vectores(self, consulta: np.ndarray, n_resultados: int, exacta: bool = False) -> List[Tuple[int, float]]:
+        """(fila, similitud coseno) de los vecinos más cercanos. exacta=True usa fuerza bruta."""
+        q = self._normalizar(np.asarray(consulta, dtype=np.float32).reshape(-1))
+        with self._lock:
+            if self.vectores is None:
+                return []
+            if exacta or self.centroides is None or self.nprobe >= len(self.centroides):
+                candidatos = np.flatnonzero(self._vivos[:self.filas])
+            else:
+                sondas = np.argpartition(-(self.centroides @ q), self.nprobe)[:self.nprobe]
+                candidatos = np.fromiter((f for s in sondas for f in self._listas[s]), dtype=np.int64)
+                # Ordenadas para leer el memmap de forma secuencial
+                candidatos = np.sort(candidatos[self._vivos[candidatos]])
+            if len(candidatos) == 0:
+                return []
+            similitudes = np.asarray(self.vectores[candidatos]) @ q
+
+        k = min(n_resultados, len(candidatos))
+        mejores = np.argpartition(-similitudes, k - 1)[:k]
+        mejores = mejores[np.argsort(-similitudes[mejores])]
+        return [(int(candidatos[i]), float(similitudes[i])) for i in mejores]
+
+    # --- Contrato BackendVectorial ---
+
+    def existentes(self, ids: List[str]) -> set:
+        with self._lock:
+            return {i for i in ids if i in self._fila_por_id}
+
+    def upsert(self, ids: List[str], documentos: List[str], metadatos: List[Dict[str, Any]]):
+        self.agregar_vectores(ids, self.embeber(documentos), documentos, metadatos)
+
+    def consultar_vector(self, vector: np.ndarray, n_resultados: int) -> Dict[str, Any]:
+        vecinos = self.buscar_vectores(vector, n_resultados)
+        filas = [fila for fila, _ in vecinos]
+        registros = {}
+        if filas:
+            marcadores = ",".join("?" * len(filas))
+            with self._lock:
+                for fila, id_fragmento, doc, meta in self._db.execute(
+                    f"SELECT fila, id, documento, metadatos FROM fragmentos WHERE fila IN ({marcadores})", filas
+                ):
+                    registros[fila] = (id_fragmento, doc, json.loads(meta))
+        return {
+            "ids": [[registros[f][0] for f in filas]],
+            "documents": [[registros[f][1] for f in filas]],
+            "metadatas": [[registros[f][2] for f in filas]],
+            "distances": [[1.0 - similitud for _, similitud in vecinos]],
+        }
+
+    def eliminar_libro(self, id_libro: str):
+        with self._lock:
+            filas = [f for (f,) in self._db.execute(
+                "SELECT fila FROM fragmentos WHERE id_libro = ? AND activo = 1", (id_libro,)
+            )]
+            self._desactivar(filas)
+            self._db.commit()
+
+    def eliminar_legados(self) -> int:
+        with self._lock:
+            filas = [f for (f,) in self._db.execute(
+                "SELECT fila FROM fragmentos WHERE (id_libro IS NULL OR id_libro = '') AND activo = 1"
+            )]
+            self._desactivar(filas)
+            self._db.commit()
+        return len(filas)
+
+    def heartbeat(self):
+        return self.total()
+
+    def total(self) -> int:
+        """Fragmentos activos en el índice."""
+        return len(self._fila_por_id)
@@ -7,24 +7,42 @@ try:
 except ImportError:
     pass
 
-from fastapi import FastAPI, Depends, HTTPException, BackgroundTasks
+from fastapi import FastAPI, Depends, HTTPException, BackgroundTasks, Request, Response
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.staticfiles import StaticFiles
-from fastapi.responses import StreamingResponse
+from fastapi.responses import StreamingResponse, FileResponse
 from sqlalchemy.orm import Session
+from sqlalchemy.orm.exc import StaleDataError
 from typing import List, Optional
 import os
+import json
 import logging
+import anyio
+from datetime import datetime
+from email.utils import formatdate, parsedate_to_datetime
 # Cargar variables de entorno desde .env ANTES de importar servicios
 from dotenv import load_dotenv
 load_dotenv()
 
-from database import obtener_db, inicializar_base_de_datos
+from database import obtener_db, obtener_db_lectura, inicializar_base_de_datos, estado_pools
 import models
 import schemas
 from servicio_biblioteca import ServicioBiblioteca
-from servicio_ia import servicio_ia
-from servicio_vectorial import ServicioVectorial
+import servicio_ia  # noqa: F401 (registra el servicio "ia"; se resuelve con obtener_servicio_ia)
+from servicio_diccionario import servicio_diccionario
+from servicio_vectorial import servicio_vectorial
+from servicios import registro
+from recuperacion import RecuperadorHibrido
+from cache_disco import cache_drive
+from concurrencia import en_hilo, limitador
+from http_saliente import cerrar_cliente_http
+from busqueda import indice_busqueda, indice_notas
+from servicio_notas import ServicioNotas
+from cache_lectura import cache_lectura, serializar, RespuestaCacheada, GRUPO_CATALOGO, GRUPO_NOTA_SISTEMA
+from respuestas_json import filas_json, respuesta_json, elegir_codificacion
+from migraciones import CLAVE_HUELLA_NOTA_SISTEMA
+
+logger = logging.getLogger("ArcaAPI")
 
 app = FastAPI(
     title="El Arca API",
@@ -45,6 +63,8 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    # Cabeceras de paginación legibles desde el frontend (fetch no ve las no listadas)
+    expose_headers=["X-Total-Count", "X-Siguiente-Cursor", "Link", "X-Sincronizado-Hasta"],
 )
 
 # Montar archivos estáticos de la biblioteca
@@ -57,90 +77,47 @@ else:
 # Inicializar DB al arranque (crear tablas si no existen)
 @app.on_event("startup")
 def evento_inicio():
-    inicializar_base_de_datos()
-    # Migración ligera automática para SQLite (Añadir columna es_favorita si falta)
-    from database import engine
-    from sqlalchemy import text
-    try:
-        with engine.connect() as conn:
-            # Check si la columna existe (solo para SQLite/Postgres simple)
-            try:
-                conn.execute(text("SELECT es_favorita FROM notas LIMIT 1"))
-            except Exception:
-                conn.rollback() # Importante para Postgres: limpiar la transacción fallida antes de seguir
-                print("⚠️ Aplicando migración: Añadiendo columna 'es_favorita' a tabla notas...")
-                conn.execute(text("ALTER TABLE notas ADD COLUMN es_favorita BOOLEAN DEFAULT FALSE"))
-                conn.commit()
-    except Exception as e:
-        print(f"Nota sobre migración es_favorita: {e}")
+    # Esquema al día (migraciones versionadas): con la base ya migrada es una sola consulta
+    estado = inicializar_base_de_datos()
 
-    # Migración: es_sistema
+    # Semilla: Nota de Bienvenida (Sistema), solo si su contenido cambió desde la última vez
     try:
-        with engine.connect() as conn:
-            try:
-                conn.execute(text("SELECT es_sistema FROM notas LIMIT 1"))
-            except Exception:
-                conn.rollback()
-                print("⚠️ Aplicando migración: Añadiendo columna 'es_sistema' a notas...")
-                conn.execute(text("ALTER TABLE notas ADD COLUMN es_sistema BOOLEAN DEFAULT FALSE"))
-                conn.commit()
+        from database import SessionLocal
+        with SessionLocal() as db:
+            ServicioNotas.sembrar_nota_sistema(db, estado.get(CLAVE_HUELLA_NOTA_SISTEMA))
     except Exception as e:
-        print(f"Nota sobre migración es_sistema: {e}")
+        print(f"Error gestionando nota semilla: {e}")
 
-    # Migración: user_id
-    try:
-        with engine.connect() as conn:
-            try:
-                conn.execute(text("SELECT user_id FROM notas LIMIT 1"))
-            except Exception:
-                conn.rollback()
-                print("⚠️ Aplicando migración: Añadiendo columna 'user_id' a notas...")
-                conn.execute(text("ALTER TABLE notas ADD COLUMN user_id VARCHAR"))
-                conn.commit()
-    except Exception as e:
-        print(f"Nota sobre migración user_id: {e}")
+    # Índice de búsqueda: en segundo plano se indexan los libros que aún no lo estén
+    # (primera vez en una base de datos existente, o cambios hechos fuera de la API)
+    import threading
+    threading.Thread(target=reconciliar_indice_busqueda, name="arca-indice-busqueda", daemon=True).start()
+    # Servicios pesados (Chroma, Gemini, Drive): se crean en segundo plano y el servidor no los espera;
+    # una petición que llegue antes crea (o espera) el que necesite
+    threading.Thread(target=precalentar_servicios, name="arca-precalentar", daemon=True).start()
+
+def precalentar_servicios():
+    # Primero la base vectorial: con Chroma Cloud es la conexión más lenta
+    registro.precalentar(["vectorial", "ia", "drive"])
+    # Token de Drive renovado en segundo plano: ninguna petición espera al refresh
+    from servicio_drive import servicio_drive
+    servicio_drive.iniciar_renovacion_token()
 
-    # Semilla: Nota de Bienvenida (Sistema)
+def reconciliar_indice_busqueda():
+    from database import SessionLocal
+    db = SessionLocal()
     try:
-        from sqlalchemy.orm import Session
-        session = Session(bind=engine)
-        
-        # BUSCAR si existe nota de sistema
-        nota_sistema = session.query(models.Nota).filter(models.Nota.es_sistema == True).first()
-        
-        contenido_bienvenida = """
-        <h3 class="text-xl font-bold text-amber-500 mb-4">Saludo de Bienvenida</h3>
-        <p class="mb-4">Hola, soy <strong>Héctor</strong>, desarrollador de este espacio de estudio bíblico.</p>
-        <p class="mb-4">A quien le comparta esta aplicación o tenga acceso, decir que es una idea nacida de la necesidad de tener un lugar de <em>inmersión</em> en el estudio de la Palabra, que por lo general ha sido físico, pero teniendo en cuenta que hoy en día la digitalización es ya parte de nuestras vidas, ¿por qué no tener un espacio como tal?</p>
-        <p class="mb-4">Así, inspirado por otras ideas de nivel estratosféricamente profesionales como lo son por ejemplo <em>Logos (Faithlife)</em> o <em>e-Sword</em>, creé esta aplicación web llamada <strong>El Arca</strong>, donde he subido varios archivos digitales recopilados a través del tiempo entre mi familia y amigos. Con un total en el comienzo de 1199 archivos con distintos tipos de libros, tareas, manualidades, etc. Se ha conformado la biblioteca digital.</p>
-        <p class="mb-4">Estoy trabajando para poder indexar todos los archivos y poder crear etiquetas que relacione todos los archivos con determinados temas. Por lo pronto, trabajaré en la categorización y renombrado correcto de los archivos para una mejor búsqueda de estos.</p>
-        <p class="mb-4">Finalmente, quiero desearles a todos una experiencia enriquecedora y que realmente pueda ser un aporte o un valor agregado al estudio de la Palabra de Dios y el estudio Teológico.</p>
-        <hr class="border-gray-700 my-4"/>
-        <p class="text-sm text-gray-400 italic">Cualquier comentario para mejorar es bienvenido. Pueden contactarme a través de la opción "Acerca de".</p>
-        """
-
-        if not nota_sistema:
-            print("🌱 Creando nota de bienvenida del sistema (Nueva)...")
-            nueva_nota = models.Nota(
-                titulo="Bienvenido a El Arca (Sistema)",
-                contenido_html=contenido_bienvenida,
-                previsualización="Nota global del sistema.",
-                palabras_clave="sistema, inicio",
-                es_favorita=False,
-                es_sistema=True,
-                user_id=None 
-            )
-            session.add(nueva_nota)
-        else:
-            print("🔄 Actualizando contenido de nota de sistema...")
-            nota_sistema.contenido_html = contenido_bienvenida
-            # Opcional: Actualizar título si es necesario
-            nota_sistema.titulo = "Bienvenido a El Arca (Sistema)"
-            
-        session.commit()
-        session.close()
+        indice_busqueda.reconciliar(db)
+        indice_notas.reconciliar(db)
     except Exception as e:
-        print(f"Error gestionando nota semilla: {e}")
+        logger.error(f"Error reconciliando el índice de búsqueda: {e}")
+        db.rollback()
+    finally:
+        db.close()
+
+@app.on_event("shutdown")
+async def evento_cierre():
+    await cerrar_cliente_http()
 
 @app.get("/", tags=["Estado"])
 def leer_raiz():
@@ -167,6 +144,14 @@ def diagnostico_sistema(db: Session = Depends(obtener_db)):
         db.execute(text("SELECT 1"))
     except Exception as e:
         resultado["base_datos"] = f"Error: {e}"
+    from database import engine, engine_lectura
+    if engine_lectura is not engine:
+        try:
+            with engine_lectura.connect() as conn:
+                conn.execute(text("SELECT 1"))
+            resultado["base_datos_lectura"] = "conectada"
+        except Exception as e:
+            resultado["base_datos_lectura"] = f"Error: {e}"
 
     # 2. Drive Check
     try:
@@ -181,10 +166,12 @@ def diagnostico_sistema(db: Session = Depends(obtener_db)):
 
     # 3. Vector Check
     try:
-        # Simple ping implícito
-        if servicio_vectorial and servicio_vectorial.client:
-             servicio_vectorial.client.heartbeat()
-             resultado["vector_store"] = "conectado"
+        # Simple ping implícito (sin esperar a que termine de conectar si aún se está precalentando)
+        if not registro.creado("vectorial"):
+             resultado["vector_store"] = "inicializando"
+        elif servicio_vectorial.backend:
+             servicio_vectorial.backend.heartbeat()
+             resultado["vector_store"] = f"conectado ({servicio_vectorial.tipo_backend})"
         else:
              resultado["vector_store"] = "no inicializado"
     except Exception as e:
@@ -192,11 +179,76 @@ def diagnostico_sistema(db: Session = Depends(obtener_db)):
 
     return resultado
 
+@app.get("/sistema/metricas", tags=["Estado"])
+def metricas_sistema():
+    """Contadores de cachés (aciertos/fallos) para observar el rendimiento."""
+    from servicio_drive import servicio_drive
+    return {
+        "consultas_rag": servicio_vectorial.estadisticas_cache(),
+        "diccionario": servicio_diccionario.estadisticas(),
+        "archivos_drive": cache_drive.estadisticas(),
+        "metadatos_drive": servicio_drive.metadatos.estadisticas(),
+        "servicios": registro.estadisticas(),
+        "lectura": cache_lectura.estadisticas(),
+        "pools_db": estado_pools()
+    }
+
 # --- ENDPOINTS: LIBROS DIGITALES ---
 
-@app.get("/libros/digitales", response_model=List[schemas.LibroDigital], tags=["Biblioteca Digital"])
-def listar_libros_digitales(db: Session = Depends(obtener_db)):
-    return db.query(models.LibroDigital).all()
+@app.get("/libros/digitales", tags=["Biblioteca Digital"])
+def listar_libros_digitales(
+    request: Request,
+    limite: int = 100,
+    cursor: Optional[str] = None,
+    orden: str = "titulo",
+    campos: Optional[str] = None,
+    categoria: Optional[str] = None,
+    autor: Optional[str] = None,
+    formato: Optional[str] = None,
+    db: Session = Depends(obtener_db)
+):
+    """Catálogo paginado por cursor.
+
+    - orden: id, titulo, autor o categoria (prefijo "-" = descendente).
+    - campos: lista separada por comas (p.ej. "id,titulo,autor"); por defecto todos.
+    - X-Total-Count: total con los filtros aplicados. X-Siguiente-Cursor (y Link rel=next):
+      valor para `cursor` de la página siguiente; no aparece en la última.
+    - Igual para todos los usuarios: se sirve desde la caché de lectura (ETag, 304) hasta
+      la siguiente sincronización o escaneo.
+    """
+    lista_campos = tuple(c.strip() for c in campos.split(",") if c.strip()) if campos else None
+
+    def calcular():
+        try:
+            filas, total, siguiente = ServicioBiblioteca.listar_digitales(
+                db, limite=limite, cursor=cursor, orden=orden, campos=lista_campos,
+                categoria=categoria, autor=autor, formato=formato
+            )
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+        cabeceras = {"X-Total-Count": str(total)}
+        if siguiente:
+            cabeceras["X-Siguiente-Cursor"] = siguiente
+        return serializar(filas, cabeceras)
+
+    entrada = cache_lectura.obtener(
+        GRUPO_CATALOGO, (limite, cursor, orden, lista_campos, categoria, autor, formato), calcular)
+    siguiente = entrada.cabeceras.get("X-Siguiente-Cursor")
+    enlace = {"Link": f'<{request.url.include_query_params(cursor=siguiente)}>; rel="next"'} if siguiente else {}
+    return responder_cacheada(request, entrada, enlace)
+
+@app.get("/libros/digitales/buscar", tags=["Biblioteca Digital"])
+def buscar_libros_digitales(q: str, limite: int = 20, categoria: Optional[str] = None,
+                            formato: Optional[str] = None, db: Session = Depends(obtener_db_lectura)):
+    """Búsqueda de texto completo en título, autor, etiquetas, descripción y texto extraído.
+
+    Insensible a tildes y mayúsculas, con raíces en español ("profetas" encuentra "profeta");
+    el último término casa también por prefijo. Resultados por relevancia, con
+    `fragmento` y `titulo_resaltado` marcados con <mark> (HTML escapado).
+    Lee de la réplica si hay DATABASE_READ_URL: un libro recién escaneado puede tardar un
+    instante en aparecer.
+    """
+    return indice_busqueda.buscar(db, q, limite=max(1, min(limite, 100)), categoria=categoria, formato=formato)
 
 @app.post("/libros/digitales/escanear", tags=["Biblioteca Digital"])
 def escanear_biblioteca(background_tasks: BackgroundTasks, db: Session = Depends(obtener_db)):
@@ -205,39 +257,122 @@ def escanear_biblioteca(background_tasks: BackgroundTasks, db: Session = Depends
     return {"mensaje": "Escaneo local iniciado en segundo plano."}
 
 @app.post("/libros/digitales/sincronizar-drive", tags=["Biblioteca Digital"])
-def sincronizar_drive(background_tasks: BackgroundTasks, db: Session = Depends(obtener_db)):
+def sincronizar_drive(background_tasks: BackgroundTasks, completa: bool = False, db: Session = Depends(obtener_db)):
+    """Incremental (solo cambios desde la última vez) salvo ?completa=true o primera sincronización."""
     try:
-        background_tasks.add_task(ServicioBiblioteca.sincronizar_con_drive, db)
+        background_tasks.add_task(ServicioBiblioteca.sincronizar_con_drive, db, completa)
         return {"mensaje": "Sincronización con Google Drive iniciada en segundo plano."}
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
+def cabeceras_validacion(descarga: dict) -> dict:
+    """ETag (md5 de Drive) y Last-Modified para que el navegador pueda revalidar con 304."""
+    cabeceras = {}
+    if descarga.get("md5"):
+        cabeceras["ETag"] = f'"{descarga["md5"]}"'
+    if descarga.get("modificado"):
+        fecha = datetime.fromisoformat(descarga["modificado"].replace("Z", "+00:00"))
+        cabeceras["Last-Modified"] = formatdate(fecha.timestamp(), usegmt=True)
+    return cabeceras
+
+def no_modificado(request: Request, validacion: dict) -> bool:
+    si_ninguno = request.headers.get("if-none-match")
+    if si_ninguno and "ETag" in validacion:
+        etiquetas = [e.strip().removeprefix("W/") for e in si_ninguno.split(",")]
+        return "*" in etiquetas or validacion["ETag"] in etiquetas
+    si_modificado = request.headers.get("if-modified-since")
+    if si_modificado and "Last-Modified" in validacion:
+        try:
+            return parsedate_to_datetime(si_modificado) >= parsedate_to_datetime(validacion["Last-Modified"])
+        except (TypeError, ValueError):
+            return False
+    return False
+
+def responder_cacheada(request: Request, entrada: RespuestaCacheada, cabeceras: Optional[dict] = None) -> Response:
+    """Respuesta JSON ya serializada con su ETag fuerte: 304 sin cuerpo si el cliente ya la tiene.
+
+    Comprimida (brotli/gzip) si el cliente lo acepta; la versión comprimida queda en la caché.
+    """
+    codificacion = elegir_codificacion(request.headers.get("accept-encoding"), len(entrada.cuerpo))
+    etag = entrada.etag_codificado(codificacion)
+    # no-cache: el navegador la guarda pero revalida siempre (If-None-Match)
+    cabeceras = {"ETag": etag, "Cache-Control": "no-cache", "Vary": "Accept-Encoding",
+                 **entrada.cabeceras, **(cabeceras or {})}
+    if no_modificado(request, {"ETag": etag}):
+        return Response(status_code=304, headers=cabeceras)
+    if codificacion:
+        cabeceras["Content-Encoding"] = codificacion
+    return Response(content=entrada.cuerpo_codificado(codificacion), media_type="application/json", headers=cabeceras)
+
 @app.get("/libros/ver/{file_id}", tags=["Biblioteca Digital"])
-def ver_libro_drive(file_id: str):
-    """Proxy para visualizar archivos directamente desde Google Drive sin hacerlos públicos."""
-    from servicio_drive import servicio_drive
+async def ver_libro_drive(file_id: str, request: Request):
+    """Proxy para visualizar archivos directamente desde Google Drive sin hacerlos públicos.
+
+    Soporta Range (206) para que el visor salte de página sin bajar todo el PDF, y
+    guarda los archivos en una caché LRU en disco: reabrir un libro no toca Drive.
+    """
+    import servicio_drive  # noqa: F401 (registra el servicio "drive")
     
     try:
-        # Usamos generador para Streaming Real (cero RAM, velocidad instantánea)
-        stream_generator, mime_type, filename = servicio_drive.generar_descarga(file_id)
-        
-        # Validar si el generador es válido (servicio_drive devuelve generador vacío en error)
-        if mime_type == "application/octet-stream" and filename == "error.bin":
+        # Crear el servicio (google-auth y credenciales) o esperar al precalentamiento
+        # bloquearía el event loop: se resuelve en un hilo, como el de IA
+        drive = await anyio.to_thread.run_sync(registro.obtener, "drive")
+        # Token y metadatos usan el SDK síncrono: en hilo del límite "drive"
+        descarga = await en_hilo("drive", drive.preparar_descarga, file_id)
+        if not descarga:
             raise HTTPException(status_code=404, detail="Archivo no encontrado o inaccesible en Drive.")
+        mime_type, filename, md5 = descarga["mime_type"], descarga["nombre"], descarga["md5"]
 
+        validacion = cabeceras_validacion(descarga)
         headers = {
             "Content-Disposition": f'inline; filename="{filename}"',
             "Content-Type": mime_type,
             "X-Content-Type-Options": "nosniff",
-            "Cache-Control": "no-cache",
-            "Access-Control-Allow-Origin": "*" # Header manual de seguridad por si falla middleware en streaming
+            "Cache-Control": "private, no-cache", # Guardar, pero revalidar con ETag en cada apertura
+            "Access-Control-Allow-Origin": "*", # Header manual de seguridad por si falla middleware en streaming
+            **validacion
         }
-        
+        if no_modificado(request, validacion):
+            return Response(status_code=304, headers={k: v for k, v in headers.items() if k != "Content-Type"})
+
+        # 1. Copia en disco: FileResponse resuelve Range/If-Range por sí mismo
+        ruta_local = await cache_drive.obtener(file_id, md5)
+        if ruta_local:
+            return FileResponse(ruta_local, media_type=mime_type, headers=headers)
+
+        # 2. Drive, reenviando el Range (salvo que If-Range indique que la copia del cliente es vieja)
+        rango = request.headers.get("range")
+        si_rango = request.headers.get("if-range")
+        if rango and si_rango and si_rango not in validacion.values():
+            rango = None
+
+        respuesta = await drive.abrir_descarga_async(descarga, rango)
+        if respuesta.status_code >= 400 and respuesta.status_code != 416:
+            await respuesta.aclose()
+            raise HTTPException(status_code=404 if respuesta.status_code == 404 else 502,
+                                detail=f"Drive respondió {respuesta.status_code} para el archivo.")
+        headers["Accept-Ranges"] = "bytes"
+        for cabecera in ("Content-Length", "Content-Range"):
+            if cabecera in respuesta.headers:
+                headers[cabecera] = respuesta.headers[cabecera]
+
+        # Streaming asíncrono (cero RAM y sin retener un hilo durante la descarga)
+        stream_generator = drive.iterar_respuesta(respuesta)
+        if cache_drive.admite(descarga["tamano"]):
+            if respuesta.status_code == 200:
+                stream_generator = cache_drive.guardar_mientras_envia(file_id, md5, stream_generator)
+            else:
+                # Petición parcial: bajamos el archivo completo aparte para la próxima apertura
+                cache_drive.programar_llenado(file_id, md5, lambda: drive.iterar_descarga_async(descarga))
+
         return StreamingResponse(
             stream_generator, 
+            status_code=respuesta.status_code,
             media_type=mime_type,
             headers=headers
         )
+    except HTTPException:
+        raise
     except Exception as e:
         print(f"Error sirviendo archivo {file_id}: {e}")
         raise HTTPException(status_code=500, detail=f"Error interno del servidor: {str(e)}")
@@ -245,13 +380,16 @@ def ver_libro_drive(file_id: str):
 # --- ENDPOINTS: LIBROS FÍSICOS ---
 
 @app.get("/libros/fisicos", response_model=List[schemas.LibroFisico], tags=["Biblioteca Física"])
-def listar_libros_fisicos(db: Session = Depends(obtener_db)):
-    return db.query(models.LibroFisico).all()
+def listar_libros_fisicos(request: Request, db: Session = Depends(obtener_db)):
+    """Toda la biblioteca física: columnas como tuplas y JSON directo (sin pasar por pydantic)."""
+    columnas = tuple(schemas.LibroFisico.model_fields)
+    filas = db.query(*(getattr(models.LibroFisico, c) for c in columnas)).all()
+    return respuesta_json(request, filas_json(columnas, filas))
 
 @app.get("/libros/fisicos/isbn/{isbn}", tags=["Biblioteca Física"])
-def buscar_libro_por_isbn(isbn: str):
+async def buscar_libro_por_isbn(isbn: str):
     from servicio_biblioteca import ServicioFisico
-    datos = ServicioFisico.buscar_por_isbn(isbn)
+    datos = await ServicioFisico.buscar_por_isbn_async(isbn)
     if not datos:
         raise HTTPException(status_code=404, detail="No se encontraron datos para este ISBN")
     return datos
@@ -267,8 +405,10 @@ def agregar_libro_fisico(libro: schemas.LibroFisicoCrear, db: Session = Depends(
 # --- ENDPOINTS: NOTAS (CUADERNO) ---
 
 @app.get("/notas", response_model=List[schemas.Nota], tags=["Cuaderno"])
-def listar_notas(user_id: Optional[str] = None, db: Session = Depends(obtener_db)):
-    query = db.query(models.Nota)
+def listar_notas(request: Request, user_id: Optional[str] = None, db: Session = Depends(obtener_db)):
+    """Todas las notas con su contenido (el cuaderno usa /notas/resumen y /notas/cambios)."""
+    columnas = tuple(schemas.Nota.model_fields)
+    query = db.query(*(getattr(models.Nota, c) for c in columnas))
     if user_id:
         query = query.filter(models.Nota.user_id == user_id)
     else:
@@ -276,7 +416,64 @@ def listar_notas(user_id: Optional[str] = None, db: Session = Depends(obtener_db
         # Ojo: esto significa que si entras sin loguear ves las notas viejas.
         query = query.filter(models.Nota.user_id == None)
         
-    return query.order_by(models.Nota.fecha_actualizacion.desc()).all()
+    filas = query.order_by(models.Nota.fecha_actualizacion.desc()).all()
+    return respuesta_json(request, filas_json(columnas, filas))
+
+@app.get("/notas/resumen", response_model=List[schemas.NotaResumen], tags=["Cuaderno"])
+def listar_resumen_notas(request: Request, response: Response, user_id: Optional[str] = None, limite: int = 100,
+                         cursor: Optional[str] = None, db: Session = Depends(obtener_db)):
+    """Cuaderno sin los cuerpos (contenido_html se pide al abrir la nota), paginado por cursor.
+
+    Más recientes primero. Cabeceras como /libros/digitales (X-Total-Count, X-Siguiente-Cursor,
+    Link) y X-Sincronizado-Hasta: valor de `since` para pedir después solo los cambios.
+    """
+    hasta = ServicioNotas.ahora(db)
+    try:
+        filas, total, siguiente = ServicioNotas.listar_resumen(db, user_id=user_id, limite=limite, cursor=cursor)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    response.headers["X-Total-Count"] = str(total)
+    response.headers["X-Sincronizado-Hasta"] = hasta.isoformat()
+    if siguiente:
+        response.headers["X-Siguiente-Cursor"] = siguiente
+        response.headers["Link"] = f'<{request.url.include_query_params(cursor=siguiente)}>; rel="next"'
+    return filas
+
+@app.get("/notas/buscar", response_model=List[schemas.NotaEncontrada], tags=["Cuaderno"])
+def buscar_notas(q: str, user_id: Optional[str] = None, limite: int = 20, db: Session = Depends(obtener_db)):
+    """Búsqueda de texto completo en título, palabras clave y cuerpo (sin HTML) de las notas del usuario."""
+    return indice_notas.buscar(db, q, user_id=user_id, limite=max(1, min(limite, 100)))
+
+@app.get("/notas/cambios", response_model=schemas.CambiosNotas, tags=["Cuaderno"])
+def cambios_notas(since: datetime, user_id: Optional[str] = None, db: Session = Depends(obtener_db)):
+    """Sincronización incremental: notas (completas) modificadas e ids borrados desde `since`.
+
+    `since` es el "hasta" de la llamada anterior (o X-Sincronizado-Hasta del resumen).
+    Con reiniciar=true el cliente debe volver a cargar el resumen completo.
+    """
+    return ServicioNotas.cambios(db, since, user_id=user_id)
+
+@app.get("/notas/sistema", response_model=schemas.Nota, tags=["Cuaderno"])
+def obtener_nota_sistema(request: Request, db: Session = Depends(obtener_db)):
+    """Nota de bienvenida global: la misma para todos, servida desde la caché de lectura (ETag, 304)."""
+    def calcular():
+        db_nota = db.query(models.Nota).filter(models.Nota.es_sistema == True).first()
+        if not db_nota:
+            raise HTTPException(status_code=404, detail="No hay nota de sistema")
+        return serializar(schemas.Nota.model_validate(db_nota))
+
+    return responder_cacheada(request, cache_lectura.obtener(GRUPO_NOTA_SISTEMA, None, calcular))
+
+@app.get("/notas/{nota_id}", response_model=schemas.Nota, tags=["Cuaderno"])
+def obtener_nota(nota_id: int, user_id: Optional[str] = None, db: Session = Depends(obtener_db)):
+    # Sin user_id solo las notas sin dueño, como en GET /notas; la nota de sistema la ven todos
+    db_nota = db.query(models.Nota).filter(
+        models.Nota.id == nota_id,
+        ServicioNotas._del_usuario(user_id) | (models.Nota.es_sistema == True)
+    ).first()
+    if not db_nota:
+        raise HTTPException(status_code=404, detail="Nota no encontrada")
+    return db_nota
 
 @app.post("/notas", response_model=schemas.Nota, tags=["Cuaderno"])
 def crear_nota(nota: schemas.NotaCrear, user_id: Optional[str] = None, db: Session = Depends(obtener_db)):
@@ -288,18 +485,13 @@ def crear_nota(nota: schemas.NotaCrear, user_id: Optional[str] = None, db: Sessi
         
     nueva_nota = models.Nota(**datos_nota)
     db.add(nueva_nota)
+    db.flush()
+    indice_notas.indexar(db, [nueva_nota])
     db.commit()
     db.refresh(nueva_nota)
     return nueva_nota
 
-@app.put("/notas/{nota_id}", response_model=schemas.Nota, tags=["Cuaderno"])
-def actualizar_nota(nota_id: int, nota_actualizada: schemas.NotaCrear, user_id: Optional[str] = None, db: Session = Depends(obtener_db)):
-    # Buscamos la nota PRIMERO sin filtrar por usuario para ver permisos
-    db_nota = db.query(models.Nota).filter(models.Nota.id == nota_id).first()
-    
-    if not db_nota:
-        raise HTTPException(status_code=404, detail="Nota no encontrada")
-    
+def comprobar_permiso_edicion(db_nota: models.Nota, user_id: Optional[str]):
     # 1. Protección de Notas de Sistema
     if db_nota.es_sistema:
         # PERMITIR EDITAR SOLO AL ADMIN
@@ -310,14 +502,64 @@ def actualizar_nota(nota_id: int, nota_actualizada: schemas.NotaCrear, user_id:
     # 2. Protección de Notas de Usuarios (si no es sistema)
     elif user_id and db_nota.user_id and db_nota.user_id != user_id:
          raise HTTPException(status_code=403, detail="No tienes permiso para editar esta nota.")
+
+def conflicto_version(version_actual: int) -> HTTPException:
+    # El cliente recibe la versión vigente para recargar la nota y reintentar
+    return HTTPException(status_code=409, detail={
+        "mensaje": "La nota cambió desde la versión enviada", "version": version_actual})
+
+@app.put("/notas/{nota_id}", response_model=schemas.Nota, tags=["Cuaderno"])
+def actualizar_nota(nota_id: int, nota_actualizada: schemas.NotaCrear, user_id: Optional[str] = None, db: Session = Depends(obtener_db)):
+    # Buscamos la nota PRIMERO sin filtrar por usuario para ver permisos
+    db_nota = db.query(models.Nota).filter(models.Nota.id == nota_id).first()
+    
+    if not db_nota:
+        raise HTTPException(status_code=404, detail="Nota no encontrada")
+    comprobar_permiso_edicion(db_nota, user_id)
     
     for key, value in nota_actualizada.dict().items():
         setattr(db_nota, key, value)
-    
+
+    db.flush()
+    indice_notas.indexar(db, [db_nota])
     db.commit()
+    if db_nota.es_sistema:
+        cache_lectura.invalidar(GRUPO_NOTA_SISTEMA)
     db.refresh(db_nota)
     return db_nota
 
+@app.patch("/notas/{nota_id}", response_model=schemas.NotaGuardada, tags=["Cuaderno"])
+def parchear_nota(nota_id: int, parche: schemas.NotaParche, user_id: Optional[str] = None, db: Session = Depends(obtener_db)):
+    """Autoguardado por diferencias: solo viaja (y se escribe) lo que cambió desde `parche.version`."""
+    db_nota = db.query(models.Nota).filter(models.Nota.id == nota_id).first()
+    if not db_nota:
+        raise HTTPException(status_code=404, detail="Nota no encontrada")
+    comprobar_permiso_edicion(db_nota, user_id)
+    if db_nota.version != parche.version:
+        raise conflicto_version(db_nota.version)
+
+    try:
+        reindexar = ServicioNotas.aplicar_parche(db_nota, parche)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    if db.is_modified(db_nota):
+        try:
+            # UPDATE ... WHERE id = ? AND version = ?: otra escritura entre la lectura y aquí da 409
+            db.flush()
+        except StaleDataError:
+            db.rollback()
+            raise conflicto_version(db.query(models.Nota.version).filter(models.Nota.id == nota_id).scalar())
+        if reindexar:
+            indice_notas.indexar(db, [db_nota])
+    # Se lee antes del commit (que expira la nota): así no se vuelve a cargar contenido_html
+    guardada = schemas.NotaGuardada.model_validate(db_nota, from_attributes=True)
+    es_sistema = db_nota.es_sistema
+    db.commit()
+    if es_sistema:
+        cache_lectura.invalidar(GRUPO_NOTA_SISTEMA)
+    return guardada
+
 @app.delete("/notas/{nota_id}", tags=["Cuaderno"])
 def eliminar_nota(nota_id: int, user_id: Optional[str] = None, db: Session = Depends(obtener_db)):
     query = db.query(models.Nota).filter(models.Nota.id == nota_id)
@@ -327,56 +569,112 @@ def eliminar_nota(nota_id: int, user_id: Optional[str] = None, db: Session = Dep
     db_nota = query.first()
     if not db_nota:
         raise HTTPException(status_code=404, detail="Nota no encontrada")
+    ServicioNotas.registrar_eliminacion(db, db_nota)
+    indice_notas.eliminar(db, [db_nota.id])
+    es_sistema = db_nota.es_sistema
     db.delete(db_nota)
     db.commit()
+    if es_sistema:
+        cache_lectura.invalidar(GRUPO_NOTA_SISTEMA)
     return {"mensaje": "Nota eliminada correctamente"}
 
+# --- STREAMING (Server-Sent Events) ---
+
+# X-Accel-Buffering: evita que proxies (Render/nginx) acumulen la respuesta antes de enviarla
+CABECERAS_SSE = {"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+
+def evento_sse(evento: str, datos) -> str:
+    return f"event: {evento}\ndata: {json.dumps(datos, ensure_ascii=False)}\n\n"
+
 # --- ENDPOINTS: DICCIONARIO TEOLÓGICO ---
 
 @app.get("/diccionario/{termino}", tags=["Diccionario"])
-def consultar_diccionario(termino: str, perspectiva: Optional[str] = "reformado"):
-    definicion = servicio_ia.definir_termino(termino, perspectiva)
+async def consultar_diccionario(termino: str, perspectiva: Optional[str] = "reformado"):
+    # Aciertos de memoria sin salto a hilo; la DB en el threadpool y solo Gemini bajo su límite
+    definicion = servicio_diccionario.en_memoria(termino, perspectiva)
+    if definicion is None:
+        definicion = await servicio_diccionario.definir_async(termino, perspectiva)
     return {"termino": termino, "definicion": definicion}
 
+@app.get("/diccionario/{termino}/stream", tags=["Diccionario"])
+async def consultar_diccionario_stream(termino: str, perspectiva: Optional[str] = "reformado"):
+    """Igual que /diccionario/{termino} pero como Server-Sent Events (token, fin)."""
+    async def eventos():
+        async for texto in servicio_diccionario.definir_stream_async(termino, perspectiva):
+            yield evento_sse("token", {"texto": texto})
+        yield evento_sse("fin", {"termino": termino})
+
+    return StreamingResponse(eventos(), media_type="text/event-stream", headers=CABECERAS_SSE)
+
 # --- ENDPOINTS: ASISTENTE IA (RAG) ---
 
-servicio_vectorial = ServicioVectorial()
 
-@app.post("/preguntar", tags=["Asistente IA"])
-def preguntar_a_biblioteca(consulta: schemas.ConsultaBase):
-    # 1. Buscar fragmentos relevantes
-    contexto = ""
-    try:
-        resultados = servicio_vectorial.buscar_similitud(consulta.pregunta)
-        if resultados and "documents" in resultados and resultados["documents"]:
-            contexto = "\n".join(resultados["documents"][0])
-    except Exception as e:
-        print(f"Error en búsqueda vectorial: {e}")
+recuperador = RecuperadorHibrido(servicio_vectorial)
 
-    # 2. Generar respuesta con Gemini
-    prompt = f"""
-    Eres 'El Arca AI', un asistente especializado en teología y biblia. 
-    Usa el siguiente contexto extraído de la biblioteca personal del usuario para responder a su pregunta.
-    Si el contexto no contiene la información, usa tu conocimiento general pero prioriza el contexto.
+async def recuperar_contexto(pregunta: str):
+    """Pasajes relevantes de la biblioteca para la pregunta: (contexto, fuentes).
 
-    CONTEXTO:
-    {contexto}
+    Búsqueda léxica + vectorial fusionadas, sin duplicados y dentro de RAG_PRESUPUESTO_TOKENS.
+    """
+    try:
+        paquete = await en_hilo("vectorial", recuperador.recuperar, pregunta)
+        return paquete["contexto"], paquete["fuentes"]
+    except Exception as e:
+        logger.error(f"Error recuperando contexto: {e}")
+    return "", []
 
-    PREGUNTA:
-    {consulta.pregunta}
+async def obtener_servicio_ia():
+    """ServicioIA listo para usar, o 503 si no está configurado.
 
-    Respuesta técnica, pastoral y profesional en español:
+    Se resuelve en un hilo: crearlo (importar y configurar genai) o esperar a que termine
+    el precalentamiento bloquearía el event loop para todos los clientes.
     """
-    
-    if not hasattr(servicio_ia, 'model') or servicio_ia.model is None:
+    ia = await anyio.to_thread.run_sync(registro.obtener, "ia")
+    if getattr(ia, "model", None) is None:
         raise HTTPException(
             status_code=503, 
             detail="El servicio de IA no está configurado o la API Key es inválida."
         )
+    return ia
+
+@app.post("/preguntar", tags=["Asistente IA"])
+async def preguntar_a_biblioteca(consulta: schemas.ConsultaBase):
+    # 1. Buscar fragmentos relevantes
+    contexto, fuentes = await recuperar_contexto(consulta.pregunta)
+
+    # 2. Generar respuesta con Gemini
+    ia = await obtener_servicio_ia()
+    prompt = ia.construir_prompt_rag(consulta.pregunta, contexto)
 
     try:
-        respuesta = servicio_ia.model.generate_content(prompt)
-        return {"respuesta": respuesta.text, "fuentes": resultados.get("metadatas", []) if contexto else []}
+        async with limitador("gemini"):
+            respuesta = await ia.generar_async(prompt)
+        return {"respuesta": respuesta, "fuentes": fuentes if contexto else []}
     except Exception as e:
         logger.error(f"Error generando contenido con Gemini: {e}")
         raise HTTPException(status_code=500, detail="Error interno al procesar la respuesta de la IA.")
+
+@app.post("/preguntar/stream", tags=["Asistente IA"])
+async def preguntar_a_biblioteca_stream(consulta: schemas.ConsultaBase):
+    """Respuesta RAG como Server-Sent Events.
+
+    Orden de eventos: "fuentes" (antes de cualquier token), "token" por cada
+    parte generada por Gemini y "fin". Si Gemini falla a mitad se emite "error".
+    """
+    ia = await obtener_servicio_ia()
+    contexto, fuentes = await recuperar_contexto(consulta.pregunta)
+    prompt = ia.construir_prompt_rag(consulta.pregunta, contexto)
+
+    async def eventos():
+        yield evento_sse("fuentes", fuentes if contexto else [])
+        try:
+            async with limitador("gemini"):
+                async for texto in ia.generar_stream_async(prompt):
+                    yield evento_sse("token", {"texto": texto})
+        except Exception as e:
+            logger.error(f"Error generando contenido con Gemini: {e}")
+            yield evento_sse("error", {"detail": "Error interno al procesar la respuesta de la IA."})
+            return
+        yield evento_sse("fin", {})
+
+    return StreamingResponse(eventos(), media_type="text/event-stream", headers=CABECERAS_SSE)
@@ -0,0 +1,129 @@
+import os
+import time
+import logging
+import threading
+from typing import Any, Callable, Dict, List, Optional, Tuple
+from database import SessionLocal
+from models import MetadatosDrive
+from persistencia_masiva import borrar_en, insertar_o_actualizar
+
+logger = logging.getLogger("ArcaDrive")
+
+# Tras este tiempo el metadato se vuelve a pedir a Drive (la sincronización lo renueva antes)
+DRIVE_METADATA_TTL = int(os.getenv("DRIVE_METADATA_TTL", str(6 * 3600)))
+
+CAMPOS = ("nombre", "mime_type", "md5", "tamano_bytes", "modificado", "carpeta_id")
+
+def desde_drive(archivo: Dict[str, Any]) -> Dict[str, Any]:
+    """Convierte un recurso File de la API de Drive a nuestras columnas."""
+    return {
+        "nombre": archivo.get("name"),
+        "mime_type": archivo.get("mimeType"),
+        "md5": archivo.get("md5Checksum"),
+        "tamano_bytes": int(archivo["size"]) if archivo.get("size") else None,
+        "modificado": archivo.get("modifiedTime"),
+        "carpeta_id": (archivo.get("parents") or [None])[0],
+    }
+
+class CacheMetadatosDrive:
+    """Metadatos de Drive en dos niveles: dict en memoria y tabla metadatos_drive.
+
+    La tabla se llena en bloque al listar la carpeta (sincronización), de modo que
+    abrir un libro ya sincronizado no hace ninguna llamada de metadatos a Drive.
+    Cuenta aperturas con acierto y con fallo y su latencia media.
+    """
+
+    def __init__(self, ttl_segundos: int = DRIVE_METADATA_TTL):
+        self.ttl_segundos = ttl_segundos
+        self._memoria: Dict[str, Tuple[float, Dict[str, Any]]] = {}  # file_id -> (consultado_en, metadatos)
+        self._lock = threading.Lock()
+        self._aperturas = {True: [0, 0.0], False: [0, 0.0]}  # acierto -> [n, segundos acumulados]
+
+    def _vigente(self, consultado_en: Optional[float]) -> bool:
+        return consultado_en is not None and time.time() - consultado_en < self.ttl_segundos
+
+    def obtener(self, file_id: str, consultar: Callable[[], Dict[str, Any]]) -> Tuple[Dict[str, Any], bool]:
+        """Metadatos del archivo y si salieron de la caché. Si no, llama a consultar() y los guarda."""
+        with self._lock:
+            entrada = self._memoria.get(file_id)
+        if entrada and self._vigente(entrada[0]):
+            return entrada[1], True
+
+        db = SessionLocal()
+        try:
+            fila = db.query(MetadatosDrive).filter(MetadatosDrive.file_id == file_id).first()
+            if fila and self._vigente(fila.consultado_en):
+                metadatos = {campo: getattr(fila, campo) for campo in CAMPOS}
+                with self._lock:
+                    self._memoria[file_id] = (fila.consultado_en, metadatos)
+                return metadatos, True
+        finally:
+            db.close()
+
+        archivo = consultar()
+        self.registrar([{**archivo, "id": file_id}])
+        return desde_drive(archivo), False
+
+    def registrar(self, archivos: List[Dict[str, Any]]):
+        """Guarda (upsert en bloque) los recursos File recibidos de Drive."""
+        if not archivos:
+            return
+        ahora = time.time()
+        filas = {a["id"]: {"file_id": a["id"], "consultado_en": ahora, **desde_drive(a)} for a in archivos if a.get("id")}
+
+        db = SessionLocal()
+        try:
+            insertar_o_actualizar(db, MetadatosDrive, list(filas.values()), claves=["file_id"])
+            db.commit()
+        except Exception as e:
+            # Es solo caché: si falla se volverá a pedir a Drive
+            db.rollback()
+            logger.warning(f"No se pudieron guardar metadatos de Drive: {e}")
+        finally:
+            db.close()
+
+        with self._lock:
+            for file_id, fila in filas.items():
+                self._memoria[file_id] = (ahora, {campo: fila[campo] for campo in CAMPOS})
+
+    def olvidar(self, file_ids):
+        """Quita archivos que ya no existen en Drive."""
+        file_ids = list(file_ids)
+        if not file_ids:
+            return
+        with self._lock:
+            for file_id in file_ids:
+                self._memoria.pop(file_id, None)
+        db = SessionLocal()
+        try:
+            borrar_en(db, MetadatosDrive.file_id, file_ids)
+            db.commit()
+        finally:
+            db.close()
+
+    def archivos_en_carpetas(self, carpeta_ids) -> List[str]:
+        """file_id de los archivos conocidos cuya carpeta padre está en carpeta_ids."""
+        carpeta_ids = list(carpeta_ids)
+        db = SessionLocal()
+        try:
+            file_ids = []
+            for desde in range(0, len(carpeta_ids), 500):
+                file_ids.extend(f for (f,) in db.query(MetadatosDrive.file_id).filter(
+                    MetadatosDrive.carpeta_id.in_(carpeta_ids[desde:desde + 500])))
+            return file_ids
+        finally:
+            db.close()
+
+    def registrar_apertura(self, acierto: bool, segundos: float):
+        with self._lock:
+            self._aperturas[acierto][0] += 1
+            self._aperturas[acierto][1] += segundos
+
+    def estadisticas(self) -> Dict[str, Any]:
+        with self._lock:
+            resultado = {"en_memoria": len(self._memoria), "ttl_segundos": self.ttl_segundos}
+            for acierto, prefijo in ((True, "acierto"), (False, "fallo")):
+                n, total = self._aperturas[acierto]
+                resultado[f"aperturas_{prefijo}"] = n
+                resultado[f"ms_medio_{prefijo}"] = round(total / n * 1000, 2) if n else 0.0
+            return resultado
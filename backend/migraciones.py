@@ -0,0 +1,116 @@
+"""Migraciones del esquema, versionadas con la clave schema_version de la tabla configuracion.
+
+Al arrancar se lee la versión (una consulta): si está al día no se hace nada más. Si no,
+se crean las tablas nuevas, se aplican en orden las migraciones pendientes y se crean
+los índices que falten. Cada migración es idempotente (comprueba antes de alterar), así
+que repetirla tras un fallo a medias, o sobre una base creada de cero, no hace nada.
+
+Para añadir una columna a una tabla existente: nueva función y nueva entrada en MIGRACIONES.
+"""
+from contextlib import contextmanager
+from typing import Dict
+from sqlalchemy import bindparam, inspect, text
+from database import engine, crear_indices_faltantes
+
+CLAVE_VERSION = "schema_version"
+# Claves de configuracion que necesita el arranque: se leen todas en la misma consulta
+CLAVE_HUELLA_NOTA_SISTEMA = "nota_sistema_huella"
+CLAVES_ARRANQUE = (CLAVE_VERSION, CLAVE_HUELLA_NOTA_SISTEMA)
+
+# Clave del pg_advisory_lock: dos workers que arrancan a la vez no migran los dos
+BLOQUEO_MIGRACIONES = 7_450_022
+
+def _anadir_columna(conn, tabla: str, columna: str, definicion: str):
+    if columna in {c["name"] for c in inspect(conn).get_columns(tabla)}:
+        return
+    print(f"⚠️ Aplicando migración: Añadiendo columna '{columna}' a {tabla}...")
+    conn.execute(text(f"ALTER TABLE {tabla} ADD COLUMN {columna} {definicion}"))
+
+def _notas_usuario_y_estado(conn):
+    _anadir_columna(conn, "notas", "es_favorita", "BOOLEAN DEFAULT FALSE")
+    _anadir_columna(conn, "notas", "es_sistema", "BOOLEAN DEFAULT FALSE")
+    _anadir_columna(conn, "notas", "user_id", "VARCHAR")
+
+def _metadatos_drive_carpeta(conn):
+    _anadir_columna(conn, "metadatos_drive", "carpeta_id", "VARCHAR")
+
+def _notas_version(conn):
+    _anadir_columna(conn, "notas", "version", "INTEGER NOT NULL DEFAULT 1")
+
+def _libros_fragmentado(conn):
+    # Las filas existentes quedan en FALSE: el siguiente escaneo fragmenta la biblioteca ya indexada
+    _anadir_columna(conn, "libros_digitales", "fragmentado", "BOOLEAN DEFAULT FALSE")
+
+# (versión, descripción, función): en orden y sin huecos
+MIGRACIONES = [
+    (1, "notas: es_favorita, es_sistema y user_id", _notas_usuario_y_estado),
+    (2, "metadatos_drive: carpeta_id", _metadatos_drive_carpeta),
+    (3, "notas: version (concurrencia optimista del autoguardado)", _notas_version),
+    (4, "libros_digitales: fragmentado (libro completo en el almacén vectorial)", _libros_fragmentado),
+]
+VERSION_ESQUEMA = MIGRACIONES[-1][0]
+
+def leer_estado() -> Dict[str, str]:
+    """Claves de arranque guardadas en configuracion ({} si la tabla aún no existe)."""
+    consulta = text("SELECT clave, valor FROM configuracion WHERE clave IN :claves") \
+        .bindparams(bindparam("claves", expanding=True))
+    try:
+        with engine.connect() as conn:
+            return dict(conn.execute(consulta, {"claves": list(CLAVES_ARRANQUE)}).all())
+    except Exception:
+        return {}
+
+def _version(estado: Dict[str, str]) -> int:
+    try:
+        return int(estado.get(CLAVE_VERSION) or 0)
+    except ValueError:
+        return 0
+
+@contextmanager
+def _bloqueo():
+    if engine.dialect.name != "postgresql":
+        yield
+        return
+    with engine.connect() as conn:
+        conn.execute(text("SELECT pg_advisory_lock(:clave)"), {"clave": BLOQUEO_MIGRACIONES})
+        try:
+            yield
+        finally:
+            conn.execute(text("SELECT pg_advisory_unlock(:clave)"), {"clave": BLOQUEO_MIGRACIONES})
+
+def _guardar_version(conn, version: int):
+    actualizadas = conn.execute(text("UPDATE configuracion SET valor = :valor WHERE clave = :clave"),
+                                {"clave": CLAVE_VERSION, "valor": str(version)}).rowcount
+    if not actualizadas:
+        conn.execute(text("INSERT INTO configuracion (clave, valor, descripcion) VALUES (:clave, :valor, :descripcion)"),
+                     {"clave": CLAVE_VERSION, "valor": str(version), "descripcion": "Versión del esquema (migraciones.py)"})
+
+def migrar() -> Dict[str, str]:
+    """Deja el esquema en VERSION_ESQUEMA. Devuelve las claves de arranque leídas (ya actualizadas)."""
+    estado = leer_estado()
+    if _version(estado) >= VERSION_ESQUEMA:
+        return estado
+
+    from models import Base
+    from busqueda import indice_busqueda, indice_notas
+    with _bloqueo():
+        # Otro proceso pudo terminar la migración mientras esperábamos el bloqueo
+        estado = leer_estado()
+        version = _version(estado)
+        if version < VERSION_ESQUEMA:
+            Base.metadata.create_all(bind=engine)
+            for numero, descripcion, migracion in MIGRACIONES:
+                if numero > version:
+                    print(f"🔧 Migración {numero}: {descripcion}")
+                    with engine.begin() as conn:
+                        migracion(conn)
+            # create_all no añade índices a tablas que ya existían
+            crear_indices_faltantes()
+            # Tablas de los índices de texto completo (FTS5 / tsvector), fuera del ORM
+            indice_busqueda.preparar()
+            indice_notas.preparar()
+            with engine.begin() as conn:
+                _guardar_version(conn, VERSION_ESQUEMA)
+            print(f"✅ Esquema de la base de datos en la versión {VERSION_ESQUEMA}")
+    estado[CLAVE_VERSION] = str(VERSION_ESQUEMA)
+    return estado
@@ -2,6 +2,8 @@ import json
 from sqlalchemy.orm import Session
 from database import engine, SessionLocal
 import models
+from persistencia_masiva import insertar_o_actualizar
+from busqueda import indice_busqueda
 from pathlib import Path
 
 def migrar_datos():
@@ -20,29 +22,31 @@ def migrar_datos():
         print(f"🚀 Migrando {len(datos)} registros...")
         
         # Obtener hashes existentes
-        hashes_db = {l.hash_md5 for l in db.query(models.LibroDigital.hash_md5).all()}
+        hashes_db = {h for (h,) in db.query(models.LibroDigital.hash_md5)}
         
-        registros_nuevos = 0
+        filas = []
         for item in datos:
             md5 = item.get("md5_hash")
             if md5 and md5 not in hashes_db:
-                nuevo_libro = models.LibroDigital(
-                    ruta=item.get("path"),
-                    nombre_archivo=item.get("filename"),
-                    titulo=Path(item.get("filename")).stem,
-                    formato=item.get("format"),
-                    tamano_bytes=item.get("size_bytes"),
-                    categoria=item.get("category", "General"),
-                    etiquetas=item.get("tags", ""),
-                    hash_md5=md5,
-                    num_paginas=item.get("page_count", 0),
-                    es_duplicado=item.get("is_duplicate", False)
-                )
-                db.add(nuevo_libro)
+                filas.append({
+                    "ruta": item.get("path"),
+                    "nombre_archivo": item.get("filename"),
+                    "titulo": Path(item.get("filename")).stem,
+                    "formato": item.get("format"),
+                    "tamano_bytes": item.get("size_bytes"),
+                    "categoria": item.get("category", "General"),
+                    "etiquetas": item.get("tags", ""),
+                    "hash_md5": md5,
+                    "num_paginas": item.get("page_count", 0),
+                    "es_duplicado": item.get("is_duplicate", False)
+                })
                 hashes_db.add(md5)
-                registros_nuevos += 1
         
+        # INSERT en bloque; las rutas ya migradas (ON CONFLICT) se ignoran
+        insertar_o_actualizar(db, models.LibroDigital, filas, claves=["ruta"], actualizar=[])
         db.commit()
+        indice_busqueda.reconciliar(db)
+        registros_nuevos = len(filas)
         print(f"✅ Migración completada. Se añadieron {registros_nuevos} libros nuevos.")
     except Exception as e:
         print(f"❌ Error durante la migración: {e}")
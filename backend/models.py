@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, Text, Boolean, DateTime, ForeignKey
+from sqlalchemy import Column, Integer, BigInteger, String, Text, Boolean, DateTime, Float, ForeignKey, UniqueConstraint, Index
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.sql import func
 import datetime
@@ -8,6 +8,12 @@ Base = declarative_base()
 class LibroDigital(Base):
     """Metadatos de libros en PDF, DOCX, EPUB, etc."""
     __tablename__ = "libros_digitales"
+    # Filtro + orden por título del listado paginado: la página sale directamente del índice
+    __table_args__ = (
+        Index("ix_libros_digitales_categoria_titulo", "categoria", "titulo"),
+        Index("ix_libros_digitales_autor_titulo", "autor", "titulo"),
+        Index("ix_libros_digitales_formato_titulo", "formato", "titulo"),
+    )
 
     id = Column(Integer, primary_key=True, index=True)
     ruta = Column(String, unique=True, index=True)
@@ -23,9 +29,35 @@ class LibroDigital(Base):
     descripcion = Column(Text)
     ubicacion_nube = Column(String)  # URL de Google Drive
     es_duplicado = Column(Boolean, default=False)
+    fragmentado = Column(Boolean, default=False)  # Fragmentos del libro completo ya confirmados en Chroma
     fecha_creacion = Column(DateTime(timezone=True), server_default=func.now())
     fecha_actualizacion = Column(DateTime(timezone=True), onupdate=func.now())
 
+class ManifiestoEscaneo(Base):
+    """Firma stat de cada archivo local ya hasheado (evita re-leer los que no cambiaron)."""
+    __tablename__ = "manifiesto_escaneo"
+
+    id = Column(Integer, primary_key=True, index=True)
+    ruta = Column(String, unique=True, index=True)  # Relativa a LIBRARY_PATH
+    tamano_bytes = Column(BigInteger)
+    mtime_ns = Column(BigInteger)
+    inodo = Column(BigInteger)
+    hash_md5 = Column(String, index=True)
+
+class MetadatosDrive(Base):
+    """Metadatos de archivos de Drive (se llenan al listar) para abrir libros sin llamar a files().get."""
+    __tablename__ = "metadatos_drive"
+
+    id = Column(Integer, primary_key=True, index=True)
+    file_id = Column(String, unique=True, index=True)
+    nombre = Column(String)
+    mime_type = Column(String)
+    md5 = Column(String)
+    tamano_bytes = Column(BigInteger)
+    modificado = Column(String)  # modifiedTime de Drive (RFC 3339)
+    carpeta_id = Column(String, index=True)  # Carpeta padre en Drive (para bajas de carpetas enteras)
+    consultado_en = Column(Float)  # time.time() de la última lectura en Drive (para el TTL)
+
 class LibroFisico(Base):
     """Gestión de biblioteca física personal."""
     __tablename__ = "libros_fisicos"
@@ -47,6 +79,10 @@ class LibroFisico(Base):
 class Nota(Base):
     """Contenido del Notebook (Cuaderno de Estudio)."""
     __tablename__ = "notas"
+    # Listado del cuaderno y sincronización incremental: notas de un usuario por fecha de cambio
+    __table_args__ = (
+        Index("ix_notas_user_id_fecha_actualizacion", "user_id", "fecha_actualizacion", "id"),
+    )
 
     id = Column(Integer, primary_key=True, index=True)
     titulo = Column(String, index=True)
@@ -58,6 +94,34 @@ class Nota(Base):
     es_sistema = Column(Boolean, default=False) # Nota fija/global para todos
     fecha_creacion = Column(DateTime(timezone=True), server_default=func.now())
     fecha_actualizacion = Column(DateTime(timezone=True), onupdate=func.now(), server_default=func.now())
+    # Concurrencia optimista: cada UPDATE del ORM exige la versión leída (WHERE version = ?) y la incrementa
+    version = Column(Integer, nullable=False, default=1, server_default="1")
+
+    __mapper_args__ = {"version_id_col": version}
+
+class NotaEliminada(Base):
+    """Lápida de una nota borrada: la sincronización incremental avisa al cliente para que la quite."""
+    __tablename__ = "notas_eliminadas"
+    __table_args__ = (
+        Index("ix_notas_eliminadas_user_id_fecha", "user_id", "fecha_eliminacion"),
+    )
+
+    id = Column(Integer, primary_key=True, index=True)
+    nota_id = Column(Integer)
+    user_id = Column(String, nullable=True)
+    fecha_eliminacion = Column(DateTime(timezone=True), server_default=func.now())
+
+class DefinicionDiccionario(Base):
+    """Definiciones generadas por IA, cacheadas por término normalizado, perspectiva y versión del prompt."""
+    __tablename__ = "definiciones_diccionario"
+    __table_args__ = (UniqueConstraint("termino", "perspectiva", "version_prompt", name="uq_definicion"),)
+
+    id = Column(Integer, primary_key=True, index=True)
+    termino = Column(String, index=True)  # Normalizado (minúsculas, sin tildes)
+    perspectiva = Column(String)
+    version_prompt = Column(String)
+    definicion = Column(Text)
+    fecha_creacion = Column(DateTime(timezone=True), server_default=func.now())
 
 class Configuracion(Base):
     """Preferencias del usuario y estado global."""
@@ -0,0 +1,17 @@
+import json
+import base64
+
+# Paginación por cursor (keyset): el cursor es opaco para el cliente y codifica
+# (valor de la columna de orden, id) de la última fila devuelta.
+
+def codificar_cursor(valor, id_fila: int) -> str:
+    crudo = json.dumps([valor, id_fila], ensure_ascii=False, default=str).encode("utf-8")
+    return base64.urlsafe_b64encode(crudo).decode("ascii").rstrip("=")
+
+def decodificar_cursor(cursor: str):
+    """(valor, id) del cursor. ValueError si está mal formado."""
+    try:
+        valor, id_fila = json.loads(base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)))
+        return valor, int(id_fila)
+    except Exception:
+        raise ValueError("Cursor inválido")
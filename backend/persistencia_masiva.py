@@ -0,0 +1,89 @@
+import sqlite3
+from typing import Any, Dict, Iterable, List, Optional, Sequence
+from sqlalchemy import insert
+from sqlalchemy.orm import Session
+
+# Parámetros por sentencia: SQLite 32766 (999 antes de 3.32), Postgres 65535. Con margen.
+LIMITE_PARAMETROS = {
+    "sqlite": 32000 if sqlite3.sqlite_version_info >= (3, 32) else 990,
+    "postgresql": 60000,
+}
+LIMITE_PARAMETROS_DEFECTO = 990
+# Filas por sentencia y valores por IN (...): más allá apenas se gana y la sentencia crece
+TAMANO_LOTE = 500
+
+def en_lotes(valores: Sequence, tamano: int = TAMANO_LOTE) -> Iterable[Sequence]:
+    for desde in range(0, len(valores), tamano):
+        yield valores[desde:desde + tamano]
+
+def _dialecto(db: Session) -> str:
+    return db.get_bind().dialect.name
+
+def _insert_con_conflicto(db: Session, modelo):
+    """insert() del dialecto con soporte de ON CONFLICT, o None si el motor no lo tiene."""
+    dialecto = _dialecto(db)
+    if dialecto == "sqlite":
+        from sqlalchemy.dialects.sqlite import insert as insert_dialecto
+    elif dialecto == "postgresql":
+        from sqlalchemy.dialects.postgresql import insert as insert_dialecto
+    else:
+        return None
+    return insert_dialecto(modelo)
+
+def _filas_por_lote(db: Session, filas: List[Dict[str, Any]]) -> int:
+    limite = LIMITE_PARAMETROS.get(_dialecto(db), LIMITE_PARAMETROS_DEFECTO)
+    return max(1, min(TAMANO_LOTE, limite // max(len(filas[0]), 1)))
+
+def borrar_en(db: Session, columna, valores, *filtros) -> int:
+    """DELETE ... WHERE columna IN (...) en bloques. Devuelve las filas borradas. No hace commit."""
+    valores = list(valores)
+    borradas = 0
+    for lote in en_lotes(valores):
+        borradas += db.query(columna.class_).filter(columna.in_(lote), *filtros) \
+            .delete(synchronize_session=False)
+    return borradas
+
+def insertar_o_actualizar(db: Session, modelo, filas: List[Dict[str, Any]], claves: Sequence[str],
+                          actualizar: Optional[Sequence[str]] = None, extra_actualizar: Optional[Dict] = None):
+    """INSERT ... ON CONFLICT (claves) DO UPDATE en bloques (executemany). No hace commit.
+
+    actualizar: columnas que se sobrescriben con el valor nuevo si la fila ya existe;
+    None = todas menos las claves, [] = DO NOTHING (solo inserta las que faltan).
+    extra_actualizar: valores fijos para el UPDATE (p.ej. fecha_actualizacion=func.now()).
+    Las claves deben tener un índice único. Todas las filas deben traer las mismas columnas.
+    """
+    if not filas:
+        return
+    if actualizar is None:
+        actualizar = [c for c in filas[0] if c not in claves]
+
+    sentencia = _insert_con_conflicto(db, modelo)
+    if sentencia is None:
+        return _insertar_o_actualizar_generico(db, modelo, filas, claves, actualizar)
+
+    if actualizar or extra_actualizar:
+        sentencia = sentencia.on_conflict_do_update(
+            index_elements=list(claves),
+            set_={**{c: sentencia.excluded[c] for c in actualizar}, **(extra_actualizar or {})}
+        )
+    else:
+        sentencia = sentencia.on_conflict_do_nothing(index_elements=list(claves))
+
+    for lote in en_lotes(filas, _filas_por_lote(db, filas)):
+        db.execute(sentencia, list(lote))
+
+def _insertar_o_actualizar_generico(db: Session, modelo, filas, claves, actualizar):
+    """Otros motores: una consulta por lote para separar altas de cambios y dos executemany."""
+    if len(claves) != 1:
+        raise ValueError("Sin ON CONFLICT solo se admite una clave única")
+    clave = claves[0]
+    columna_clave = getattr(modelo, clave)
+    for lote in en_lotes(filas, _filas_por_lote(db, filas)):
+        existentes = dict(db.query(columna_clave, modelo.id).filter(columna_clave.in_([f[clave] for f in lote])))
+        altas = [f for f in lote if f[clave] not in existentes]
+        if altas:
+            db.execute(insert(modelo), altas)
+        if actualizar:
+            db.bulk_update_mappings(modelo, [
+                {"id": existentes[f[clave]], **{c: f[c] for c in actualizar}} for f in lote if f[clave] in existentes
+            ])
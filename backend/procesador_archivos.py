@@ -0,0 +1,230 @@
+import os
+import re
+import hashlib
+import logging
+import posixpath
+import zipfile
+from collections import deque
+from html.parser import HTMLParser
+from pathlib import Path
+from typing import Iterator, Tuple, Dict, Any
+from xml.etree import ElementTree
+
+logger = logging.getLogger("ArcaProcesador")
+
+# Extensiones que la biblioteca local sabe indexar
+EXTENSIONES_SOPORTADAS = {".pdf", ".docx", ".doc", ".epub", ".pptx", ".ppt", ".txt", ".jpg", ".png", ".jpeg"}
+
+# Lecturas de 1 MB: con 4 KB el MD5 de un PDF grande hacía miles de syscalls
+TAMANO_BLOQUE_HASH = 1024 * 1024
+
+# Fragmentación para RAG. "Tokens" aproximados como palabras separadas por espacios
+TOKENS_POR_FRAGMENTO = int(os.getenv("RAG_CHUNK_TOKENS", "400"))
+TOKENS_SOLAPAMIENTO = int(os.getenv("RAG_CHUNK_OVERLAP", "60"))
+
+# DOCX y TXT no tienen páginas: agrupamos en "páginas" lógicas de este tamaño
+PARRAFOS_POR_PAGINA_DOCX = 30
+CARACTERES_POR_PAGINA_TXT = 16 * 1024
+
+class _ExtractorHTML(HTMLParser):
+    """Texto plano de un capítulo XHTML de EPUB (ignora <script>/<style>)."""
+
+    def __init__(self):
+        super().__init__()
+        self.partes = []
+        self._ignorar = 0
+
+    def handle_starttag(self, tag, attrs):
+        if tag in ("script", "style"):
+            self._ignorar += 1
+
+    def handle_endtag(self, tag):
+        if tag in ("script", "style") and self._ignorar:
+            self._ignorar -= 1
+        elif tag in ("p", "div", "br", "li", "h1", "h2", "h3", "h4", "h5", "h6"):
+            self.partes.append("\n")
+
+    def handle_data(self, data):
+        if not self._ignorar:
+            self.partes.append(data)
+
+class ProcesadorArchivos:
+    @staticmethod
+    def calcular_md5(ruta_archivo: Path) -> str:
+        hash_md5 = hashlib.md5()
+        with open(ruta_archivo, "rb") as f:
+            for chunk in iter(lambda: f.read(TAMANO_BLOQUE_HASH), b""):
+                hash_md5.update(chunk)
+        return hash_md5.hexdigest()
+
+    @staticmethod
+    def extraer_texto(ruta_archivo: Path, max_paginas: int = 5) -> str:
+        ext = ruta_archivo.suffix.lower()
+        texto = ""
+        try:
+            if ext == ".pdf":
+                from pypdf import PdfReader
+                reader = PdfReader(ruta_archivo)
+                for i in range(min(max_paginas, len(reader.pages))):
+                    texto += reader.pages[i].extract_text() + "\n"
+            elif ext == ".docx":
+                from docx import Document
+                doc = Document(ruta_archivo)
+                for para in doc.paragraphs[:50]: # Unas cuantas líneas
+                    texto += para.text + "\n"
+            elif ext == ".txt":
+                with open(ruta_archivo, "r", encoding="utf-8", errors="ignore") as f:
+                    texto = f.read(5000)
+            elif ext in (".epub", ".pptx"):
+                for num, pagina in ProcesadorArchivos.iterar_paginas(ruta_archivo):
+                    if num > max_paginas:
+                        break
+                    texto += pagina + "\n"
+        except Exception as e:
+            logger.error(f"Error extrayendo texto de {ruta_archivo}: {e}")
+        return texto.strip()
+
+    @staticmethod
+    def clasificar(texto: str) -> str:
+        """Clasificación simple por palabras clave (mejorable con IA después)."""
+        texto = texto.lower()
+        if "manualidad" in texto or "niños" in texto:
+            return "Escuela Dominical"
+        if "teología" in texto or "doctrina" in texto:
+            return "Seminario"
+        return "General"
+
+    @staticmethod
+    def iterar_paginas(ruta_archivo: Path) -> Iterator[Tuple[int, str]]:
+        """Recorre el documento completo página a página como generador: (num_pagina, texto).
+
+        Para EPUB la "página" es el capítulo del spine, para PPTX la diapositiva.
+        """
+        ext = ruta_archivo.suffix.lower()
+        # Los lectores (pypdf, python-docx, python-pptx) se importan al usarlos: no pesan en el arranque de la API
+        if ext == ".pdf":
+            from pypdf import PdfReader
+            reader = PdfReader(ruta_archivo)
+            for num, pagina in enumerate(reader.pages, start=1):
+                yield num, pagina.extract_text() or ""
+        elif ext == ".docx":
+            from docx import Document
+            doc = Document(ruta_archivo)
+            bloque, num = [], 1
+            for para in doc.paragraphs:
+                bloque.append(para.text)
+                if len(bloque) >= PARRAFOS_POR_PAGINA_DOCX:
+                    yield num, "\n".join(bloque)
+                    bloque, num = [], num + 1
+            if bloque:
+                yield num, "\n".join(bloque)
+        elif ext == ".pptx":
+            from pptx import Presentation
+            presentacion = Presentation(ruta_archivo)
+            for num, diapositiva in enumerate(presentacion.slides, start=1):
+                textos = [forma.text_frame.text for forma in diapositiva.shapes if forma.has_text_frame]
+                yield num, "\n".join(textos)
+        elif ext == ".epub":
+            yield from ProcesadorArchivos._iterar_epub(ruta_archivo)
+        elif ext == ".txt":
+            with open(ruta_archivo, "r", encoding="utf-8", errors="ignore") as f:
+                num, resto = 1, ""
+                for bloque in iter(lambda: f.read(CARACTERES_POR_PAGINA_TXT), ""):
+                    texto = resto + bloque
+                    # Cortamos en el último espacio para no partir palabras entre páginas
+                    corte = max(texto.rfind(" "), texto.rfind("\n"))
+                    if corte <= 0:
+                        if len(texto) < 2 * CARACTERES_POR_PAGINA_TXT:
+                            resto = texto
+                            continue
+                        # Sin espacios ni saltos: corte duro, o el archivo entero acabaría en resto
+                        corte = CARACTERES_POR_PAGINA_TXT
+                    resto = texto[corte:]
+                    yield num, texto[:corte]
+                    num += 1
+                if resto.strip():
+                    yield num, resto
+
+    @staticmethod
+    def _iterar_epub(ruta_archivo: Path) -> Iterator[Tuple[int, str]]:
+        with zipfile.ZipFile(ruta_archivo) as epub:
+            contenedor = ElementTree.fromstring(epub.read("META-INF/container.xml"))
+            ruta_opf = next(e.get("full-path") for e in contenedor.iter() if e.tag.endswith("rootfile"))
+            opf = ElementTree.fromstring(epub.read(ruta_opf))
+            base = posixpath.dirname(ruta_opf)
+
+            manifiesto = {e.get("id"): e.get("href") for e in opf.iter() if e.tag.endswith("}item")}
+            spine = [e.get("idref") for e in opf.iter() if e.tag.endswith("itemref")]
+            for num, idref in enumerate(spine, start=1):
+                href = manifiesto.get(idref)
+                if not href:
+                    continue
+                extractor = _ExtractorHTML()
+                extractor.feed(epub.read(posixpath.join(base, href)).decode("utf-8", errors="ignore"))
+                yield num, "".join(extractor.partes)
+
+    @staticmethod
+    def fragmentar(paginas: Iterator[Tuple[int, str]], tokens_por_fragmento: int = TOKENS_POR_FRAGMENTO,
+                   solapamiento: int = TOKENS_SOLAPAMIENTO) -> Iterator[Dict[str, Any]]:
+        """Corta un flujo de páginas en fragmentos solapados de tamaño fijo.
+
+        Solo mantiene en memoria la ventana actual (tokens_por_fragmento palabras),
+        así que el consumo es el mismo para un folleto que para una enciclopedia.
+        Cada fragmento lleva su índice, su offset (en tokens desde el inicio del
+        documento) y el rango de páginas que cubre.
+        """
+        paso = max(tokens_por_fragmento - solapamiento, 1)
+        ventana = deque()  # (palabra, num_pagina)
+        indice, offset, emitidos_hasta = 0, 0, 0
+
+        def emitir():
+            return {
+                "indice": indice,
+                "offset": offset,
+                "texto": " ".join(palabra for palabra, _ in ventana),
+                "pagina_inicio": ventana[0][1],
+                "pagina_fin": ventana[-1][1],
+            }
+
+        for num_pagina, texto in paginas:
+            for coincidencia in re.finditer(r"\S+", texto):
+                ventana.append((coincidencia.group(), num_pagina))
+                if len(ventana) >= tokens_por_fragmento:
+                    yield emitir()
+                    emitidos_hasta = offset + len(ventana)
+                    indice += 1
+                    offset += paso
+                    for _ in range(paso):
+                        ventana.popleft()
+
+        # Cola final: solo si trae palabras que no salieron en el fragmento anterior
+        if ventana and offset + len(ventana) > emitidos_hasta:
+            yield emitir()
+
+    @staticmethod
+    def fragmentar_documento(ruta_archivo: Path, **opciones) -> Iterator[Dict[str, Any]]:
+        """Fragmentos del documento completo (ver iterar_paginas y fragmentar)."""
+        return ProcesadorArchivos.fragmentar(ProcesadorArchivos.iterar_paginas(ruta_archivo), **opciones)
+
+    @staticmethod
+    def ingerir_documento(ruta_archivo: Path, id_libro: str, metadatos: Dict[str, Any], sumidero) -> int:
+        """Envía todos los fragmentos del documento a un sumidero con método agregar().
+
+        El sumidero suele ser un BufferIngesta de ServicioVectorial. Devuelve el
+        número de fragmentos entregados.
+        """
+        total = 0
+        for fragmento in ProcesadorArchivos.fragmentar_documento(ruta_archivo):
+            sumidero.agregar(
+                id_libro=id_libro,
+                texto=fragmento["texto"],
+                metadatos={
+                    **metadatos,
+                    "fragmento": fragmento["indice"],
+                    "offset": fragmento["offset"],
+                    "pagina_inicio": fragmento["pagina_inicio"],
+                    "pagina_fin": fragmento["pagina_fin"],
+                }
+            )
+            total += 1
+        return total
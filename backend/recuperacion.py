@@ -0,0 +1,243 @@
+import os
+import math
+import logging
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, List, Sequence
+from database import SessionLocal
+from busqueda import indice_busqueda, analizar, coincidencias, mejor_ventana, plegar, terminos_consulta
+from procesador_archivos import ProcesadorArchivos
+
+logger = logging.getLogger("ArcaRAG")
+
+# Tokens de contexto que se envían a Gemini (estimados, ver estimar_tokens)
+RAG_PRESUPUESTO_TOKENS = int(os.getenv("RAG_PRESUPUESTO_TOKENS", "1500"))
+# Candidatos que aporta cada recuperador (léxico y vectorial) antes de fusionar
+RAG_CANDIDATOS = int(os.getenv("RAG_CANDIDATOS", "20"))
+# Constante de Reciprocal Rank Fusion: 60 es el valor habitual, suaviza el peso del primer puesto
+RRF_K = int(os.getenv("RAG_RRF_K", "60"))
+# Palabras que se conservan de cada fragmento: la zona con más términos de la pregunta.
+# Un fragmento entero (~400 palabras) ocupa ~600 tokens; recortado caben más fuentes.
+RAG_PALABRAS_PASAJE = int(os.getenv("RAG_PALABRAS_PASAJE", "150"))
+
+LIBROS_LEXICOS = 10       # Libros que se trocean en pasajes para el ranking léxico
+PASAJES_POR_LIBRO = 3     # Para que un libro muy citado no acapare la lista léxica
+CARACTERES_POR_TOKEN = 4  # Estimación para español con el tokenizador de Gemini
+MIN_TOKENS_PASAJE = 60    # Un pasaje recortado más corto que esto no aporta
+UMBRAL_DUPLICADO = 0.8    # Fracción de 5-gramas ya vistos a partir de la cual un pasaje se descarta
+BM25_K1, BM25_B = 1.2, 0.75
+_PUNTUACION = ".,;:¿?¡!\"'()[]«»“”‘’—-…"
+
+_hilos = ThreadPoolExecutor(max_workers=4, thread_name_prefix="arca-rag")
+
+def estimar_tokens(texto: str) -> int:
+    return math.ceil(len(texto) / CARACTERES_POR_TOKEN)
+
+def fusionar_rrf(listas: Dict[str, List[Dict[str, Any]]], k: int = RRF_K) -> List[Dict[str, Any]]:
+    """Reciprocal Rank Fusion: puntuación = suma de 1 / (k + puesto) en cada lista.
+
+    Solo usa los puestos, no las puntuaciones (bm25 y coseno no son comparables).
+    Los candidatos se identifican por "clave"; se conserva el primero visto y se
+    anotan los recuperadores que lo encontraron en "origen".
+    """
+    fusionados: Dict[Any, Dict[str, Any]] = {}
+    for nombre, candidatos in listas.items():
+        for puesto, candidato in enumerate(candidatos, start=1):
+            actual = fusionados.setdefault(candidato["clave"], {**candidato, "rrf": 0.0, "origen": []})
+            actual["rrf"] += 1.0 / (k + puesto)
+            actual["origen"].append(nombre)
+    return sorted(fusionados.values(), key=lambda c: -c["rrf"])
+
+def _tejas(palabras: List[str], n: int = 5) -> set:
+    """5-gramas (plegados) de un pasaje, para detectar casi duplicados entre libros."""
+    palabras = [plegar(p) for p in palabras]
+    return {hash(tuple(palabras[i:i + n])) for i in range(max(len(palabras) - n + 1, 1))}
+
+def recortar(palabras: List[str], terminos: Sequence[str], ancho: int = RAG_PALABRAS_PASAJE) -> int:
+    """Inicio de la ventana de `ancho` palabras con más términos de la pregunta (0 si no hay)."""
+    if len(palabras) <= ancho:
+        return 0
+    aciertos = coincidencias([p.strip(_PUNTUACION) for p in palabras], terminos)
+    if not aciertos:
+        return 0
+    # Algo de contexto antes del primer acierto, sin salirse del fragmento
+    return max(0, min(mejor_ventana(aciertos, ancho) - ancho // 10, len(palabras) - ancho))
+
+def empaquetar(candidatos: List[Dict[str, Any]], presupuesto: int = RAG_PRESUPUESTO_TOKENS,
+               terminos: Sequence[str] = (), ancho: int = RAG_PALABRAS_PASAJE) -> Dict[str, Any]:
+    """Arma el contexto en orden de relevancia sin pasar de `presupuesto` tokens.
+
+    - De cada fragmento se toman `ancho` palabras alrededor de los términos de la pregunta.
+    - Fragmentos solapados del mismo libro (ventanas con solapamiento, o el mismo
+      pasaje hallado por los dos recuperadores) solo aportan las palabras nuevas.
+    - Pasajes casi idénticos de libros distintos (ediciones, copias) se descartan.
+    - El último pasaje que no cabe entero se recorta si queda sitio suficiente.
+    """
+    cubiertos: Dict[str, List[tuple]] = {}  # id_libro -> rangos [inicio, fin) de tokens ya incluidos
+    vistas: set = set()
+    partes, fuentes, usados, descartados = [], [], 0, 0
+
+    for candidato in candidatos:
+        palabras = candidato["texto"].split()
+        inicio = candidato.get("offset")
+        desde = recortar(palabras, terminos, ancho)
+        palabras = palabras[desde:desde + ancho]
+        if inicio is not None:
+            inicio += desde
+        rangos = cubiertos.setdefault(candidato["id_libro"], [])
+        if inicio is not None:
+            nuevas = [i for i in range(len(palabras)) if not any(a <= inicio + i < b for a, b in rangos)]
+            if not nuevas:
+                descartados += 1
+                continue
+            if len(nuevas) < len(palabras):
+                # Tramos contiguos de palabras nuevas; entre tramos, "…" marca lo ya incluido
+                tramos, previa = [], None
+                for i in nuevas:
+                    if previa is None or i != previa + 1:
+                        tramos.append([])
+                    tramos[-1].append(palabras[i])
+                    previa = i
+                palabras = [p for tramo in tramos for p in tramo + ["…"]][:-1]
+        tejas = _tejas(palabras)
+        if len(tejas & vistas) >= UMBRAL_DUPLICADO * len(tejas):
+            descartados += 1
+            continue
+
+        paginas = ""
+        if candidato.get("pagina_inicio"):
+            fin = candidato.get("pagina_fin") or candidato["pagina_inicio"]
+            paginas = f", pág. {candidato['pagina_inicio']}" + (f"-{fin}" if fin != candidato["pagina_inicio"] else "")
+        cabecera = f"[{len(partes) + 1}] {candidato.get('titulo') or 'Sin título'}{paginas}"
+        cuerpo = " ".join(palabras)
+        tokens = estimar_tokens(cabecera) + estimar_tokens(cuerpo) + 1
+        if usados + tokens > presupuesto:
+            restante = presupuesto - usados - estimar_tokens(cabecera) - 1
+            if restante < MIN_TOKENS_PASAJE:
+                break
+            cuerpo = cuerpo[:restante * CARACTERES_POR_TOKEN - 2].rsplit(" ", 1)[0] + " …"
+            tokens = estimar_tokens(cabecera) + estimar_tokens(cuerpo) + 1
+
+        partes.append(f"{cabecera}\n{cuerpo}")
+        usados += tokens
+        vistas |= tejas
+        if inicio is not None:
+            rangos.append((inicio, inicio + len(palabras)))
+        fuentes.append({
+            "titulo": candidato.get("titulo"),
+            "autor": candidato.get("autor"),
+            "id_libro": candidato["id_libro"],
+            "pagina_inicio": candidato.get("pagina_inicio"),
+            "pagina_fin": candidato.get("pagina_fin"),
+            "origen": candidato["origen"],
+            "rrf": round(candidato["rrf"], 5),
+        })
+        if usados >= presupuesto:
+            break
+
+    return {"contexto": "\n\n".join(partes), "fuentes": fuentes, "tokens": usados, "descartados": descartados}
+
+class RecuperadorHibrido:
+    """Recuperación para el asistente: BM25 (índice de texto completo) + vectores, fusionados con RRF.
+
+    Las dos búsquedas corren en paralelo; si una falla se sigue con la otra. Los
+    candidatos de ambas se identifican por (libro, offset en tokens): el índice de
+    texto guarda el inicio de cada libro y se trocea con el mismo fragmentador que la
+    ingesta vectorial, así que un mismo pasaje tiene la misma clave en las dos listas.
+    """
+
+    def __init__(self, servicio_vectorial=None, indice=indice_busqueda):
+        self.servicio_vectorial = servicio_vectorial
+        self.indice = indice
+
+    def candidatos_vectoriales(self, pregunta: str, n: int = RAG_CANDIDATOS) -> List[Dict[str, Any]]:
+        if not self.servicio_vectorial or not self.servicio_vectorial.backend:
+            return []
+        resultados = self.servicio_vectorial.buscar_similitud(pregunta, n)
+        if not resultados or not resultados.get("documents"):
+            return []
+        candidatos = []
+        for id_fragmento, documento, metadatos in zip(resultados["ids"][0], resultados["documents"][0],
+                                                      resultados["metadatas"][0]):
+            metadatos = metadatos or {}
+            id_libro = str(metadatos.get("id_libro") or id_fragmento)
+            offset = metadatos.get("offset")
+            candidatos.append({
+                "clave": (id_libro, offset) if offset is not None else id_fragmento,
+                "id_libro": id_libro,
+                "offset": offset,
+                "texto": documento or "",
+                "titulo": metadatos.get("titulo"),
+                "autor": metadatos.get("autor"),
+                "pagina_inicio": metadatos.get("pagina_inicio"),
+                "pagina_fin": metadatos.get("pagina_fin"),
+            })
+        return candidatos
+
+    def candidatos_lexicos(self, pregunta: str, n: int = RAG_CANDIDATOS) -> List[Dict[str, Any]]:
+        """Pasajes de los libros mejor puntuados por el índice, ordenados por BM25 a nivel de pasaje."""
+        terminos = set(terminos_consulta(pregunta))
+        if not terminos:
+            return []
+        db = SessionLocal()
+        try:
+            libros = self.indice.documentos(db, pregunta, limite=LIBROS_LEXICOS)
+        finally:
+            db.close()
+
+        pasajes = []
+        for libro in libros:
+            for fragmento in ProcesadorArchivos.fragmentar(iter([(None, libro.original)])):
+                raices = analizar(fragmento["texto"])
+                pasajes.append({
+                    "clave": (libro.hash_md5 or str(libro.id), fragmento["offset"]),
+                    "id_libro": libro.hash_md5 or str(libro.id),
+                    "offset": fragmento["offset"],
+                    "texto": fragmento["texto"],
+                    "titulo": libro.titulo,
+                    "autor": libro.autor,
+                    "_frecuencias": Counter(r for r in raices if r in terminos),
+                    "_longitud": len(raices),
+                })
+        if not pasajes:
+            return []
+
+        # BM25 sobre los pasajes candidatos (idf calculado entre ellos)
+        media = sum(p["_longitud"] for p in pasajes) / len(pasajes) or 1
+        df = Counter(t for p in pasajes for t in p["_frecuencias"])
+        idf = {t: math.log(1 + (len(pasajes) - d + 0.5) / (d + 0.5)) for t, d in df.items()}
+        for p in pasajes:
+            norma = BM25_K1 * (1 - BM25_B + BM25_B * p["_longitud"] / media)
+            p["_bm25"] = sum(idf[t] * tf * (BM25_K1 + 1) / (tf + norma) for t, tf in p.pop("_frecuencias").items())
+            del p["_longitud"]
+
+        por_libro, candidatos = Counter(), []
+        for p in sorted(pasajes, key=lambda p: -p["_bm25"]):
+            if p["_bm25"] <= 0 or por_libro[p["id_libro"]] >= PASAJES_POR_LIBRO:
+                continue
+            por_libro[p["id_libro"]] += 1
+            del p["_bm25"]
+            candidatos.append(p)
+            if len(candidatos) >= n:
+                break
+        return candidatos
+
+    def recuperar(self, pregunta: str, presupuesto: int = RAG_PRESUPUESTO_TOKENS,
+                  modo: str = "hibrido") -> Dict[str, Any]:
+        """Contexto empaquetado para la pregunta. modo: "hibrido", "lexico" o "vectorial"."""
+        lexico = _hilos.submit(self.candidatos_lexicos, pregunta) if modo in ("hibrido", "lexico") else None
+        listas: Dict[str, List[Dict[str, Any]]] = {}
+        if modo in ("hibrido", "vectorial"):
+            try:
+                listas["vectorial"] = self.candidatos_vectoriales(pregunta)
+            except Exception as e:
+                logger.error(f"Error en búsqueda vectorial: {e}")
+        if lexico is not None:
+            try:
+                listas["lexico"] = lexico.result()
+            except Exception as e:
+                logger.error(f"Error en búsqueda léxica: {e}")
+
+        paquete = empaquetar(fusionar_rrf(listas), presupuesto, terminos_consulta(pregunta))
+        paquete["candidatos"] = {nombre: len(candidatos) for nombre, candidatos in listas.items()}
+        return paquete
@@ -0,0 +1,109 @@
+"""Camino rápido para respuestas JSON grandes (catálogo, biblioteca física, cuaderno).
+
+En vez de objetos ORM validados uno a uno por pydantic y codificados con json, se piden
+solo las columnas necesarias como tuplas y se codifican directamente a bytes con orjson.
+El cuerpo se comprime (brotli o gzip) según el Accept-Encoding del cliente.
+
+orjson y brotli son opcionales: sin orjson se usa json (más lento, mismo resultado) y sin
+brotli solo se ofrece gzip.
+"""
+import os
+import gzip
+import json
+from datetime import date, datetime, time, timezone
+from decimal import Decimal
+from typing import Any, Dict, Iterable, Optional, Sequence
+from fastapi import Request, Response
+from pydantic import BaseModel
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+# Por debajo de este tamaño comprimir cuesta más de lo que ahorra
+COMPRIMIR_DESDE_BYTES = int(os.getenv("RESPUESTA_COMPRIMIR_DESDE", "1024"))
+# Respuestas que se comprimen en cada petición: nivel bajo (gzip 6 tarda ~4 veces más que
+# gzip 1 y cuesta más que serializar). Las de la caché de lectura se comprimen una sola vez
+# y se sirven muchas: ahí compensa comprimir más.
+NIVEL_GZIP = int(os.getenv("RESPUESTA_NIVEL_GZIP", "1"))
+NIVEL_GZIP_CACHEADA = int(os.getenv("RESPUESTA_NIVEL_GZIP_CACHEADA", "6"))
+CALIDAD_BROTLI = int(os.getenv("RESPUESTA_CALIDAD_BROTLI", "4"))
+CALIDAD_BROTLI_CACHEADA = int(os.getenv("RESPUESTA_CALIDAD_BROTLI_CACHEADA", "9"))
+
+# En orden de preferencia ante el mismo q del cliente
+CODIFICACIONES = ("br", "gzip") if brotli else ("gzip",)
+
+def _por_defecto(valor):
+    """Tipos que json no sabe codificar, con el mismo formato que pydantic."""
+    if isinstance(valor, BaseModel):
+        return valor.model_dump(mode="json")
+    if isinstance(valor, datetime):
+        if valor.utcoffset() == timezone.utc.utcoffset(None):
+            return valor.replace(tzinfo=None).isoformat() + "Z"
+        return valor.isoformat()
+    if isinstance(valor, (date, time)):
+        return valor.isoformat()
+    if isinstance(valor, Decimal):
+        return float(valor)
+    return str(valor)
+
+def _por_defecto_orjson(valor):
+    # orjson ya codifica fechas; aquí solo llegan modelos, Decimal y otros tipos raros
+    if isinstance(valor, BaseModel):
+        return valor.model_dump(mode="json")
+    if isinstance(valor, Decimal):
+        return float(valor)
+    return str(valor)
+
+def codificar_json(contenido: Any) -> bytes:
+    """JSON compacto en UTF-8 (fechas UTC con "Z", como las serializa pydantic)."""
+    if orjson is not None:
+        return orjson.dumps(contenido, default=_por_defecto_orjson, option=orjson.OPT_UTC_Z)
+    return json.dumps(contenido, ensure_ascii=False, allow_nan=False, separators=(",", ":"),
+                      default=_por_defecto).encode("utf-8")
+
+def filas_json(columnas: Sequence[str], filas: Iterable[Sequence]) -> bytes:
+    """Lista de objetos {columna: valor} a partir de tuplas (filas de db.query(*columnas))."""
+    return codificar_json([dict(zip(columnas, fila)) for fila in filas])
+
+def elegir_codificacion(accept_encoding: Optional[str], tamano: int) -> Optional[str]:
+    """Codificación a usar según Accept-Encoding (con sus q), o None para enviar sin comprimir."""
+    if not accept_encoding or tamano < COMPRIMIR_DESDE_BYTES:
+        return None
+    aceptadas = {}
+    for parte in accept_encoding.lower().split(","):
+        nombre, _, parametros = parte.strip().partition(";")
+        q = 1.0
+        if parametros.strip().startswith("q="):
+            try:
+                q = float(parametros.strip()[2:])
+            except ValueError:
+                q = 0.0
+        aceptadas[nombre.strip()] = q
+    comodin = aceptadas.get("*", 0.0)
+    candidatas = [(aceptadas.get(c, comodin), -i, c) for i, c in enumerate(CODIFICACIONES)]
+    q, _, codificacion = max(candidatas)
+    return codificacion if q > 0 else None
+
+def comprimir(cuerpo: bytes, codificacion: Optional[str], cacheada: bool = False) -> bytes:
+    """Cuerpo comprimido con `codificacion` (None = tal cual); más compresión si va a la caché."""
+    if codificacion == "br":
+        return brotli.compress(cuerpo, quality=CALIDAD_BROTLI_CACHEADA if cacheada else CALIDAD_BROTLI)
+    if codificacion == "gzip":
+        # mtime=0: mismos bytes para el mismo cuerpo (gzip guarda la hora en la cabecera)
+        return gzip.compress(cuerpo, compresslevel=NIVEL_GZIP_CACHEADA if cacheada else NIVEL_GZIP, mtime=0)
+    return cuerpo
+
+def respuesta_json(request: Request, cuerpo: bytes, cabeceras: Optional[Dict[str, str]] = None) -> Response:
+    """Response con el JSON ya codificado, comprimido si el cliente lo acepta."""
+    codificacion = elegir_codificacion(request.headers.get("accept-encoding"), len(cuerpo))
+    cabeceras = {"Vary": "Accept-Encoding", **(cabeceras or {})}
+    if codificacion:
+        cabeceras["Content-Encoding"] = codificacion
+    return Response(content=comprimir(cuerpo, codificacion), media_type="application/json", headers=cabeceras)
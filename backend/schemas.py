@@ -1,4 +1,4 @@
-from pydantic import BaseModel
+from pydantic import BaseModel, Field
 from typing import Optional, List
 from datetime import datetime
 
@@ -66,10 +66,58 @@ class Nota(NotaBase):
     id: int
     fecha_creacion: datetime
     fecha_actualizacion: datetime
+    version: int = 1
 
     class Config:
         from_attributes = True
 
+class NotaResumen(BaseModel):
+    """Nota sin contenido_html (listado del cuaderno)."""
+    id: int
+    titulo: Optional[str] = None
+    previsualización: Optional[str] = ""
+    palabras_clave: Optional[str] = ""
+    es_favorita: Optional[bool] = False
+    es_sistema: Optional[bool] = False
+    fecha_creacion: Optional[datetime] = None
+    fecha_actualizacion: Optional[datetime] = None
+    version: Optional[int] = None
+
+    class Config:
+        from_attributes = True
+
+class NotaEncontrada(NotaResumen):
+    titulo_resaltado: str
+    fragmento: Optional[str] = None
+    puntuacion: float
+
+class CambioTexto(BaseModel):
+    """Reemplaza contenido_html[desde:hasta] por texto. Posiciones en unidades UTF-16 (las de las cadenas JS)."""
+    desde: int = Field(ge=0)
+    hasta: int = Field(ge=0)
+    texto: str = ""
+
+class NotaParche(BaseModel):
+    """Autoguardado: cambios sobre la versión indicada; los campos omitidos no se tocan."""
+    version: int
+    cambios: List[CambioTexto] = []
+    titulo: Optional[str] = None
+    palabras_clave: Optional[str] = None
+    es_favorita: Optional[bool] = None
+
+class NotaGuardada(BaseModel):
+    id: int
+    version: int
+    titulo: Optional[str] = None
+    previsualización: Optional[str] = ""
+    fecha_actualizacion: Optional[datetime] = None
+
+class CambiosNotas(BaseModel):
+    notas: List[Nota]
+    eliminadas: List[int]
+    hasta: datetime
+    reiniciar: bool = False
+
 # --- ESQUEMAS: CONSULTAS IA ---
 
 class ConsultaBase(BaseModel):
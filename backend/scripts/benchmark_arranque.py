@@ -0,0 +1,108 @@
+"""Coste de arranque de la API: tiempo de `import main` y de cada módulo que carga.
+
+Lanza varios intérpretes nuevos con `python -X importtime -c "import main"` (sin caché de
+imports en memoria, como un arranque en frío en Render) y muestra:
+  - el tiempo total de importar main (mediana de las repeticiones)
+  - los módulos que más tardan, con su tiempo acumulado (incluye lo que importan)
+  - el tiempo propio sumado por paquete (fastapi, sqlalchemy, chromadb...)
+  - con --servicios, lo que tarda en crearse cada servicio del registro (imports
+    diferidos y conexiones incluidos), que ya no se paga al importar main
+
+Usa la configuración del entorno (DATABASE_URL, VECTOR_BACKEND, claves): con Chroma
+Cloud, --servicios incluye la conexión de red.
+
+Uso (desde backend/):
+    python scripts/benchmark_arranque.py --repeticiones 5 --top 25
+    python scripts/benchmark_arranque.py --servicios
+"""
+import os
+import sys
+import json
+import argparse
+import subprocess
+from collections import defaultdict
+from pathlib import Path
+import numpy as np
+
+RUTA_BACKEND = Path(__file__).resolve().parent.parent
+
+MEDIR_IMPORT = """
+import time
+inicio = time.perf_counter()
+import main
+print(time.perf_counter() - inicio)
+"""
+
+MEDIR_SERVICIOS = """
+import json
+import main
+from servicios import registro
+for nombre in ("vectorial", "ia", "drive"):
+    registro.obtener(nombre)
+print(json.dumps(registro.tiempos))
+"""
+
+def ejecutar(codigo, importtime=False):
+    """Ejecuta `codigo` en un intérprete nuevo desde backend/; devuelve (stdout, stderr)."""
+    opciones = ["-X", "importtime"] if importtime else []
+    resultado = subprocess.run([sys.executable, *opciones, "-c", codigo], cwd=RUTA_BACKEND,
+                               capture_output=True, text=True, env={**os.environ, "PYTHONPATH": str(RUTA_BACKEND)})
+    if resultado.returncode != 0:
+        sys.exit(f"❌ Falló el arranque:\n{resultado.stderr[-2000:]}")
+    return resultado.stdout, resultado.stderr
+
+def leer_importtime(stderr):
+    """[(modulo, propio_us, acumulado_us)] a partir de la salida de -X importtime."""
+    filas = []
+    for linea in stderr.splitlines():
+        if not linea.startswith("import time:") or "self [us]" in linea:
+            continue
+        propio, acumulado, modulo = linea[len("import time:"):].split("|")
+        filas.append((modulo.strip(), int(propio), int(acumulado)))
+    return filas
+
+def benchmark(repeticiones, top, servicios):
+    totales, acumulados, propios = [], defaultdict(list), defaultdict(list)
+    for _ in range(repeticiones):
+        salida, stderr = ejecutar(MEDIR_IMPORT, importtime=True)
+        totales.append(float(salida.strip().splitlines()[-1]))
+        por_paquete = defaultdict(int)
+        for modulo, propio, acumulado in leer_importtime(stderr):
+            acumulados[modulo].append(acumulado)
+            por_paquete[modulo.split(".")[0]] += propio
+        for paquete, total in por_paquete.items():
+            propios[paquete].append(total)
+
+    mediana = lambda valores: float(np.median(valores)) / 1000
+    print(f"--- import main: {repeticiones} arranques en frío ---")
+    print(f"\n⏱️  Total: p50 {np.median(totales) * 1000:.0f} ms (mín {min(totales) * 1000:.0f} ms, "
+          f"máx {max(totales) * 1000:.0f} ms)")
+
+    print("\n📦 Módulos más lentos (tiempo acumulado, p50):")
+    print(f"{'módulo':<50}{'ms':>10}")
+    print("-" * 60)
+    for modulo, valores in sorted(acumulados.items(), key=lambda m: -np.median(m[1]))[:top]:
+        print(f"{modulo:<50}{mediana(valores):>10.1f}")
+
+    print("\n📚 Tiempo propio por paquete (p50):")
+    print(f"{'paquete':<50}{'ms':>10}")
+    print("-" * 60)
+    for paquete, valores in sorted(propios.items(), key=lambda p: -np.median(p[1]))[:top]:
+        print(f"{paquete:<50}{mediana(valores):>10.1f}")
+
+    if servicios:
+        salida, _ = ejecutar(MEDIR_SERVICIOS)
+        tiempos = json.loads(salida.strip().splitlines()[-1])
+        print("\n🔌 Creación de servicios (diferida, en segundo plano tras el arranque):")
+        print(f"{'servicio':<50}{'ms':>10}")
+        print("-" * 60)
+        for nombre, segundos in tiempos.items():
+            print(f"{nombre:<50}{segundos * 1000:>10.1f}")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--repeticiones", type=int, default=5, help="Arranques en frío a medir")
+    parser.add_argument("--top", type=int, default=20, help="Filas de cada tabla")
+    parser.add_argument("--servicios", action="store_true", help="Medir también la creación de cada servicio")
+    args = parser.parse_args()
+    benchmark(args.repeticiones, args.top, args.servicios)
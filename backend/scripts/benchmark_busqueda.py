@@ -0,0 +1,127 @@
+"""Latencia de la búsqueda de texto completo (/libros/digitales/buscar) en un catálogo sintético.
+
+Genera N libros con títulos, autores y texto en español, construye el índice y mide
+consultas de una y varias palabras, con prefijo, con tildes y con filtro de categoría.
+Las palabras siguen una distribución de Zipf como el texto real: un puñado de términos
+teológicos muy frecuentes (el peor caso, medido aparte) y una cola larga de términos raros.
+
+Uso (desde backend/):
+    python scripts/benchmark_busqueda.py --libros 100000 --consultas 200
+"""
+import os
+import sys
+import time
+import random
+import argparse
+import itertools
+import tempfile
+from pathlib import Path
+import numpy as np
+
+VOCABULARIO = """
+gracia fe esperanza amor evangelio profeta profetas apóstol apóstoles iglesia oración oraciones
+salmo salmos reino cielo tierra pueblo nación naciones ley pacto sacerdote templo espíritu santo
+palabra verdad vida muerte resurrección cruz sangre perdón pecado justicia misericordia sabiduría
+historia teología teológico cristiano cristiana cristianos judío judíos israel jerusalén galilea
+comentario estudio manual sermón sermones devocional carta cartas epístola romanos corintios génesis
+éxodo levítico números deuteronomio isaías jeremías ezequiel daniel mateo marcos lucas juan hechos
+""".split()
+AUTORES = ["Agustín de Hipona", "Juan Calvino", "Martín Lutero", "C. S. Lewis", "John Stott",
+           "Charles Spurgeon", "Dietrich Bonhoeffer", "A. W. Tozer", "Francis Schaeffer", "Tim Keller"]
+CATEGORIAS = ["Teología", "Historia", "Comentarios", "Devocionales", "Biografías", "Nube (Drive)"]
+
+# Cola larga: pseudo-palabras con terminaciones del español (raras individualmente)
+SILABAS = "ba be bi bo bu ca ce ci co cu da de di do du fa fe fi fo ga go la le li lo lu ma me mi mo mu " \
+          "na ne ni no nu pa pe pi po pu ra re ri ro ru sa se si so su ta te ti to tu va ve vi vo za".split()
+TERMINACIONES = ["", "s", "cion", "ciones", "mente", "dad", "ista", "ismo", "ado", "ada"]
+
+def generar_vocabulario(rng, tamano):
+    cola = {"".join(rng.choice(SILABAS) for _ in range(rng.randint(2, 4))) + rng.choice(TERMINACIONES)
+            for _ in range(tamano)}
+    vocabulario = VOCABULARIO + sorted(cola)
+    # Zipf (s = 1): la palabra de rango r aparece con frecuencia proporcional a 1/r
+    # (acumulados: choices() no tiene que volver a sumarlos en cada llamada)
+    pesos = list(itertools.accumulate(1 / r for r in range(1, len(vocabulario) + 1)))
+    return vocabulario, pesos
+
+def texto(rng, palabras, vocabulario=None):
+    vocabulario = vocabulario or (VOCABULARIO, None)
+    return " ".join(rng.choices(vocabulario[0], cum_weights=vocabulario[1], k=palabras))
+
+def generar_libros(n, rng, vocabulario):
+    for i in range(n):
+        yield {
+            "ruta": f"sintetico/{i}.pdf",
+            "nombre_archivo": f"{i}.pdf",
+            "titulo": texto(rng, rng.randint(2, 6), vocabulario).capitalize(),
+            "autor": rng.choice(AUTORES),
+            "formato": rng.choice(["pdf", "epub", "docx"]),
+            "tamano_bytes": rng.randint(10_000, 50_000_000),
+            "categoria": rng.choice(CATEGORIAS),
+            "etiquetas": ",".join(rng.sample(VOCABULARIO, 3)),
+            "hash_md5": f"{i:032x}",
+            "descripcion": texto(rng, 60, vocabulario),
+        }
+
+def benchmark(n, num_consultas, palabras_texto, tamano_vocabulario):
+    rng = random.Random(42)
+    vocabulario = generar_vocabulario(rng, tamano_vocabulario)
+    temporal = tempfile.mkdtemp(prefix="arca_busqueda_")
+    os.environ["DATABASE_URL"] = f"sqlite:///{temporal}/arca.db"
+
+    sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+    from database import SessionLocal, inicializar_base_de_datos
+    from models import LibroDigital
+    from persistencia_masiva import insertar_o_actualizar
+    from busqueda import indice_busqueda
+
+    inicializar_base_de_datos()
+    db = SessionLocal()
+    print(f"--- Catálogo sintético: {n} libros, ~{palabras_texto} palabras de texto extraído por libro ---")
+
+    inicio = time.perf_counter()
+    filas = list(generar_libros(n, rng, vocabulario))
+    insertar_o_actualizar(db, LibroDigital, filas, claves=["ruta"], actualizar=[])
+    db.commit()
+    ids = [i for (i,) in db.query(LibroDigital.id).order_by(LibroDigital.id)]
+    for desde in range(0, n, 5000):
+        lote = ids[desde:desde + 5000]
+        indice_busqueda.indexar(db, lote, {i: texto(rng, palabras_texto, vocabulario) for i in lote})
+        db.commit()
+    print(f"Inserción + indexado: {time.perf_counter() - inicio:.1f} s")
+
+    # Consultas con palabras tomadas de los propios textos (frecuentes y raras, como un usuario real)
+    palabra = lambda: texto(rng, 1, vocabulario)
+    tipos = {
+        "1 palabra": palabra,
+        "2 palabras": lambda: f"{palabra()} {palabra()}",
+        "prefijo": lambda: palabra()[:4],
+        "sin tildes": lambda: rng.choice(["resureccion", "teologia", "oracion", "apostoles", "genesis"]),
+        "con categoría": palabra,
+        "muy frecuente": lambda: rng.choice(VOCABULARIO[:10]),
+    }
+    print("\n📊 RESULTADOS:")
+    print(f"{'consulta':<16}{'p50 ms':>10}{'p99 ms':>10}{'resultados':>12}")
+    print("-" * 48)
+    for nombre, generar in tipos.items():
+        tiempos, cantidad = [], []
+        for _ in range(num_consultas):
+            consulta = generar()
+            categoria = rng.choice(CATEGORIAS) if nombre == "con categoría" else None
+            t = time.perf_counter()
+            resultados = indice_busqueda.buscar(db, consulta, limite=20, categoria=categoria)
+            tiempos.append(time.perf_counter() - t)
+            cantidad.append(len(resultados))
+        ms = np.array(tiempos) * 1000
+        print(f"{nombre:<16}{np.percentile(ms, 50):>10.1f}{np.percentile(ms, 99):>10.1f}{np.mean(cantidad):>12.1f}")
+    print("-" * 48)
+    db.close()
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--libros", type=int, default=100_000)
+    parser.add_argument("--consultas", type=int, default=200)
+    parser.add_argument("--palabras-texto", type=int, default=200, help="Palabras de texto extraído por libro")
+    parser.add_argument("--vocabulario", type=int, default=50_000, help="Palabras distintas de la cola larga")
+    args = parser.parse_args()
+    benchmark(args.libros, args.consultas, args.palabras_texto, args.vocabulario)
@@ -0,0 +1,174 @@
+"""Lecturas concurrentes mientras un escaneo de la biblioteca escribe en la base de datos.
+
+Para cada modo de diario de SQLite (por defecto WAL frente a DELETE, el de antes) lanza un
+intérprete nuevo con una base temporal y:
+  1. siembra notas y libros físicos sintéticos
+  2. fase "base": --lectores hilos piden en bucle los endpoints de lectura (sin escritor)
+  3. fase "escaneo": los mismos lectores mientras EscanerParalelo escanea --archivos .txt
+     confirmando cada --lote archivos (1 = un commit por archivo, el peor caso)
+y muestra la latencia p50/p99/máxima por endpoint, los errores y lo que tardó el escaneo.
+Los bloqueos del escritor se ven sobre todo en la máxima: una lectura que espera un commit.
+
+Las peticiones pasan por TestClient (la app real con su threadpool, sin red). Los vectores
+no se indexan (servicio_vectorial=None): se mide solo la base de datos.
+
+Uso (desde backend/):
+    python scripts/benchmark_concurrencia.py --archivos 2000 --lectores 8
+    python scripts/benchmark_concurrencia.py --modos WAL --lote 50
+"""
+import os
+import sys
+import json
+import time
+import random
+import argparse
+import tempfile
+import threading
+import subprocess
+from collections import defaultdict
+from pathlib import Path
+import numpy as np
+
+RUTA_BACKEND = Path(__file__).resolve().parent.parent
+
+PALABRAS = """gracia fe esperanza amor evangelio profeta apóstol iglesia oración salmo reino cielo tierra
+pueblo ley pacto sacerdote templo espíritu santo palabra verdad vida cruz perdón justicia sabiduría""".split()
+
+ENDPOINTS = {
+    "notas/resumen": lambda rng, ids: "/notas/resumen?user_id=benchmark&limite=100",
+    "notas/{id}": lambda rng, ids: f"/notas/{rng.choice(ids)}?user_id=benchmark",
+    "notas (todas)": lambda rng, ids: "/notas?user_id=benchmark",
+    "libros/fisicos": lambda rng, ids: "/libros/fisicos",
+    "digitales/buscar": lambda rng, ids: f"/libros/digitales/buscar?q={rng.choice(PALABRAS)}",
+}
+
+def texto(rng, palabras):
+    return " ".join(rng.choices(PALABRAS, k=palabras))
+
+def sembrar(engine, notas, fisicos, rng):
+    import models
+    with engine.begin() as conn:
+        conn.execute(models.Nota.__table__.insert(), [
+            {"titulo": texto(rng, 3), "contenido_html": f"<p>{texto(rng, 80)}</p>", "user_id": "benchmark",
+             "previsualización": texto(rng, 15)} for _ in range(notas)])
+        conn.execute(models.LibroFisico.__table__.insert(), [
+            {"isbn": f"978{i:010d}", "titulo": texto(rng, 4), "autor": texto(rng, 2)} for i in range(fisicos)])
+
+def crear_archivos(ruta, n, rng):
+    for i in range(n):
+        carpeta = os.path.join(ruta, f"estante_{i % 20}")
+        os.makedirs(carpeta, exist_ok=True)
+        with open(os.path.join(carpeta, f"libro_{i}.txt"), "w", encoding="utf-8") as f:
+            f.write(f"{i} " + texto(rng, 300))
+
+def leer(cliente, rng, ids, hasta, resultados):
+    """Pide endpoints al azar hasta que hasta() sea True; guarda (endpoint, segundos, ok)."""
+    nombres = list(ENDPOINTS)
+    while not hasta():
+        nombre = rng.choice(nombres)
+        inicio = time.perf_counter()
+        try:
+            ok = cliente.get(ENDPOINTS[nombre](rng, ids)).status_code < 500
+        except Exception:
+            ok = False
+        resultados.append((nombre, time.perf_counter() - inicio, ok))
+
+def fase(cliente, lectores, ids, hasta):
+    resultados = []
+    hilos = [threading.Thread(target=leer, args=(cliente, random.Random(i), ids, hasta, resultados))
+             for i in range(lectores)]
+    for hilo in hilos:
+        hilo.start()
+    for hilo in hilos:
+        hilo.join()
+    return resultados
+
+def resumir(resultados, segundos):
+    por_endpoint = defaultdict(list)
+    errores = defaultdict(int)
+    for nombre, duracion, ok in resultados:
+        por_endpoint[nombre].append(duracion * 1000)
+        errores[nombre] += not ok
+    return {nombre: {"peticiones": len(ms), "por_segundo": len(ms) / segundos, "p50": float(np.percentile(ms, 50)),
+                     "p99": float(np.percentile(ms, 99)), "max": max(ms), "errores": errores[nombre]}
+            for nombre, ms in sorted(por_endpoint.items())}
+
+def ejecutar_modo(args):
+    """Proceso hijo: un modo de diario, base temporal propia. Imprime el resultado en JSON."""
+    temporal = tempfile.mkdtemp(prefix="arca_concurrencia_")
+    os.environ.update({"DATABASE_URL": f"sqlite:///{temporal}/arca.db", "SQLITE_JOURNAL_MODE": args.hijo,
+                       "SCAN_BATCH_SIZE": str(args.lote), "VECTOR_BACKEND": "local",
+                       "VECTOR_LOCAL_PATH": os.path.join(temporal, "vectores")})
+    sys.path.insert(0, str(RUTA_BACKEND))
+    from fastapi.testclient import TestClient
+    import main
+    import models
+    from database import SessionLocal, engine
+    from escaner_paralelo import EscanerParalelo
+
+    rng = random.Random(42)
+    ruta_biblioteca = os.path.join(temporal, "biblioteca")
+    crear_archivos(ruta_biblioteca, args.archivos, rng)
+    resultado = {}
+    with TestClient(main.app) as cliente:
+        sembrar(engine, args.notas, args.fisicos, rng)
+        with SessionLocal() as db:
+            ids = [i for (i,) in db.query(models.Nota.id).filter(models.Nota.user_id == "benchmark")]
+            resultado["journal_mode"] = db.connection().exec_driver_sql("PRAGMA journal_mode").scalar()
+
+        fin_base = time.monotonic() + args.segundos_base
+        resultado["base"] = resumir(fase(cliente, args.lectores, ids, lambda: time.monotonic() > fin_base),
+                                    args.segundos_base)
+
+        terminado = threading.Event()
+        def escanear():
+            with SessionLocal() as db:
+                inicio = time.perf_counter()
+                resultado["estadisticas_escaneo"] = EscanerParalelo.escanear(db, ruta_biblioteca, servicio_vectorial=None)
+                resultado["segundos_escaneo"] = time.perf_counter() - inicio
+            terminado.set()
+
+        escritor = threading.Thread(target=escanear)
+        inicio = time.perf_counter()
+        escritor.start()
+        lecturas = fase(cliente, args.lectores, ids, terminado.is_set)
+        escritor.join()
+        resultado["escaneo"] = resumir(lecturas, time.perf_counter() - inicio)
+    print(json.dumps(resultado))
+
+def benchmark(args):
+    print(f"--- {args.lectores} lectores; escaneo de {args.archivos} archivos con commit cada {args.lote}; "
+          f"{args.notas} notas, {args.fisicos} libros físicos ---")
+    for modo in args.modos:
+        opciones = ["--hijo", modo, "--archivos", str(args.archivos), "--lectores", str(args.lectores),
+                    "--lote", str(args.lote), "--notas", str(args.notas), "--fisicos", str(args.fisicos),
+                    "--segundos-base", str(args.segundos_base)]
+        proceso = subprocess.run([sys.executable, __file__, *opciones], cwd=RUTA_BACKEND,
+                                 capture_output=True, text=True)
+        if proceso.returncode != 0:
+            sys.exit(f"❌ Falló el modo {modo}:\n{proceso.stderr[-2000:]}")
+        resultado = json.loads(proceso.stdout.strip().splitlines()[-1])
+        estadisticas = resultado.get("estadisticas_escaneo") or {}
+        print(f"\n📊 journal_mode={resultado['journal_mode']}: escaneo en {resultado['segundos_escaneo']:.1f} s "
+              f"({estadisticas.get('nuevos', 0)} libros nuevos, "
+              f"{estadisticas.get('errores', 0)} errores)")
+        print(f"{'fase':<9}{'endpoint':<20}{'peticiones':>11}{'pet/s':>9}{'p50 ms':>9}{'p99 ms':>10}{'máx ms':>10}{'errores':>9}")
+        print("-" * 87)
+        for nombre_fase in ("base", "escaneo"):
+            for endpoint, r in resultado[nombre_fase].items():
+                print(f"{nombre_fase:<9}{endpoint:<20}{r['peticiones']:>11}{r['por_segundo']:>9.1f}"
+                      f"{r['p50']:>9.1f}{r['p99']:>10.1f}{r['max']:>10.1f}{r['errores']:>9}")
+        print("-" * 87)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--modos", nargs="+", default=["WAL", "DELETE"], help="Valores de SQLITE_JOURNAL_MODE")
+    parser.add_argument("--archivos", type=int, default=2000, help="Archivos .txt que escanea el escritor")
+    parser.add_argument("--lote", type=int, default=1, help="Archivos por commit del escaneo (SCAN_BATCH_SIZE)")
+    parser.add_argument("--lectores", type=int, default=8, help="Hilos que piden endpoints de lectura")
+    parser.add_argument("--notas", type=int, default=2000)
+    parser.add_argument("--fisicos", type=int, default=2000)
+    parser.add_argument("--segundos-base", type=float, default=5, help="Duración de la fase sin escritor")
+    parser.add_argument("--hijo", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    ejecutar_modo(args) if args.hijo else benchmark(args)
@@ -0,0 +1,80 @@
+"""Compara el índice IVF local contra búsqueda exacta (fuerza bruta) en un corpus sintético.
+
+Uso (desde backend/):
+    python scripts/benchmark_indice_vectorial.py --vectores 50000 --consultas 300
+"""
+import os
+import sys
+import time
+import argparse
+import tempfile
+from pathlib import Path
+import numpy as np
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+from indice_local import IndiceLocal
+
+def generar_corpus(n, dimension, clusters, rng):
+    """Mezcla de gaussianas: parecido a embeddings reales, que forman temas."""
+    centros = rng.normal(size=(clusters, dimension)).astype(np.float32)
+    asignacion = rng.integers(clusters, size=n)
+    return centros[asignacion] + 0.35 * rng.normal(size=(n, dimension)).astype(np.float32)
+
+def percentiles(tiempos):
+    ms = np.array(tiempos) * 1000
+    return np.percentile(ms, 50), np.percentile(ms, 99)
+
+def medir(indice, consultas, k, exacta):
+    tiempos, resultados = [], []
+    for q in consultas:
+        inicio = time.perf_counter()
+        vecinos = indice.buscar_vectores(q, k, exacta=exacta)
+        tiempos.append(time.perf_counter() - inicio)
+        resultados.append({fila for fila, _ in vecinos})
+    return tiempos, resultados
+
+def benchmark(n, dimension, num_consultas, k, clusters, sondas):
+    rng = np.random.default_rng(42)
+    print(f"--- Corpus sintético: {n} vectores x {dimension} dims, {num_consultas} consultas, top-{k} ---")
+
+    with tempfile.TemporaryDirectory() as ruta:
+        indice = IndiceLocal(os.path.join(ruta, "indice"))
+        corpus = generar_corpus(n, dimension, clusters, rng)
+
+        inicio = time.perf_counter()
+        for desde in range(0, n, 10_000):
+            bloque = corpus[desde:desde + 10_000]
+            ids = [f"v{i}" for i in range(desde, desde + len(bloque))]
+            indice.agregar_vectores(ids, bloque, [""] * len(bloque), [{} for _ in ids])
+        indice.entrenar()
+        print(f"Construcción + entrenamiento: {time.perf_counter() - inicio:.1f} s "
+              f"({len(indice.centroides)} listas)")
+
+        # Consultas cercanas a puntos del corpus (como preguntas sobre temas existentes)
+        consultas = corpus[rng.integers(n, size=num_consultas)] + 0.2 * rng.normal(size=(num_consultas, dimension))
+
+        tiempos_exacta, verdad = medir(indice, consultas, k, exacta=True)
+        p50, p99 = percentiles(tiempos_exacta)
+        print("\n📊 RESULTADOS:")
+        print(f"{'método':<18}{'recall@' + str(k):>10}{'p50 ms':>10}{'p99 ms':>10}")
+        print("-" * 48)
+        print(f"{'fuerza bruta':<18}{1.0:>10.3f}{p50:>10.2f}{p99:>10.2f}")
+
+        for nprobe in sondas:
+            indice.nprobe = nprobe
+            tiempos, resultados = medir(indice, consultas, k, exacta=False)
+            recall = np.mean([len(r & v) / len(v) for r, v in zip(resultados, verdad)])
+            p50, p99 = percentiles(tiempos)
+            print(f"{'IVF nprobe=' + str(nprobe):<18}{recall:>10.3f}{p50:>10.2f}{p99:>10.2f}")
+        print("-" * 48)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--vectores", type=int, default=50_000)
+    parser.add_argument("--dimension", type=int, default=384)
+    parser.add_argument("--consultas", type=int, default=300)
+    parser.add_argument("--k", type=int, default=10)
+    parser.add_argument("--clusters", type=int, default=200)
+    parser.add_argument("--sondas", type=int, nargs="+", default=[1, 4, 8, 16, 32])
+    args = parser.parse_args()
+    benchmark(args.vectores, args.dimension, args.consultas, args.k, args.clusters, args.sondas)
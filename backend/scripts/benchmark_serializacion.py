@@ -0,0 +1,127 @@
+"""Coste de serializar los listados grandes: camino ORM + pydantic + json frente al rápido.
+
+Para el catálogo digital, la biblioteca física y el cuaderno (notas con contenido) mide,
+con 1k, 10k y 100k filas sintéticas:
+  - actual: objetos ORM validados con el esquema (from_attributes) y codificados con json,
+    como hacía FastAPI con response_model
+  - rápido: solo las columnas del esquema como tuplas, codificadas con respuestas_json
+    (orjson si está instalado)
+  - el tamaño del cuerpo y lo que cuesta comprimirlo con gzip y brotli (si está instalado)
+
+Cada medida usa una sesión nueva (sin objetos ya cargados en el identity map).
+
+Uso (desde backend/):
+    python scripts/benchmark_serializacion.py --filas 1000 10000 100000 --repeticiones 3
+"""
+import os
+import sys
+import json
+import time
+import random
+import argparse
+import tempfile
+from pathlib import Path
+from typing import List
+import numpy as np
+
+PALABRAS = """gracia fe esperanza amor evangelio profeta apóstol iglesia oración salmo reino cielo tierra
+pueblo ley pacto sacerdote templo espíritu santo palabra verdad vida cruz perdón justicia sabiduría
+historia teología comentario estudio manual sermón devocional carta epístola génesis éxodo""".split()
+
+def texto(rng, palabras):
+    return " ".join(rng.choices(PALABRAS, k=palabras))
+
+def generar(tabla, n, rng):
+    for i in range(n):
+        if tabla == "digitales":
+            yield {"ruta": f"sintetico/{i}.pdf", "nombre_archivo": f"{i}.pdf", "titulo": texto(rng, 4).capitalize(),
+                   "autor": texto(rng, 2).title(), "formato": rng.choice(["pdf", "epub", "docx"]),
+                   "tamano_bytes": rng.randint(10_000, 50_000_000), "categoria": rng.choice(["Teología", "Historia"]),
+                   "etiquetas": ",".join(rng.sample(PALABRAS, 3)), "hash_md5": f"{i:032x}",
+                   "num_paginas": rng.randint(20, 900), "descripcion": texto(rng, 30)}
+        elif tabla == "fisicos":
+            yield {"isbn": f"978{i:010d}", "titulo": texto(rng, 4).capitalize(), "autor": texto(rng, 2).title(),
+                   "editorial": texto(rng, 2).title(), "ano_publicacion": rng.randint(1900, 2025),
+                   "categoria": "Teología", "estanteria": f"Pasillo {i % 9}", "leido": rng.random() < 0.5,
+                   "notas_personales": texto(rng, 15)}
+        else:
+            parrafos = "".join(f"<p>{texto(rng, 40)}</p>" for _ in range(rng.randint(1, 5)))
+            yield {"titulo": texto(rng, 3).capitalize(), "contenido_html": parrafos,
+                   "previsualización": parrafos[3:103] + "...", "palabras_clave": ",".join(rng.sample(PALABRAS, 2)),
+                   "es_favorita": rng.random() < 0.1, "user_id": "benchmark"}
+
+def medir(funcion, repeticiones):
+    tiempos, resultado = [], None
+    for _ in range(repeticiones):
+        inicio = time.perf_counter()
+        resultado = funcion()
+        tiempos.append(time.perf_counter() - inicio)
+    return float(np.median(tiempos)) * 1000, resultado
+
+def benchmark(tamanos, repeticiones):
+    temporal = tempfile.mkdtemp(prefix="arca_serializacion_")
+    os.environ["DATABASE_URL"] = f"sqlite:///{temporal}/arca.db"
+
+    sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+    from pydantic import TypeAdapter
+    from database import SessionLocal, engine, inicializar_base_de_datos
+    import models
+    import schemas
+    import respuestas_json
+    from respuestas_json import filas_json, comprimir
+
+    inicializar_base_de_datos()
+    tablas = {"digitales": (models.LibroDigital, schemas.LibroDigital),
+              "fisicos": (models.LibroFisico, schemas.LibroFisico),
+              "notas": (models.Nota, schemas.Nota)}
+    rng = random.Random(42)
+    maximo = max(tamanos)
+    inicio = time.perf_counter()
+    with engine.begin() as conn:
+        for nombre, (modelo, _) in tablas.items():
+            conn.execute(modelo.__table__.insert(), list(generar(nombre, maximo, rng)))
+    print(f"--- {maximo} filas sintéticas por tabla (inserción: {time.perf_counter() - inicio:.1f} s) ---")
+    print(f"Codificador: {'orjson' if respuestas_json.orjson else 'json (orjson no instalado)'}; "
+          f"compresión: {', '.join(respuestas_json.CODIFICACIONES)}")
+
+    print("\n📊 RESULTADOS (mediana de las repeticiones):")
+    print(f"{'tabla':<11}{'filas':>8}{'actual ms':>11}{'rápido ms':>11}{'x':>7}{'MB':>8}"
+          f"{'gzip ms':>9}{'gzip MB':>9}{'br ms':>8}{'br MB':>8}")
+    print("-" * 90)
+    for nombre, (modelo, esquema) in tablas.items():
+        adaptador = TypeAdapter(List[esquema])
+        columnas = tuple(esquema.model_fields)
+        for n in tamanos:
+            def actual():
+                with SessionLocal() as db:
+                    objetos = db.query(modelo).order_by(modelo.id).limit(n).all()
+                    datos = adaptador.dump_python(adaptador.validate_python(objetos, from_attributes=True), mode="json")
+                    # Lo mismo que JSONResponse.render
+                    return json.dumps(datos, ensure_ascii=False, allow_nan=False, indent=None,
+                                      separators=(",", ":")).encode("utf-8")
+
+            def rapido():
+                with SessionLocal() as db:
+                    filas = db.query(*(getattr(modelo, c) for c in columnas)).order_by(modelo.id).limit(n).all()
+                    return filas_json(columnas, filas)
+
+            ms_actual, cuerpo_actual = medir(actual, repeticiones)
+            ms_rapido, cuerpo = medir(rapido, repeticiones)
+            if json.loads(cuerpo) != json.loads(cuerpo_actual):
+                sys.exit(f"❌ {nombre}: el camino rápido no devuelve lo mismo que el actual")
+            ms_gzip, gz = medir(lambda: comprimir(cuerpo, "gzip"), repeticiones)
+            if respuestas_json.brotli:
+                ms_br, br = medir(lambda: comprimir(cuerpo, "br"), repeticiones)
+                columnas_br = f"{ms_br:>8.1f}{len(br) / 1e6:>8.2f}"
+            else:
+                columnas_br = f"{'-':>8}{'-':>8}"
+            print(f"{nombre:<11}{n:>8}{ms_actual:>11.1f}{ms_rapido:>11.1f}{ms_actual / ms_rapido:>7.1f}"
+                  f"{len(cuerpo) / 1e6:>8.2f}{ms_gzip:>9.1f}{len(gz) / 1e6:>9.2f}{columnas_br}")
+    print("-" * 90)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--filas", type=int, nargs="+", default=[1_000, 10_000, 100_000])
+    parser.add_argument("--repeticiones", type=int, default=3)
+    args = parser.parse_args()
+    benchmark(sorted(args.filas), args.repeticiones)
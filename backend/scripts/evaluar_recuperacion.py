@@ -0,0 +1,169 @@
+"""Evaluación offline de la recuperación del asistente (RAG) con un conjunto fijo de preguntas.
+
+Compara la recuperación anterior (top-5 vectorial pegado tal cual) con la vectorial, la
+léxica y la híbrida (RRF + deduplicación + presupuesto de tokens) y mide, por modo:
+  - pasaje: % de preguntas cuyo pasaje con la respuesta llega entero al contexto
+  - libro:  % de preguntas cuyo libro esperado aparece entre las fuentes
+  - tokens: tamaño medio del contexto enviado a Gemini (estimado)
+  - ms:     latencia p50 de la recuperación
+
+Por defecto construye en un directorio temporal una biblioteca sintética: un libro por
+pregunta con el pasaje escondido entre texto de relleno, reediciones que lo repiten
+(para medir la deduplicación) y libros de relleno. Con --biblioteca se evalúa la
+biblioteca configurada (DATABASE_URL, VECTOR_BACKEND): ahí solo se mide "libro".
+
+Uso (desde backend/):
+    python scripts/evaluar_recuperacion.py --libros 300
+    python scripts/evaluar_recuperacion.py --embeddings hashing   # sin red (sin modelo ONNX)
+    python scripts/evaluar_recuperacion.py --biblioteca
+"""
+import os
+import sys
+import json
+import time
+import zlib
+import random
+import hashlib
+import argparse
+import tempfile
+from collections import Counter
+from pathlib import Path
+import numpy as np
+
+RUTA_SCRIPTS = Path(__file__).resolve().parent
+PREGUNTAS = RUTA_SCRIPTS / "preguntas_rag.json"
+
+def embeddings_hashing(dimension=512):
+    """Embeddings sin modelo (feature hashing de raíces): solo para probar sin red."""
+    from busqueda import analizar
+
+    def embeber(textos):
+        matriz = np.zeros((len(textos), dimension), dtype=np.float32)
+        for i, texto in enumerate(textos):
+            for raiz, veces in Counter(analizar(texto)).items():
+                h = zlib.crc32(raiz.encode("utf-8"))
+                # tf sublineal: las palabras muy repetidas no tapan al resto
+                matriz[i, h % dimension] += (1.0 + np.log(veces)) * (1.0 if h & 0x80000000 else -1.0)
+        return matriz
+    return embeber
+
+def relleno(rng, vocabulario, palabras):
+    return " ".join(rng.choices(vocabulario[0], cum_weights=vocabulario[1], k=palabras))
+
+def construir_biblioteca(preguntas, num_libros, palabras_libro, embeddings, temporal):
+    """Biblioteca sintética en `temporal`: SQLite + índice de texto + índice vectorial local."""
+    from benchmark_busqueda import AUTORES, CATEGORIAS, generar_vocabulario
+    from database import SessionLocal, inicializar_base_de_datos
+    from models import LibroDigital
+    from busqueda import indice_busqueda
+    from servicio_vectorial import ServicioVectorial
+    from indice_local import IndiceLocal
+    from procesador_archivos import ProcesadorArchivos
+
+    rng = random.Random(7)
+    vocabulario = generar_vocabulario(rng, 20_000)
+    libros = []
+    for i, p in enumerate(preguntas):
+        ediciones = [p["titulo"]] + ([f"{p['titulo']} (2ª ed.)"] if i % 4 == 0 else [])
+        for titulo in ediciones:
+            palabras = relleno(rng, vocabulario, palabras_libro).split()
+            posicion = rng.randint(0, len(palabras))
+            libros.append((titulo, p["autor"], " ".join(palabras[:posicion] + [p["pasaje"]] + palabras[posicion:])))
+    while len(libros) < num_libros:
+        titulo = relleno(rng, vocabulario, rng.randint(2, 5)).capitalize()
+        libros.append((titulo, rng.choice(AUTORES), relleno(rng, vocabulario, palabras_libro)))
+
+    inicializar_base_de_datos()
+    db = SessionLocal()
+    filas = []
+    for n, (titulo, autor, _) in enumerate(libros):
+        ruta = f"sintetico/{n}.pdf"
+        filas.append(LibroDigital(ruta=ruta, nombre_archivo=f"{n}.pdf", titulo=titulo, autor=autor, formato="pdf",
+                                  categoria=rng.choice(CATEGORIAS), hash_md5=hashlib.md5(ruta.encode()).hexdigest()))
+    db.add_all(filas)
+    db.commit()
+    indice_busqueda.indexar(db, [f.id for f in filas], {f.id: texto for f, (_, _, texto) in zip(filas, libros)})
+    db.commit()
+
+    servicio = ServicioVectorial()
+    servicio.backend = IndiceLocal(os.path.join(temporal, "vectores"),
+                                   funcion_embedding=embeddings_hashing() if embeddings == "hashing" else None)
+    fragmentos = []
+    for fila, (titulo, autor, texto) in zip(filas, libros):
+        for f in ProcesadorArchivos.fragmentar(iter([(1, texto)])):
+            fragmentos.append({"id_libro": fila.hash_md5, "texto": f["texto"], "metadatos": {
+                "titulo": titulo, "autor": autor, "fragmento": f["indice"], "offset": f["offset"],
+                "pagina_inicio": f["pagina_inicio"], "pagina_fin": f["pagina_fin"]}})
+    for desde in range(0, len(fragmentos), 256):
+        servicio.indexar_fragmentos(fragmentos[desde:desde + 256])
+    db.close()
+    print(f"Biblioteca sintética: {len(libros)} libros, {len(fragmentos)} fragmentos")
+    return servicio
+
+def recuperar_antes(servicio, pregunta):
+    """Recuperación anterior: top-5 vectorial, documentos unidos tal cual."""
+    resultados = servicio.buscar_similitud(pregunta)
+    if not resultados or not resultados.get("documents"):
+        return {"contexto": "", "fuentes": []}
+    return {"contexto": "\n".join(resultados["documents"][0]), "fuentes": resultados["metadatas"][0]}
+
+def evaluar(preguntas, recuperar):
+    from busqueda import plegar
+    from recuperacion import estimar_tokens
+    normalizar = lambda t: " ".join(plegar(t).split())
+    pasajes, libros, tokens, tiempos = 0, 0, [], []
+    for p in preguntas:
+        inicio = time.perf_counter()
+        paquete = recuperar(p["pregunta"])
+        tiempos.append(time.perf_counter() - inicio)
+        pasajes += p.get("pasaje") is not None and normalizar(p["pasaje"]) in normalizar(paquete["contexto"])
+        libros += any((f or {}).get("titulo", "").startswith(p["titulo"]) for f in paquete["fuentes"])
+        tokens.append(estimar_tokens(paquete["contexto"]))
+    n = len(preguntas)
+    return 100 * pasajes / n, 100 * libros / n, np.mean(tokens), np.percentile(np.array(tiempos) * 1000, 50)
+
+def main(args):
+    preguntas = json.loads(PREGUNTAS.read_text(encoding="utf-8"))
+    temporal = None
+    if not args.biblioteca:
+        temporal = tempfile.mkdtemp(prefix="arca_rag_")
+        os.environ["DATABASE_URL"] = f"sqlite:///{temporal}/arca.db"
+        os.environ["VECTOR_BACKEND"] = "local"
+        os.environ["VECTOR_LOCAL_PATH"] = os.path.join(temporal, "vectores")
+    sys.path.insert(0, str(RUTA_SCRIPTS.parent))
+    from recuperacion import RecuperadorHibrido
+
+    if args.biblioteca:
+        from servicio_vectorial import ServicioVectorial
+        servicio = ServicioVectorial()
+        for p in preguntas:
+            p["pasaje"] = None
+    else:
+        servicio = construir_biblioteca(preguntas, args.libros, args.palabras_libro, args.embeddings, temporal)
+
+    recuperador = RecuperadorHibrido(servicio)
+    modos = {
+        "antes (top-5)": lambda q: recuperar_antes(servicio, q),
+        "vectorial": lambda q: recuperador.recuperar(q, args.presupuesto, modo="vectorial"),
+        "léxico": lambda q: recuperador.recuperar(q, args.presupuesto, modo="lexico"),
+        "híbrido": lambda q: recuperador.recuperar(q, args.presupuesto, modo="hibrido"),
+    }
+    print(f"--- {len(preguntas)} preguntas, presupuesto {args.presupuesto} tokens ---")
+    print("\n📊 RESULTADOS:")
+    print(f"{'modo':<16}{'pasaje %':>10}{'libro %':>10}{'tokens':>10}{'ms p50':>10}")
+    print("-" * 56)
+    for nombre, recuperar in modos.items():
+        pasaje, libro, tokens, ms = evaluar(preguntas, recuperar)
+        print(f"{nombre:<16}{pasaje:>10.0f}{libro:>10.0f}{tokens:>10.0f}{ms:>10.1f}")
+    print("-" * 56)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--libros", type=int, default=300, help="Libros de la biblioteca sintética")
+    parser.add_argument("--palabras-libro", type=int, default=1500, help="Palabras de relleno por libro")
+    # Aquí no se importa recuperacion: leería DATABASE_URL antes de apuntarla al directorio temporal
+    parser.add_argument("--presupuesto", type=int, default=int(os.getenv("RAG_PRESUPUESTO_TOKENS", "1500")))
+    parser.add_argument("--embeddings", choices=["modelo", "hashing"], default="modelo",
+                        help="modelo = el de Chroma por defecto (ONNX, se descarga); hashing = sin red")
+    parser.add_argument("--biblioteca", action="store_true", help="Evaluar la biblioteca configurada")
+    main(parser.parse_args())
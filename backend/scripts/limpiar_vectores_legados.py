@@ -0,0 +1,27 @@
+"""Borra del almacén vectorial los fragmentos indexados con el esquema de IDs anterior.
+
+Antes los IDs eran "<id numérico del libro en DB>_<hash(texto)>" y los metadatos no
+llevaban id_libro: ni eliminar_libro ni la purga del escáner los encuentran, así que
+quedaban para siempre (duplicando resultados del RAG con los fragmentos nuevos). Se
+ejecuta una sola vez tras actualizar; repetirlo no borra nada más.
+
+Uso (desde backend/):
+    python scripts/limpiar_vectores_legados.py
+"""
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+from dotenv import load_dotenv
+load_dotenv()
+
+from servicio_vectorial import servicio_vectorial
+
+if __name__ == "__main__":
+    if not servicio_vectorial.backend:
+        sys.exit("❌ No hay conexión con el almacén vectorial.")
+    print(f"--- Buscando fragmentos legados (backend: {servicio_vectorial.tipo_backend}) ---")
+    inicio = time.perf_counter()
+    borrados = servicio_vectorial.eliminar_fragmentos_legados()
+    print(f"✅ {borrados} fragmentos legados borrados en {time.perf_counter() - inicio:.1f} s.")
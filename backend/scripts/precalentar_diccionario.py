@@ -0,0 +1,47 @@
+"""Precalienta la caché del diccionario teológico con una lista de términos comunes.
+
+Uso (desde backend/):
+    python scripts/precalentar_diccionario.py                  # lista por defecto
+    python scripts/precalentar_diccionario.py terminos.txt     # un término por línea
+    python scripts/precalentar_diccionario.py --perspectiva reformado
+"""
+import sys
+import time
+import argparse
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+from dotenv import load_dotenv
+load_dotenv()
+
+from database import inicializar_base_de_datos
+from servicio_diccionario import servicio_diccionario
+
+TERMINOS_COMUNES = [
+    "justificación", "santificación", "glorificación", "regeneración", "expiación",
+    "propiciación", "redención", "reconciliación", "gracia", "fe", "arrepentimiento",
+    "elección", "predestinación", "providencia", "soberanía de Dios", "trinidad",
+    "encarnación", "kenosis", "unión hipostática", "pneumatología", "eclesiología",
+    "escatología", "milenio", "parusía", "pacto", "ley y evangelio", "imputación",
+    "adopción", "perseverancia de los santos", "sacramento", "bautismo", "santa cena",
+    "canon", "inspiración", "inerrancia", "hermenéutica", "exégesis", "teofanía",
+    "shekinah", "logos", "agape", "koinonía", "kerygma", "apostasía", "herejía",
+]
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("archivo", nargs="?", help="Archivo de texto con un término por línea")
+    parser.add_argument("--perspectiva", default="academico_global")
+    parser.add_argument("--concurrencia", type=int, default=4)
+    args = parser.parse_args()
+
+    terminos = TERMINOS_COMUNES
+    if args.archivo:
+        terminos = [t.strip() for t in Path(args.archivo).read_text(encoding="utf-8").splitlines() if t.strip()]
+
+    inicializar_base_de_datos()
+    print(f"--- Precalentando {len(terminos)} términos (perspectiva: {args.perspectiva}) ---")
+    inicio = time.perf_counter()
+    resumen = servicio_diccionario.precalentar(terminos, args.perspectiva, args.concurrencia)
+    print(f"✅ {resumen['terminos']} términos en {time.perf_counter() - inicio:.1f} s: "
+          f"{resumen['generados']} generados con IA, {resumen['errores']} errores.")
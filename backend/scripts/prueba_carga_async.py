@@ -0,0 +1,159 @@
+"""Prueba de carga: ruta síncrona (threadpool) vs ruta async contra un upstream lento simulado.
+
+Levanta en procesos aparte un stub de Open Library que tarda --latencia segundos en
+responder y la API real apuntando a él. Para cada nivel de concurrencia lanza N
+clientes contra:
+  - sync:  la implementación anterior (def + requests, un hilo por petición en vuelo)
+  - async: GET /libros/fisicos/isbn/{isbn} (httpx asíncrono + límite del upstream)
+Mientras tanto una sonda consulta GET /libros/fisicos (ruta rápida de DB) para ver
+si las llamadas lentas dejan sin hilos al resto de la API.
+
+Uso (desde backend/):
+    python scripts/prueba_carga_async.py --concurrencia 10 40 80 160 320 --latencia 3
+"""
+import os
+import sys
+import time
+import asyncio
+import argparse
+import tempfile
+import multiprocessing
+from pathlib import Path
+import numpy as np
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+PUERTO_STUB = 8765
+PUERTO_API = 8766
+
+def configurar_entorno(limite_isbn):
+    """Debe llamarse antes de importar main: base de datos y vectores temporales, upstream local."""
+    temporal = tempfile.mkdtemp(prefix="arca_carga_")
+    os.environ["DATABASE_URL"] = f"sqlite:///{temporal}/arca.db"
+    os.environ["VECTOR_BACKEND"] = "local"
+    os.environ["VECTOR_LOCAL_PATH"] = os.path.join(temporal, "vectores")
+    os.environ["OPEN_LIBRARY_URL"] = f"http://127.0.0.1:{PUERTO_STUB}"
+    os.environ["GOOGLE_BOOKS_URL"] = f"http://127.0.0.1:{PUERTO_STUB}"
+    os.environ["LIMITE_ISBN"] = str(limite_isbn)
+
+def crear_stub(latencia):
+    from fastapi import FastAPI
+    stub = FastAPI()
+
+    @stub.get("/api/books")
+    async def libros(bibkeys: str):
+        await asyncio.sleep(latencia)
+        return {bibkeys: {"title": "Libro de prueba", "authors": [{"name": "Autor"}],
+                          "publishers": [{"name": "Editorial"}], "publish_date": "2000"}}
+
+    return stub
+
+def servir_stub(latencia):
+    import uvicorn
+    uvicorn.run(crear_stub(latencia), host="127.0.0.1", port=PUERTO_STUB, log_level="warning", backlog=4096,
+                timeout_keep_alive=75)
+
+def servir_api(limite_isbn):
+    configurar_entorno(limite_isbn)
+    import uvicorn
+    from main import app
+    from servicio_biblioteca import ServicioFisico
+
+    # La ruta tal como era antes (def síncrona + requests): ocupa un hilo del threadpool por petición
+    @app.get("/bench/isbn-sync/{isbn}")
+    def buscar_isbn_sync(isbn: str):
+        return ServicioFisico.buscar_por_isbn(isbn)
+
+    uvicorn.run(app, host="127.0.0.1", port=PUERTO_API, log_level="warning", backlog=4096,
+                timeout_keep_alive=75)
+
+def esperar_puerto(puerto, limite=60):
+    import socket
+    fin = time.monotonic() + limite
+    while time.monotonic() < fin:
+        with socket.socket() as s:
+            if s.connect_ex(("127.0.0.1", puerto)) == 0:
+                return
+        time.sleep(0.2)
+    raise RuntimeError(f"El servidor del puerto {puerto} no arrancó")
+
+async def ronda(cliente, ruta, concurrencia, peticiones_por_cliente):
+    latencias, sonda, errores = [], [], 0
+    activo = True
+
+    async def usuario(n):
+        nonlocal errores
+        for i in range(peticiones_por_cliente):
+            inicio = time.perf_counter()
+            try:
+                r = await cliente.get(f"{ruta}/978{n:05d}{i:02d}")
+                r.raise_for_status()
+                latencias.append(time.perf_counter() - inicio)
+            except Exception:
+                errores += 1
+
+    async def sondear():
+        while activo:
+            inicio = time.perf_counter()
+            try:
+                await cliente.get("/libros/fisicos")
+                sonda.append(time.perf_counter() - inicio)
+            except Exception:
+                pass
+            await asyncio.sleep(0.02)
+
+    tarea_sonda = asyncio.create_task(sondear())
+    inicio = time.perf_counter()
+    await asyncio.gather(*(usuario(n) for n in range(concurrencia)))
+    duracion = time.perf_counter() - inicio
+    activo = False
+    await tarea_sonda
+
+    ms = np.array(latencias or [0]) * 1000
+    return {
+        "rps": len(latencias) / duracion,
+        "p50": np.percentile(ms, 50),
+        "p99": np.percentile(ms, 99),
+        "sonda_p50": np.percentile(np.array(sonda or [0]) * 1000, 50),
+        "errores": errores,
+    }
+
+async def ejecutar(niveles, peticiones_por_cliente):
+    import httpx
+    limites = httpx.Limits(max_connections=max(niveles) + 10, max_keepalive_connections=max(niveles) + 10)
+    async with httpx.AsyncClient(base_url=f"http://127.0.0.1:{PUERTO_API}", limits=limites, timeout=120) as cliente:
+        print("\n📊 RESULTADOS:")
+        print(f"{'modo':<7}{'conc.':>7}{'req/s':>10}{'p50 ms':>10}{'p99 ms':>10}{'sonda DB p50':>15}{'errores':>9}")
+        print("-" * 68)
+        for concurrencia in niveles:
+            for modo, ruta in (("sync", "/bench/isbn-sync"), ("async", "/libros/fisicos/isbn")):
+                r = await ronda(cliente, ruta, concurrencia, peticiones_por_cliente)
+                print(f"{modo:<7}{concurrencia:>7}{r['rps']:>10.1f}{r['p50']:>10.1f}{r['p99']:>10.1f}"
+                      f"{r['sonda_p50']:>15.1f}{r['errores']:>9}")
+        print("-" * 68)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--concurrencia", type=int, nargs="+", default=[10, 40, 80, 160, 320])
+    parser.add_argument("--latencia", type=float, default=3.0, help="Segundos que tarda el upstream simulado")
+    parser.add_argument("--peticiones", type=int, default=3, help="Peticiones secuenciales por cliente")
+    parser.add_argument("--limite-isbn", type=int, default=256, help="LIMITE_ISBN para la ruta async")
+    args = parser.parse_args()
+
+    # Stub y API en procesos propios: el cliente de carga no compite con ellos por el GIL
+    procesos = [
+        multiprocessing.Process(target=servir_stub, args=(args.latencia,), daemon=True),
+        multiprocessing.Process(target=servir_api, args=(args.limite_isbn,), daemon=True),
+    ]
+    for proceso in procesos:
+        proceso.start()
+    esperar_puerto(PUERTO_STUB)
+    esperar_puerto(PUERTO_API)
+
+    print(f"--- Upstream simulado con {args.latencia * 1000:.0f} ms de latencia, "
+          f"{args.peticiones} peticiones por cliente, LIMITE_ISBN={args.limite_isbn} ---")
+    try:
+        asyncio.run(ejecutar(args.concurrencia, args.peticiones))
+    finally:
+        for proceso in procesos:
+            proceso.terminate()
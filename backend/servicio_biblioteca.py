@@ -1,126 +1,169 @@
 import os
-import hashlib
-import requests
+import json
 from pathlib import Path
+from sqlalchemy import func, and_, or_
 from sqlalchemy.orm import Session
 from models import LibroDigital, LibroFisico
-from pypdf import PdfReader
-from docx import Document
-from pptx import Presentation
 import logging
-from servicio_vectorial import ServicioVectorial
-from servicio_drive import servicio_drive
+from escaner_paralelo import EscanerParalelo
+from servicio_vectorial import servicio_vectorial
+from servicio_drive import servicio_drive, MIME_CARPETA
+from database import obtener_configuracion, guardar_configuracion
+from concurrencia import limitador
+from http_saliente import peticion, sesion_http
+from persistencia_masiva import borrar_en, en_lotes, insertar_o_actualizar
+from busqueda import indice_busqueda
+from paginacion import codificar_cursor, decodificar_cursor
+from cache_lectura import cache_lectura, GRUPO_CATALOGO
 
-# Inicializar servicios globalmente para reuso
-servicio_vectorial = ServicioVectorial()
+# Estado de la sincronización incremental con Drive (tabla configuracion)
+CLAVE_TOKEN_CAMBIOS = "drive_token_cambios"
+CLAVE_CARPETAS_DRIVE = "drive_carpetas"
+
+# Listado paginado de /libros/digitales: solo se ordena por columnas con índice
+ORDENES_DIGITALES = ("id", "titulo", "autor", "categoria")
+CAMPOS_DIGITALES = ("id", "ruta", "nombre_archivo", "titulo", "autor", "formato", "tamano_bytes", "categoria",
+                    "etiquetas", "hash_md5", "num_paginas", "descripcion", "ubicacion_nube", "fecha_creacion")
+LIMITE_PAGINA_MAX = 1000
 
 # Configuración de logs
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger("ArcaServicios")
 
-class ProcesadorArchivos:
+class ServicioBiblioteca:
     @staticmethod
-    def calcular_md5(ruta_archivo: Path) -> str:
-        hash_md5 = hashlib.md5()
-        with open(ruta_archivo, "rb") as f:
-            for chunk in iter(lambda: f.read(4096), b""):
-                hash_md5.update(chunk)
-        return hash_md5.hexdigest()
+    def escanear_directorio(db: Session, ruta_raiz: str):
+        """Escanea la biblioteca local con el pipeline paralelo y devuelve métricas de rendimiento."""
+        try:
+            estadisticas = EscanerParalelo.escanear(db, ruta_raiz, servicio_vectorial=servicio_vectorial)
+            # Los libros nuevos ya se indexaron con su texto; aquí se quitan los eliminados
+            indice_busqueda.reconciliar(db)
+        finally:
+            # También si falla a medias: lo ya confirmado debe verse en /libros/digitales
+            cache_lectura.invalidar(GRUPO_CATALOGO)
+        return estadisticas
 
     @staticmethod
-    def extraer_texto(ruta_archivo: Path, max_paginas: int = 5) -> str:
-        ext = ruta_archivo.suffix.lower()
-        texto = ""
-        try:
-            if ext == ".pdf":
-                reader = PdfReader(ruta_archivo)
-                for i in range(min(max_paginas, len(reader.pages))):
-                    texto += reader.pages[i].extract_text() + "\n"
-            elif ext == ".docx":
-                doc = Document(ruta_archivo)
-                for para in doc.paragraphs[:50]: # Unas cuantas líneas
-                    texto += para.text + "\n"
-            elif ext == ".txt":
-                with open(ruta_archivo, "r", encoding="utf-8", errors="ignore") as f:
-                    texto = f.read(5000)
-        except Exception as e:
-            logger.error(f"Error extrayendo texto de {ruta_archivo}: {e}")
-        return texto.strip()
+    def listar_digitales(db: Session, limite: int = 100, cursor: str = None, orden: str = "titulo",
+                         campos=None, categoria: str = None, autor: str = None, formato: str = None):
+        """Una página del catálogo digital con paginación por cursor (keyset).
+
+        orden: columna indexada, con "-" delante para descendente. El cursor codifica
+        (valor de la columna, id) de la última fila: la siguiente página es un rango
+        del índice, sin OFFSET, así que cuesta lo mismo la página 1 que la 1000.
+        campos: columnas a devolver (None = todas). Devuelve (filas, total, siguiente_cursor).
+        """
+        descendente = orden.startswith("-")
+        nombre_orden = orden.lstrip("-")
+        if nombre_orden not in ORDENES_DIGITALES:
+            raise ValueError(f"Orden no soportado: {nombre_orden}. Opciones: {', '.join(ORDENES_DIGITALES)}")
+        campos = list(campos or CAMPOS_DIGITALES)
+        desconocidos = [c for c in campos if c not in CAMPOS_DIGITALES]
+        if desconocidos:
+            raise ValueError(f"Campos desconocidos: {', '.join(desconocidos)}")
+        limite = max(1, min(limite, LIMITE_PAGINA_MAX))
+
+        filtros = []
+        if categoria:
+            filtros.append(LibroDigital.categoria == categoria)
+        if autor:
+            filtros.append(LibroDigital.autor == autor)
+        if formato:
+            filtros.append(LibroDigital.formato == formato.lower())
+        total = db.query(func.count(LibroDigital.id)).filter(*filtros).scalar()
+
+        columna = getattr(LibroDigital, nombre_orden)
+        if cursor:
+            valor, ultimo_id = decodificar_cursor(cursor)
+            # Orden estable entre motores: NULL primero en ascendente, al final en descendente
+            if nombre_orden == "id":
+                filtros.append(columna < ultimo_id if descendente else columna > ultimo_id)
+            elif descendente:
+                filtros.append(and_(columna.is_(None), LibroDigital.id < ultimo_id) if valor is None else
+                               or_(columna < valor, and_(columna == valor, LibroDigital.id < ultimo_id),
+                                   columna.is_(None)))
+            else:
+                filtros.append(or_(columna.isnot(None), LibroDigital.id > ultimo_id) if valor is None else
+                               or_(columna > valor, and_(columna == valor, LibroDigital.id > ultimo_id)))
+
+        # Solo las columnas pedidas (más las del cursor): sin objetos ORM ni descripcion si no hace falta
+        seleccion = list(dict.fromkeys(campos + [nombre_orden, "id"]))
+        consulta = db.query(*(getattr(LibroDigital, c) for c in seleccion)).filter(*filtros)
+        if nombre_orden == "id":
+            consulta = consulta.order_by(LibroDigital.id.desc() if descendente else LibroDigital.id)
+        elif descendente:
+            consulta = consulta.order_by(columna.desc().nulls_last(), LibroDigital.id.desc())
+        else:
+            consulta = consulta.order_by(columna.asc().nulls_first(), LibroDigital.id)
+        filas = consulta.limit(limite + 1).all()
+
+        siguiente = None
+        if len(filas) > limite:
+            filas = filas[:limite]
+            ultima = filas[-1]._mapping
+            siguiente = codificar_cursor(ultima[nombre_orden], ultima["id"])
+        return [{c: fila._mapping[c] for c in campos} for fila in filas], total, siguiente
 
-class ServicioBiblioteca:
     @staticmethod
-    def escanear_directorio(db: Session, ruta_raiz: str):
-        raiz = Path(ruta_raiz)
-        extensiones = [".pdf", ".docx", ".doc", ".epub", ".pptx", ".ppt", ".txt", ".jpg", ".png", ".jpeg"]
-        
-        # Obtener hashes existentes para evitar duplicados
-        hashes_existentes = {l.hash_md5 for l in db.query(models.LibroDigital.hash_md5).all()}
-        
-        for archivo in raiz.rglob("*"):
-            if archivo.is_file() and archivo.suffix.lower() in extensiones:
+    def sincronizar_con_drive(db: Session, completa: bool = False):
+        """Sincroniza con Drive: incremental (Changes API) si hay token guardado, si no recorrido completo."""
+        token = obtener_configuracion(db, CLAVE_TOKEN_CAMBIOS)
+        carpetas = obtener_configuracion(db, CLAVE_CARPETAS_DRIVE)
+        resultado = None
+        try:
+            if token and carpetas and servicio_drive.creds and not completa:
                 try:
-                    hash_val = ProcesadorArchivos.calcular_md5(archivo)
-                    
-                    # Si ya existe en DB, saltar o actualizar
-                    if hash_val in hashes_existentes:
-                        continue
-                    
-                    # Extraer info básica
-                    stats = archivo.stat()
-                    texto_preview = ProcesadorArchivos.extraer_texto(archivo)
-                    
-                    # Clasificación simple (mejorable con IA después)
-                    categoria = "General"
-                    if "manualidad" in texto_preview.lower() or "niños" in texto_preview.lower():
-                        categoria = "Escuela Dominical"
-                    elif "teología" in texto_preview.lower() or "doctrina" in texto_preview.lower():
-                        categoria = "Seminario"
-
-                    nuevo_libro = LibroDigital(
-                        ruta=str(archivo.relative_to(raiz)),
-                        nombre_archivo=archivo.name,
-                        titulo=archivo.stem,
-                        formato=archivo.suffix.lower().replace(".", ""),
-                        tamano_bytes=stats.st_size,
-                        categoria=categoria,
-                        hash_md5=hash_val,
-                        descripcion=texto_preview[:500]
-                    )
-                    
-                    db.add(nuevo_libro)
-                    db.commit()
-                    db.refresh(nuevo_libro)
-
-                    # --- NUEVO: INDEXACIÓN VECTORIAL (RAG) ---
-                    if texto_preview:
-                        try:
-                            # Indexamos solo los primeros fragmentos para no saturar
-                            # En el futuro podríamos dividir todo el libro en chunks
-                            servicio_vectorial.indexar_fragmento(
-                                id_libro=str(nuevo_libro.id),
-                                texto=texto_preview,
-                                metadatos={
-                                    "titulo": nuevo_libro.titulo,
-                                    "autor": "Desconocido",
-                                    "categoria": nuevo_libro.categoria,
-                                    "formato": nuevo_libro.formato
-                                }
-                            )
-                            logger.info(f"Vectorizado en Chroma: {archivo.name}")
-                        except Exception as ve:
-                            logger.error(f"Error vectorizando {archivo.name}: {ve}")
-                    
-                    hashes_existentes.add(hash_val)
-                    logger.info(f"Libro indexado y guardado: {archivo.name}")
+                    resultado = ServicioBiblioteca._sincronizar_cambios(db, token, json.loads(carpetas))
                 except Exception as e:
-                    logger.error(f"Error procesando {archivo}: {e}")
+                    # Token caducado/inválido u otro fallo: el recorrido completo siempre es correcto
                     db.rollback()
+                    logger.warning(f"Sincronización incremental falló ({e}). Se hará un recorrido completo.")
+            if resultado is None:
+                resultado = ServicioBiblioteca._sincronizar_completa(db)
+            # Altas y bajas en bloque: el índice de búsqueda se pone al día comparando ids
+            indice_busqueda.reconciliar(db)
+        finally:
+            cache_lectura.invalidar(GRUPO_CATALOGO)
+        return resultado
+
+    @staticmethod
+    def _fila_drive(f) -> dict:
+        """Fila de libros_digitales para un recurso File de Drive (para inserción en bloque)."""
+        file_id, md5, name = f.get('id'), f.get('md5Checksum'), f.get('name')
+        return {
+            "ruta": file_id,
+            "nombre_archivo": name,
+            "titulo": Path(name).stem,
+            "formato": name.split('.')[-1] if '.' in name else 'gdoc',
+            "tamano_bytes": int(f.get('size', 0)),
+            "categoria": "Nube (Drive)",
+            # Si no tiene MD5 (Google Doc/Sheet), usamos el ID como "hash" temporal
+            "hash_md5": md5 if md5 else f"gdoc_{file_id}",
+            "descripcion": "Sincronizado desde la nube.",
+        }
+
+    @staticmethod
+    def _guardar_estado_cambios(db: Session, token, carpetas):
+        guardar_configuracion(db, CLAVE_TOKEN_CAMBIOS, token, "Page token de la Changes API de Drive")
+        guardar_configuracion(db, CLAVE_CARPETAS_DRIVE, json.dumps(carpetas), "Árbol de carpetas sincronizadas {id: padre}")
+        db.commit()
 
     @staticmethod
-    def sincronizar_con_drive(db: Session):
-        """Escanea Drive, añade nuevos y ELIMINA los que ya no existen en la nube."""
+    def _sincronizar_completa(db: Session):
+        """Recorre todo el árbol de Drive, añade nuevos y ELIMINA los que ya no existen en la nube."""
         logger.info("Iniciando sincronización completa con Google Drive...")
-        archivos_drive = servicio_drive.listar_archivos()
+        if not servicio_drive.service or not servicio_drive.folder_id:
+            logger.error("Servicio Drive no configurado o falta FOLDER_ID.")
+            return
+
+        try:
+            # El token se pide ANTES del recorrido: lo que cambie mientras tanto llegará en la próxima incremental
+            token_inicio = servicio_drive.obtener_token_cambios() if servicio_drive.creds else None
+            archivos_drive, carpetas = servicio_drive.recorrer_carpetas()
+        except Exception as e:
+            logger.error(f"Error listando archivos de Drive: {e}")
+            return
+        servicio_drive.metadatos.registrar(archivos_drive)
         
         if not archivos_drive:
             logger.warning("No se encontraron archivos en Drive.")
@@ -132,115 +175,226 @@ class ServicioBiblioteca:
         ids_drive = {f.get('id') for f in archivos_drive}
         md5s_drive = set(mapa_drive.keys())
 
-        # 2. Obtener lo que tenemos en la Base de Datos (solo libros de Drive)
-        libros_db = db.query(LibroDigital).filter(LibroDigital.categoria == "Nube (Drive)").all()
-        
-        # 3. ELIMINACIÓN: Borrar de DB lo que ya NO está en Drive
-        eliminados = 0
-        for libro in libros_db:
-            # Si no está por MD5 ni por ID, entonces se borró de la nube
-            if libro.hash_md5 not in md5s_drive and libro.ruta not in ids_drive:
-                db.delete(libro)
-                eliminados += 1
-        
-        if eliminados > 0:
-            db.commit()
-            logger.info(f"Limpieza completada: {eliminados} registros eliminados (ya no existen en Drive).")
+        # 2. Obtener lo que tenemos en la Base de Datos (solo libros de Drive, sin cargar objetos ORM)
+        libros_db = db.query(LibroDigital.id, LibroDigital.ruta, LibroDigital.hash_md5) \
+            .filter(LibroDigital.categoria == "Nube (Drive)").all()
 
-        if eliminados > 0:
-            db.commit()
-            logger.info(f"Limpieza completada: {eliminados} registros eliminados (ya no existen en Drive).")
+        # 3. ELIMINACIÓN: Borrar de DB lo que ya NO está en Drive (un DELETE ... IN por bloque)
+        # Si no está por MD5 ni por ID, entonces se borró de la nube
+        borrados = [(id_libro, ruta) for id_libro, ruta, hash_md5 in libros_db
+                    if hash_md5 not in md5s_drive and ruta not in ids_drive]
+        eliminados = borrar_en(db, LibroDigital.id, [id_libro for id_libro, _ in borrados])
+        ids_borrados = [ruta for _, ruta in borrados]
 
         # 4. ADICIÓN: Añadir lo que está en Drive pero no en DB
         # Obtenemos sets de control para verificar existencia
-        hashes_en_db = {l.hash_md5 for l in db.query(LibroDigital.hash_md5).filter(LibroDigital.hash_md5 != None).all()}
-        ids_en_db = {l.ruta for l in db.query(LibroDigital.ruta).filter(LibroDigital.categoria == "Nube (Drive)").all()}
-        
-        nuevos = 0
-        
+        hashes_en_db = {h for (h,) in db.query(LibroDigital.hash_md5).filter(LibroDigital.hash_md5 != None)}
+        ids_en_db = {ruta for _, ruta, _ in libros_db} - set(ids_borrados)
+
+        filas = []
         for f in archivos_drive:
             file_id = f.get('id')
             md5 = f.get('md5Checksum')
-            name = f.get('name')
-            
+
             # CRITERIO DE EXISTENCIA:
             # 1. Si tiene ID y ya está en DB (por ID/ruta) -> EXISTE.
             if file_id in ids_en_db:
                 continue
-                
+
             # 2. Si tiene MD5 y ese MD5 ya está en DB -> EXISTE (Deduplicación estricta).
             #    NOTA: Si el usuario quiere guardar duplicados, habría que comentar esto.
             #    Pero mantenemos deduplicación de contenido idéntico por sanidad.
             if md5 and md5 in hashes_en_db:
                 continue
-            
-            try:
-                # Si no tiene MD5 (Google Doc/Sheet), usamos el ID como "hash" temporal o lo dejamos nulo
-                hash_final = md5 if md5 else f"gdoc_{file_id}"
-                
-                nuevo_libro = LibroDigital(
-                    ruta=file_id,
-                    nombre_archivo=name,
-                    titulo=Path(name).stem,
-                    formato=name.split('.')[-1] if '.' in name else 'gdoc',
-                    tamano_bytes=int(f.get('size', 0)),
-                    categoria="Nube (Drive)",
-                    hash_md5=hash_final,
-                    descripcion="Sincronizado desde la nube."
-                )
-                db.add(nuevo_libro)
-                # Actualizamos sets en memoria para evitar intentar insertar duplicados en este mismo ciclo
-                if md5: hashes_en_db.add(md5)
-                ids_en_db.add(file_id)
-                
-                nuevos += 1
-                
-                if nuevos % 100 == 0:
-                    db.commit()
-            except Exception as e:
-                logger.error(f"Error registrando {name}: {e}")
-                db.rollback()
 
-        db.commit()
+            filas.append(ServicioBiblioteca._fila_drive(f))
+            # Actualizamos sets en memoria para evitar intentar insertar duplicados en este mismo ciclo
+            if md5: hashes_en_db.add(md5)
+            ids_en_db.add(file_id)
+
+        # Bajas y altas en una sola transacción; ON CONFLICT (ruta) DO NOTHING por si otra sync se adelantó
+        try:
+            insertar_o_actualizar(db, LibroDigital, filas, claves=["ruta"], actualizar=[])
+            db.commit()
+        except Exception as e:
+            db.rollback()
+            logger.error(f"Error guardando la sincronización con Drive: {e}")
+            return
+        nuevos = len(filas)
+        if eliminados > 0:
+            servicio_drive.metadatos.olvidar(ids_borrados)
+            logger.info(f"Limpieza completada: {eliminados} registros eliminados (ya no existen en Drive).")
+
+        if token_inicio:
+            ServicioBiblioteca._guardar_estado_cambios(db, token_inicio, carpetas)
         logger.info(f"Sincronización terminada. {nuevos} libros añadidos, {eliminados} eliminados.")
+        return {"modo": "completa", "nuevos": nuevos, "eliminados": eliminados}
+
+    @staticmethod
+    def _sincronizar_cambios(db: Session, token: str, carpetas: dict):
+        """Aplica solo los cambios desde la última sincronización (una llamada si no hubo ninguno).
+
+        carpetas es el árbol {carpeta_id: padre_id} de la carpeta raíz: un archivo
+        pertenece a la biblioteca si alguno de sus padres está en él.
+        """
+        cambios, nuevo_token = servicio_drive.listar_cambios(token)
+        pendientes = {}  # file_id -> recurso File a insertar/actualizar
+        bajas = set()
+
+        def descendientes(carpeta_id):
+            resultado, nivel = {carpeta_id}, {carpeta_id}
+            while nivel:
+                nivel = {c for c, padre in carpetas.items() if padre in nivel} - resultado
+                resultado |= nivel
+            return resultado
+
+        for cambio in cambios:
+            file_id = cambio['fileId']
+            archivo = cambio.get('file') or {}
+            padres = archivo.get('parents') or []
+            en_biblioteca = not cambio.get('removed') and not archivo.get('trashed') \
+                and any(p in carpetas for p in padres)
+
+            if archivo.get('mimeType') == MIME_CARPETA or file_id in carpetas:
+                if en_biblioteca and file_id not in carpetas:
+                    # Carpeta nueva o movida dentro: su contenido no genera cambios propios
+                    sub_archivos, sub_carpetas = servicio_drive.recorrer_carpetas(file_id)
+                    sub_carpetas[file_id] = padres[0]
+                    carpetas.update(sub_carpetas)
+                    pendientes.update({f['id']: f for f in sub_archivos})
+                elif en_biblioteca:
+                    carpetas[file_id] = padres[0]
+                elif file_id in carpetas:
+                    quitadas = descendientes(file_id)
+                    bajas.update(servicio_drive.metadatos.archivos_en_carpetas(quitadas))
+                    for carpeta_id in quitadas:
+                        carpetas.pop(carpeta_id, None)
+                continue
+
+            if en_biblioteca:
+                pendientes[file_id] = archivo
+                bajas.discard(file_id)
+            else:
+                bajas.add(file_id)
+                pendientes.pop(file_id, None)
+
+        # Bajas: DELETE ... IN por bloques
+        bajas = list(bajas)
+        eliminados = borrar_en(db, LibroDigital.ruta, bajas, LibroDigital.categoria == "Nube (Drive)")
+
+        # Altas y modificaciones: un único upsert sobre ruta
+        nuevos = actualizados = 0
+        if pendientes:
+            ids = list(pendientes)
+            existentes = set()
+            for lote in en_lotes(ids):
+                existentes.update(r for (r,) in db.query(LibroDigital.ruta).filter(LibroDigital.ruta.in_(lote)))
+            hashes_en_db = {h for (h,) in db.query(LibroDigital.hash_md5).filter(LibroDigital.hash_md5 != None)}
+
+            filas = []
+            for file_id, f in pendientes.items():
+                md5 = f.get('md5Checksum')
+                if file_id in existentes:
+                    actualizados += 1
+                elif md5 and md5 in hashes_en_db:
+                    continue
+                else:
+                    if md5:
+                        hashes_en_db.add(md5)
+                    nuevos += 1
+                filas.append(ServicioBiblioteca._fila_drive(f))
+            # Un renombrado en Drive cambia también el título y el formato (derivados del nombre)
+            insertar_o_actualizar(db, LibroDigital, filas, claves=["ruta"],
+                                  actualizar=["nombre_archivo", "titulo", "formato", "tamano_bytes", "hash_md5"],
+                                  extra_actualizar={"fecha_actualizacion": func.now()})
+            # reconciliar() solo añade y quita ids: los actualizados se reindexan aquí (conservan su texto)
+            ids_actualizados = []
+            for lote in en_lotes(list(existentes)):
+                ids_actualizados.extend(i for (i,) in db.query(LibroDigital.id).filter(LibroDigital.ruta.in_(lote)))
+            indice_busqueda.indexar(db, ids_actualizados)
+
+        db.commit()
+        ServicioBiblioteca._guardar_estado_cambios(db, nuevo_token, carpetas)
+        # La caché de metadatos usa su propia sesión: después del commit (SQLite bloquea escrituras cruzadas)
+        servicio_drive.metadatos.olvidar(bajas)
+        servicio_drive.metadatos.registrar(list(pendientes.values()))
+        logger.info(f"Sincronización incremental: {len(cambios)} cambios, {nuevos} añadidos, "
+                    f"{actualizados} actualizados, {eliminados} eliminados.")
+        return {"modo": "incremental", "cambios": len(cambios), "nuevos": nuevos,
+                "actualizados": actualizados, "eliminados": eliminados}
+
+# URLs configurables para poder apuntar a un stub local en pruebas de carga
+URL_OPEN_LIBRARY = os.getenv("OPEN_LIBRARY_URL", "https://openlibrary.org")
+URL_GOOGLE_BOOKS = os.getenv("GOOGLE_BOOKS_URL", "https://www.googleapis.com")
 
 class ServicioFisico:
+    @staticmethod
+    def _datos_open_library(data: dict, isbn: str):
+        key = f"ISBN:{isbn}"
+        if key not in data:
+            return None
+        info = data[key]
+        return {
+            "titulo": info.get("title"),
+            "autor": ", ".join([a["name"] for a in info.get("authors", [])]),
+            "editorial": ", ".join([p["name"] for p in info.get("publishers", [])]),
+            "ano_publicacion": info.get("publish_date"),
+            "categoria": "General"
+        }
+
+    @staticmethod
+    def _datos_google_books(data: dict):
+        if "items" not in data:
+            return None
+        info = data["items"][0]["volumeInfo"]
+        return {
+            "titulo": info.get("title"),
+            "autor": ", ".join(info.get("authors", ["Desconocido"])),
+            "editorial": info.get("publisher", "Desconocida"),
+            "ano_publicacion": info.get("publishedDate"),
+            "categoria": ", ".join(info.get("categories", ["General"]))
+        }
+
     @staticmethod
     def buscar_por_isbn(isbn: str):
         """Busca metadatos de un libro usando Open Library con fallback a Google Books."""
         # 1. Intentar Open Library
         try:
-            url_ol = f"https://openlibrary.org/api/books?bibkeys=ISBN:{isbn}&format=json&jscmd=data"
-            res = requests.get(url_ol, timeout=5)
-            data = res.json()
-            key = f"ISBN:{isbn}"
-            if key in data:
-                info = data[key]
-                return {
-                    "titulo": info.get("title"),
-                    "autor": ", ".join([a["name"] for a in info.get("authors", [])]),
-                    "editorial": ", ".join([p["name"] for p in info.get("publishers", [])]),
-                    "ano_publicacion": info.get("publish_date"),
-                    "categoria": "General"
-                }
+            url_ol = f"{URL_OPEN_LIBRARY}/api/books?bibkeys=ISBN:{isbn}&format=json&jscmd=data"
+            res = sesion_http().get(url_ol)
+            datos = ServicioFisico._datos_open_library(res.json(), isbn)
+            if datos:
+                return datos
         except Exception as e:
             logger.warning(f"Open Library falló para {isbn}: {e}")
 
         # 2. Fallback a Google Books
         try:
-            url_gb = f"https://www.googleapis.com/books/v1/volumes?q=isbn:{isbn}"
-            res = requests.get(url_gb, timeout=5)
-            data = res.json()
-            if "items" in data:
-                info = data["items"][0]["volumeInfo"]
-                return {
-                    "titulo": info.get("title"),
-                    "autor": ", ".join(info.get("authors", ["Desconocido"])),
-                    "editorial": info.get("publisher", "Desconocida"),
-                    "ano_publicacion": info.get("publishedDate"),
-                    "categoria": ", ".join(info.get("categories", ["General"]))
-                }
+            url_gb = f"{URL_GOOGLE_BOOKS}/books/v1/volumes?q=isbn:{isbn}"
+            res = sesion_http().get(url_gb)
+            return ServicioFisico._datos_google_books(res.json())
         except Exception as e:
             logger.error(f"Google Books también falló para {isbn}: {e}")
             
         return None
+
+    @staticmethod
+    async def buscar_por_isbn_async(isbn: str):
+        """Igual que buscar_por_isbn, con el cliente HTTP asíncrono y el límite del upstream "isbn"."""
+        async with limitador("isbn"):
+            try:
+                res = await peticion("GET", f"{URL_OPEN_LIBRARY}/api/books",
+                                     params={"bibkeys": f"ISBN:{isbn}", "format": "json", "jscmd": "data"})
+                datos = ServicioFisico._datos_open_library(res.json(), isbn)
+                if datos:
+                    return datos
+            except Exception as e:
+                logger.warning(f"Open Library falló para {isbn}: {e}")
+
+            try:
+                res = await peticion("GET", f"{URL_GOOGLE_BOOKS}/books/v1/volumes", params={"q": f"isbn:{isbn}"})
+                return ServicioFisico._datos_google_books(res.json())
+            except Exception as e:
+                logger.error(f"Google Books también falló para {isbn}: {e}")
+
+        return None
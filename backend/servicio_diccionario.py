@@ -0,0 +1,230 @@
+import os
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Any, AsyncIterator, Iterator, Optional, Tuple
+import anyio
+from sqlalchemy.exc import IntegrityError
+from database import SessionLocal
+from models import DefinicionDiccionario
+from cache import CacheLRU, normalizar_texto
+from servicio_ia import servicio_ia, VERSION_PROMPT_DICCIONARIO
+from concurrencia import iterar_en_hilo
+
+logger = logging.getLogger("ArcaDiccionario")
+
+CACHE_DICCIONARIO_MAX = int(os.getenv("DICCIONARIO_CACHE_SIZE", "2048"))
+# Cuánto espera una petición concurrente a que otra termine de generar el mismo término
+ESPERA_GENERACION = 90
+# Cada cuánto mira la ruta async si el líder ya terminó (esperando no ocupa ningún hilo)
+INTERVALO_ESPERA = 0.05
+
+class _Vuelo:
+    """Generación en curso de una clave: los que llegan tarde esperan su resultado."""
+
+    def __init__(self):
+        self.evento = threading.Event()
+        self.resultado = None
+
+class ServicioDiccionario:
+    """Definiciones del diccionario con caché en dos niveles.
+
+    1. LRU en memoria (aciertos en microsegundos).
+    2. Tabla definiciones_diccionario (sobrevive a reinicios y se comparte entre workers).
+    Solo si ambas fallan se llama a Gemini. Si llegan varias peticiones del mismo
+    término a la vez, solo una genera (single-flight) y las demás esperan su resultado.
+
+    Las rutas usan definir_async/definir_stream_async: la espera y la consulta a la DB no
+    ocupan plazas del límite "gemini", que solo se toma para las llamadas a Gemini del líder.
+    """
+
+    def __init__(self, servicio=servicio_ia):
+        self.servicio = servicio
+        self._cache = CacheLRU(CACHE_DICCIONARIO_MAX)
+        self._lock = threading.Lock()
+        self._en_vuelo: Dict[Tuple[str, str, str], _Vuelo] = {}
+        self.aciertos_db = 0
+        self.generaciones = 0
+        self.esperas_compartidas = 0
+
+    @staticmethod
+    def clave(termino: str, perspectiva: str) -> Tuple[str, str, str]:
+        return normalizar_texto(termino), normalizar_texto(perspectiva or "").replace(" ", "_"), VERSION_PROMPT_DICCIONARIO
+
+    def en_memoria(self, termino: str, perspectiva: str = "universal") -> Optional[str]:
+        """Definición si ya está en la LRU (sin tocar DB ni Gemini, no bloquea)."""
+        return self._cache.obtener(self.clave(termino, perspectiva), contar_fallo=False)
+
+    def definir(self, termino: str, perspectiva: str = "universal") -> str:
+        return "".join(self.definir_stream(termino, perspectiva))
+
+    def _tomar_vuelo(self, clave: Tuple[str, str, str]) -> Tuple[_Vuelo, bool]:
+        """Generación en curso de la clave (o una nueva) y si le toca generarla a quien llama."""
+        with self._lock:
+            vuelo = self._en_vuelo.get(clave)
+            if vuelo is not None:
+                self.esperas_compartidas += 1
+                return vuelo, False
+            vuelo = self._en_vuelo[clave] = _Vuelo()
+            return vuelo, True
+
+    def _terminar_vuelo(self, clave: Tuple[str, str, str], vuelo: _Vuelo):
+        with self._lock:
+            del self._en_vuelo[clave]
+        vuelo.evento.set()
+
+    def _generar(self, termino: str, perspectiva: str) -> Iterator[str]:
+        # Generador: el servicio de IA se resuelve al pedir la primera parte (en el hilo de Gemini)
+        yield from self.servicio.generar_definicion_stream(termino.strip(), perspectiva or "universal")
+
+    @staticmethod
+    def _resultado_compartido(vuelo: _Vuelo) -> str:
+        # Reciben el resultado del líder incluso si es un mensaje de error (que no se cachea)
+        return vuelo.resultado or "Error técnico: no se pudo completar la definición."
+
+    @staticmethod
+    def _mensaje_error(e: Exception) -> str:
+        logger.error(f"Error en Gemini IA: {e}")
+        return f"Error técnico: {str(e)} (Verifica la API Key en Render)"
+
+    def definir_stream(self, termino: str, perspectiva: str = "universal") -> Iterator[str]:
+        """Entrega la definición en partes: de golpe si está cacheada, token a token si se genera."""
+        clave = self.clave(termino, perspectiva)
+        definicion = self._cache.obtener(clave)
+        if definicion is not None:
+            yield definicion
+            return
+
+        vuelo, lider = self._tomar_vuelo(clave)
+        if not lider:
+            vuelo.evento.wait(ESPERA_GENERACION)
+            yield self._resultado_compartido(vuelo)
+            return
+
+        try:
+            definicion = self._buscar_en_db(clave)
+            if definicion is not None:
+                self.aciertos_db += 1
+                self._cache.guardar(clave, definicion)
+                vuelo.resultado = definicion
+                yield definicion
+                return
+
+            self.generaciones += 1
+            partes = []
+            try:
+                for texto in self._generar(termino, clave[1]):
+                    partes.append(texto)
+                    yield texto
+            except Exception as e:
+                vuelo.resultado = self._mensaje_error(e)
+                yield vuelo.resultado
+                return
+
+            definicion = "".join(partes)
+            self._guardar(clave, definicion)
+            vuelo.resultado = definicion
+        finally:
+            self._terminar_vuelo(clave, vuelo)
+
+    async def definir_async(self, termino: str, perspectiva: str = "universal") -> str:
+        return "".join([texto async for texto in self.definir_stream_async(termino, perspectiva)])
+
+    async def definir_stream_async(self, termino: str, perspectiva: str = "universal") -> AsyncIterator[str]:
+        """Como definir_stream, para el event loop.
+
+        Quien espera a otro líder no ocupa hilo ni plaza de "gemini"; el líder consulta la
+        DB en el threadpool y toma el límite "gemini" solo para pedir cada parte a Gemini.
+        """
+        clave = self.clave(termino, perspectiva)
+        definicion = self._cache.obtener(clave)
+        if definicion is not None:
+            yield definicion
+            return
+
+        vuelo, lider = self._tomar_vuelo(clave)
+        if not lider:
+            with anyio.move_on_after(ESPERA_GENERACION):
+                while not vuelo.evento.is_set():
+                    await anyio.sleep(INTERVALO_ESPERA)
+            yield self._resultado_compartido(vuelo)
+            return
+
+        try:
+            definicion = await anyio.to_thread.run_sync(self._buscar_en_db, clave)
+            if definicion is not None:
+                self.aciertos_db += 1
+                self._cache.guardar(clave, definicion)
+                vuelo.resultado = definicion
+                yield definicion
+                return
+
+            self.generaciones += 1
+            partes = []
+            try:
+                async for texto in iterar_en_hilo("gemini", self._generar(termino, clave[1])):
+                    partes.append(texto)
+                    yield texto
+            except Exception as e:
+                vuelo.resultado = self._mensaje_error(e)
+                yield vuelo.resultado
+                return
+
+            definicion = "".join(partes)
+            await anyio.to_thread.run_sync(self._guardar, clave, definicion)
+            vuelo.resultado = definicion
+        finally:
+            self._terminar_vuelo(clave, vuelo)
+
+    def _buscar_en_db(self, clave: Tuple[str, str, str]) -> Optional[str]:
+        termino_normalizado, perspectiva, version = clave
+        db = SessionLocal()
+        try:
+            fila = db.query(DefinicionDiccionario.definicion).filter(
+                DefinicionDiccionario.termino == termino_normalizado,
+                DefinicionDiccionario.perspectiva == perspectiva,
+                DefinicionDiccionario.version_prompt == version
+            ).first()
+            return fila.definicion if fila else None
+        finally:
+            db.close()
+
+    def _guardar(self, clave: Tuple[str, str, str], definicion: str):
+        termino_normalizado, perspectiva, version = clave
+        self._cache.guardar(clave, definicion)
+        db = SessionLocal()
+        try:
+            db.add(DefinicionDiccionario(
+                termino=termino_normalizado,
+                perspectiva=perspectiva,
+                version_prompt=version,
+                definicion=definicion
+            ))
+            db.commit()
+        except IntegrityError:
+            # Otro worker la guardó primero: nos quedamos con la suya la próxima vez
+            db.rollback()
+        finally:
+            db.close()
+
+    def precalentar(self, terminos, perspectiva: str = "universal", concurrencia: int = 4) -> Dict[str, int]:
+        """Genera (o carga desde DB) las definiciones de una lista de términos."""
+        generaciones_antes = self.generaciones
+        with ThreadPoolExecutor(max_workers=concurrencia) as pool:
+            resultados = list(pool.map(lambda t: self.definir(t, perspectiva), terminos))
+        errores = sum(1 for r in resultados if r.startswith("Error técnico"))
+        return {
+            "terminos": len(resultados),
+            "generados": self.generaciones - generaciones_antes - errores,
+            "errores": errores,
+        }
+
+    def estadisticas(self) -> Dict[str, Any]:
+        return {
+            "memoria": self._cache.estadisticas(),
+            "aciertos_db": self.aciertos_db,
+            "generaciones": self.generaciones,
+            "esperas_compartidas": self.esperas_compartidas,
+        }
+
+servicio_diccionario = ServicioDiccionario()
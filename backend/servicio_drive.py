@@ -1,13 +1,26 @@
 import os
 import io
+import time
 import logging
-from google.oauth2 import service_account
-from googleapiclient.discovery import build
-from googleapiclient.http import MediaIoBaseDownload
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
 from pathlib import Path
+from metadatos_drive import CacheMetadatosDrive
+from http_saliente import peticion, sesion_http
+from servicios import registro
 
 logger = logging.getLogger("ArcaDrive")
 
+MIME_CARPETA = "application/vnd.google-apps.folder"
+CAMPOS_ARCHIVO = "id, name, mimeType, size, md5Checksum, modifiedTime, parents"
+
+# Listados de subcarpetas simultáneos durante el recorrido recursivo
+HILOS_RECORRIDO = int(os.getenv("DRIVE_CRAWL_WORKERS", "8"))
+
+# El hilo de fondo renueva el token este tiempo antes de que caduque
+MARGEN_RENOVACION_TOKEN = 300
+
 class ServicioDrive:
     def __init__(self):
         # 1. Configuración de Identidad
@@ -19,8 +32,15 @@ class ServicioDrive:
         
         self.service = None
         self.creds = None
+        self.metadatos = CacheMetadatosDrive()
+        self._lock_token = threading.Lock()
+        self._local = threading.local()
+        self._hilo_token = None
         
         # 2. Prioridad: Service Account (JSON directo o Archivo)
+        # Imports diferidos: el cliente de Google solo se carga al crear el servicio
+        from google.oauth2 import service_account
+        from googleapiclient.discovery import build
         try:
             if self.contenido_credenciales:
                 import json
@@ -53,102 +73,211 @@ class ServicioDrive:
         if not self.service:
             logger.warning("Google Drive no está autenticado. La sincronización fallará.")
 
-    def listar_archivos(self):
-        """Lista todos los archivos compatibles en la carpeta de Drive configurada."""
-        if not self.service or not self.folder_id:
-            logger.error("Servicio Drive no configurado o falta FOLDER_ID.")
-            return []
+    def _renovar_token(self):
+        from google.auth.transport.requests import Request
+        with self._lock_token:
+            self.creds.refresh(Request(session=sesion_http()))
 
-        query = f"'{self.folder_id}' in parents and trashed = false"
-        archivos = []
-        page_token = None
-        
-        try:
-            while True:
-                response = self.service.files().list(
-                    q=query,
-                    spaces='drive',
-                    pageSize=1000,
-                    fields='nextPageToken, files(id, name, mimeType, size, md5Checksum)',
-                    pageToken=page_token
-                ).execute()
-                
-                archivos.extend(response.get('files', []))
-                page_token = response.get('nextPageToken', None)
-                if not page_token:
-                    break
-            return archivos
-        except Exception as e:
-            logger.error(f"Error listando archivos de Drive: {e}")
-            return []
+    def token_vigente(self) -> str:
+        """Token Bearer actual. Solo se renueva aquí si el hilo de fondo no llegó a tiempo."""
+        if self.creds.expired or not self.creds.token:
+            self._renovar_token()
+        return self.creds.token
 
-    def generar_descarga(self, file_id):
-        """Generador que hace streaming directo desde Drive sin usar RAM."""
-        # Helper para generador vacío
-        def empty_gen(): yield b""
+    def iniciar_renovacion_token(self):
+        """Arranca el hilo que renueva el token antes de caducar, fuera del camino de las peticiones."""
+        if not self.creds or self._hilo_token:
+            return
+        self._hilo_token = threading.Thread(target=self._bucle_renovacion, name="RenovadorTokenDrive", daemon=True)
+        self._hilo_token.start()
 
-        if not self.service: 
-            return empty_gen(), "application/octet-stream", "error.bin"
-        
-        try:
-            import requests
-            
-            # URLs Base
-            url_descarga = f"https://www.googleapis.com/drive/v3/files/{file_id}?alt=media"
-            headers = {}
-            params = {}
-
-            # Estrategia de Autenticación para el Request manual
+    def _bucle_renovacion(self):
+        while True:
+            try:
+                # google-auth guarda expiry como UTC sin zona horaria
+                ahora = datetime.now(timezone.utc).replace(tzinfo=None)
+                if not self.creds.token or not self.creds.expiry or \
+                        (self.creds.expiry - ahora).total_seconds() < MARGEN_RENOVACION_TOKEN:
+                    self._renovar_token()
+                    logger.info("Token de Google Drive renovado en segundo plano.")
+                espera = (self.creds.expiry - ahora).total_seconds() - MARGEN_RENOVACION_TOKEN
+            except Exception as e:
+                logger.warning(f"No se pudo renovar el token de Drive: {e}")
+                espera = 60
+            time.sleep(max(espera, 30))
+
+    def _servicio_hilo(self):
+        """Cliente de la API por hilo: los objetos de googleapiclient (httplib2) no son thread-safe."""
+        servicio = getattr(self._local, "service", None)
+        if servicio is None:
+            from googleapiclient.discovery import build
             if self.creds:
-                # Caso A: Service Account (Token Bearer)
-                if self.creds.expired:
-                    from google.auth.transport.requests import Request
-                    self.creds.refresh(Request())
-                headers["Authorization"] = f"Bearer {self.creds.token}"
-            elif self.api_key:
-                # Caso B: API Key (Parametro key)
-                params["key"] = self.api_key
+                servicio = build('drive', 'v3', credentials=self.creds, cache_discovery=False)
             else:
-                logger.error("No hay credenciales válidas para streaming.")
-                return empty_gen(), "application/octet-stream", "error.bin"
+                servicio = build('drive', 'v3', developerKey=self.api_key, cache_discovery=False)
+            self._local.service = servicio
+        return servicio
 
-            # Determinar MIME type real y nombre
-            mime_type_real = "application/octet-stream"
-            nombre_archivo = "archivo_descarga"
-            
-            try:
-                meta = self.service.files().get(
-                    fileId=file_id, 
-                    fields="mimeType, name"
-                ).execute()
-                
-                mime_type_real = meta.get('mimeType', 'application/octet-stream')
-                nombre_archivo = meta.get('name', 'archivo')
-
-                if mime_type_real.startswith('application/vnd.google-apps'):
-                    # Si es Doc/Sheet/Slide nativo, forzar PDF
-                    url_descarga = f"https://www.googleapis.com/drive/v3/files/{file_id}/export"
-                    params["mimeType"] = "application/pdf"
-                    mime_type_real = "application/pdf"
-                    nombre_archivo += ".pdf"
-            
-            except Exception as e:
-                logger.warning(f"No se pudieron obtener metadatos para {file_id}: {e}")
+    def _listar_hijos(self, carpeta_id):
+        """Todo el contenido directo de una carpeta (archivos y subcarpetas), paginado."""
+        hijos = []
+        page_token = None
+        while True:
+            response = self._servicio_hilo().files().list(
+                q=f"'{carpeta_id}' in parents and trashed = false",
+                spaces='drive',
+                pageSize=1000,
+                fields=f'nextPageToken, files({CAMPOS_ARCHIVO})',
+                pageToken=page_token
+            ).execute()
+            hijos.extend(response.get('files', []))
+            page_token = response.get('nextPageToken', None)
+            if not page_token:
+                return hijos
+
+    def recorrer_carpetas(self, raiz=None):
+        """Recorrido recursivo desde la carpeta raíz, listando cada nivel de subcarpetas en paralelo.
+
+        Devuelve (archivos, carpetas) donde carpetas es {carpeta_id: carpeta_padre_id}
+        incluyendo la raíz. Lanza excepción si falla cualquier listado: un recorrido
+        incompleto haría creer a la sincronización que faltan archivos.
+        """
+        raiz = raiz or self.folder_id
+        carpetas = {raiz: None}
+        archivos = []
+        nivel = [raiz]
+        with ThreadPoolExecutor(max_workers=HILOS_RECORRIDO) as pool:
+            while nivel:
+                siguiente = []
+                for carpeta_id, hijos in zip(nivel, pool.map(self._listar_hijos, nivel)):
+                    for hijo in hijos:
+                        if hijo.get('mimeType') == MIME_CARPETA:
+                            if hijo['id'] not in carpetas:
+                                carpetas[hijo['id']] = carpeta_id
+                                siguiente.append(hijo['id'])
+                        else:
+                            archivos.append(hijo)
+                nivel = siguiente
+        logger.info(f"Recorrido de Drive: {len(archivos)} archivos en {len(carpetas)} carpetas.")
+        return archivos, carpetas
 
-            # Streaming Request
-            def iterador_stream():
-                with requests.get(url_descarga, headers=headers, params=params, stream=True) as r:
-                    r.raise_for_status()
-                    for chunk in r.iter_content(chunk_size=1024 * 1024): 
-                        yield chunk
-            
-            return iterador_stream(), mime_type_real, nombre_archivo
+    def obtener_token_cambios(self):
+        """Punto de partida del registro de cambios (Changes API) a partir de ahora."""
+        return self._servicio_hilo().changes().getStartPageToken().execute()['startPageToken']
+
+    def listar_cambios(self, page_token):
+        """Cambios desde page_token: (cambios, nuevo_token).
+
+        Sin cambios cuesta una sola llamada a la API. Requiere Service Account
+        (la Changes API no funciona con API Key).
+        """
+        cambios = []
+        while True:
+            response = self._servicio_hilo().changes().list(
+                pageToken=page_token,
+                spaces='drive',
+                pageSize=1000,
+                includeRemoved=True,
+                fields=f'nextPageToken, newStartPageToken, changes(fileId, removed, file({CAMPOS_ARCHIVO}, trashed))'
+            ).execute()
+            cambios.extend(response.get('changes', []))
+            if 'newStartPageToken' in response:
+                return cambios, response['newStartPageToken']
+            page_token = response['nextPageToken']
+
+    def preparar_descarga(self, file_id):
+        """Resuelve URL, cabeceras de autenticación y metadatos para descargar un archivo.
+
+        Devuelve un dict con url, headers, params, mime_type, nombre, md5, tamano y
+        modificado (RFC 3339 de Drive), o None si no hay credenciales. Hace llamadas bloqueantes (refresco del
+        token y metadatos), así que desde rutas async se llama con en_hilo("drive", ...).
+        """
+        if not self.service:
+            return None
+        inicio = time.perf_counter()
+
+        # URLs Base
+        url_descarga = f"https://www.googleapis.com/drive/v3/files/{file_id}?alt=media"
+        headers = {}
+        params = {}
+
+        # Estrategia de Autenticación para el Request manual
+        if self.creds:
+            # Caso A: Service Account (Token Bearer, normalmente ya renovado en segundo plano)
+            headers["Authorization"] = f"Bearer {self.token_vigente()}"
+        elif self.api_key:
+            # Caso B: API Key (Parametro key)
+            params["key"] = self.api_key
+        else:
+            logger.error("No hay credenciales válidas para streaming.")
+            return None
+
+        # Determinar MIME type real y nombre (caché de metadatos; files().get solo si falla)
+        mime_type_real = "application/octet-stream"
+        nombre_archivo = "archivo_descarga"
+        meta = {}
+
+        try:
+            meta, acierto = self.metadatos.obtener(file_id, lambda: self._servicio_hilo().files().get(
+                fileId=file_id, 
+                fields=CAMPOS_ARCHIVO
+            ).execute())
+            self.metadatos.registrar_apertura(acierto, time.perf_counter() - inicio)
+
+            mime_type_real = meta.get('mime_type') or 'application/octet-stream'
+            nombre_archivo = meta.get('nombre') or 'archivo'
+
+            if mime_type_real.startswith('application/vnd.google-apps'):
+                # Si es Doc/Sheet/Slide nativo, forzar PDF
+                url_descarga = f"https://www.googleapis.com/drive/v3/files/{file_id}/export"
+                params["mimeType"] = "application/pdf"
+                mime_type_real = "application/pdf"
+                nombre_archivo += ".pdf"
 
         except Exception as e:
-            logger.error(f"Error en streaming {file_id}: {e}")
-            # Retornar generador vacío y mime fallback
-            def empty_gen(): yield b""
-            return empty_gen(), "application/octet-stream", "error.bin"
+            logger.warning(f"No se pudieron obtener metadatos para {file_id}: {e}")
+
+        exportado = url_descarga.endswith("/export")
+        return {
+            "url": url_descarga,
+            "headers": headers,
+            "params": params,
+            "mime_type": mime_type_real,
+            "nombre": nombre_archivo,
+            # Los documentos nativos exportados a PDF no tienen md5 ni tamaño fijo
+            "md5": None if exportado else meta.get("md5"),
+            "tamano": None if exportado else meta.get("tamano_bytes"),
+            "modificado": meta.get("modificado"),
+        }
+
+    async def abrir_descarga_async(self, descarga, rango=None):
+        """Abre la descarga sin leer el cuerpo, para conocer estado y cabeceras antes de responder.
+
+        Con rango, Drive contesta 206 con Content-Range. Quien llama debe consumir
+        la respuesta con iterar_respuesta (que la cierra).
+        """
+        # identity: los bytes llegan tal cual y Content-Length/Content-Range siguen siendo válidos
+        headers = {**descarga["headers"], "Accept-Encoding": "identity"}
+        if rango:
+            headers["Range"] = rango
+        return await peticion("GET", descarga["url"], stream=True, headers=headers, params=descarga["params"])
+
+    @staticmethod
+    async def iterar_respuesta(respuesta):
+        try:
+            async for chunk in respuesta.aiter_bytes(chunk_size=1024 * 1024):
+                yield chunk
+        finally:
+            await respuesta.aclose()
+
+    async def iterar_descarga_async(self, descarga):
+        """Streaming asíncrono del archivo completo: no retiene un hilo mientras llegan los bytes."""
+        respuesta = await self.abrir_descarga_async(descarga)
+        if respuesta.status_code >= 400:
+            await respuesta.aclose()
+            respuesta.raise_for_status()
+        async for chunk in self.iterar_respuesta(respuesta):
+            yield chunk
 
     
     def probar_conexion(self):
@@ -162,4 +291,4 @@ class ServicioDrive:
         except Exception as e:
             return {"estado": "error", "mensaje": str(e)}
 
-servicio_drive = ServicioDrive()
+servicio_drive = registro.registrar("drive", ServicioDrive)
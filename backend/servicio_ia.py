@@ -1,10 +1,16 @@
-import google.generativeai as genai
 import os
 import logging
-from typing import Optional
+from typing import Optional, Iterator, AsyncIterator
+from servicios import registro
 
 logger = logging.getLogger("ArcaIA")
 
+# Incrementar al cambiar el prompt del diccionario: invalida las definiciones cacheadas
+VERSION_PROMPT_DICCIONARIO = "2"
+
+# Perspectivas que usan el prompt neutral tal cual (el frontend envía "academico_global")
+PERSPECTIVAS_NEUTRALES = {"universal", "academico_global", ""}
+
 class ServicioIA:
     def __init__(self):
         self.api_key = os.getenv("VITE_GEMINI_API_KEY")
@@ -14,6 +20,8 @@ class ServicioIA:
             logger.warning("VITE_GEMINI_API_KEY no configurada en el backend.")
         else:
             try:
+                # Import diferido: google.generativeai tarda más de medio segundo en cargarse
+                import google.generativeai as genai
                 genai.configure(api_key=self.api_key)
                 # Intentamos usar la versión 2.5 solicitada por el usuario
                 try:
@@ -26,11 +34,7 @@ class ServicioIA:
                 logger.error(f"Error inicializando Gemini: {e}")
                 self.model = None
 
-    def definir_termino(self, termino: str, perspectiva: str = "universal") -> str:
-        """Genera una definición teológica para un término dado."""
-        if not self.api_key:
-            return "Servicio de IA no configurado."
-
+    def construir_prompt_definicion(self, termino: str, perspectiva: str = "universal") -> str:
         # Prompt Universal: Académico, Neutral, Exegético y Teológico (sin sesgos denominacionales)
         base_prompt = """
         Eres un teólogo académico y erudito bíblico. Tu objetivo es definir términos teológicos de manera universal, neutral y rigurosa.
@@ -42,16 +46,81 @@ class ServicioIA:
         4. Desarrollo teológico (mencionando brevemente diferentes posturas históricas si hay controversia, pero manteniendo neutralidad).
         
         Evita jerga innecesaria. Sé claro, directo y pastoralmente útil pero academicamente sólido.
-        No favorezcas la postura reformada, arminiana, católica u otra, a menos que el término sea específico de esa tradición.
         """
 
-        prompt_final = f"{base_prompt}\n\nTérmino a definir: {termino}\n\nRespuesta en español formal:"
+        if perspectiva in PERSPECTIVAS_NEUTRALES:
+            base_prompt += "No favorezcas la postura reformada, arminiana, católica u otra, a menos que el término sea específico de esa tradición.\n"
+        else:
+            base_prompt += (
+                f"En el punto 4 desarrolla el término desde la tradición {perspectiva.replace('_', ' ')}, "
+                "indicando con honestidad dónde difiere de otras tradiciones.\n"
+            )
+
+        return f"{base_prompt}\n\nTérmino a definir: {termino}\n\nRespuesta en español formal:"
+
+    def generar_definicion(self, termino: str, perspectiva: str = "universal") -> str:
+        """Llama a Gemini y devuelve la definición. Lanza excepción si falla (no se cachean errores)."""
+        if not self.model:
+            raise RuntimeError("Servicio de IA no configurado.")
+        respuesta = self.model.generate_content(self.construir_prompt_definicion(termino, perspectiva))
+        return respuesta.text
+
+    def generar_definicion_stream(self, termino: str, perspectiva: str = "universal") -> Iterator[str]:
+        """Como generar_definicion, pero entrega el texto a medida que Gemini lo produce."""
+        if not self.model:
+            raise RuntimeError("Servicio de IA no configurado.")
+        return self.generar_stream(self.construir_prompt_definicion(termino, perspectiva))
+
+    def construir_prompt_rag(self, pregunta: str, contexto: str) -> str:
+        return f"""
+    Eres 'El Arca AI', un asistente especializado en teología y biblia. 
+    Usa el siguiente contexto extraído de la biblioteca personal del usuario para responder a su pregunta.
+    Si el contexto no contiene la información, usa tu conocimiento general pero prioriza el contexto.
+
+    CONTEXTO:
+    {contexto}
+
+    PREGUNTA:
+    {pregunta}
+
+    Respuesta técnica, pastoral y profesional en español:
+    """
+
+    def generar_stream(self, prompt: str) -> Iterator[str]:
+        """Generador de fragmentos de texto (stream=True de Gemini)."""
+        for parte in self.model.generate_content(prompt, stream=True):
+            # Las partes sin texto (p.ej. solo metadatos de seguridad) lanzan al leer .text
+            try:
+                texto = parte.text
+            except ValueError:
+                continue
+            if texto:
+                yield texto
+
+    async def generar_async(self, prompt: str) -> str:
+        """Respuesta completa con el cliente asíncrono de Gemini (no ocupa hilos)."""
+        respuesta = await self.model.generate_content_async(prompt)
+        return respuesta.text
+
+    async def generar_stream_async(self, prompt: str) -> AsyncIterator[str]:
+        """Versión asíncrona de generar_stream."""
+        async for parte in await self.model.generate_content_async(prompt, stream=True):
+            try:
+                texto = parte.text
+            except ValueError:
+                continue
+            if texto:
+                yield texto
+
+    def definir_termino(self, termino: str, perspectiva: str = "universal") -> str:
+        """Genera una definición teológica para un término dado."""
+        if not self.api_key:
+            return "Servicio de IA no configurado."
 
         try:
-            respuesta = self.model.generate_content(prompt_final)
-            return respuesta.text
+            return self.generar_definicion(termino, perspectiva)
         except Exception as e:
             logger.error(f"Error en Gemini IA: {e}")
             return f"Error técnico: {str(e)} (Verifica la API Key en Render)"
 
-servicio_ia = ServicioIA()
+servicio_ia = registro.registrar("ia", ServicioIA)
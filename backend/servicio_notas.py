@@ -0,0 +1,210 @@
+import os
+import json
+import hashlib
+from datetime import datetime, timedelta, timezone
+from typing import Optional
+from sqlalchemy import String, func, and_, or_, type_coerce
+from sqlalchemy.orm import Session
+from models import Nota, NotaEliminada
+from busqueda import texto_de_html, indice_notas
+from database import guardar_configuracion
+from migraciones import CLAVE_HUELLA_NOTA_SISTEMA
+from paginacion import codificar_cursor, decodificar_cursor
+from cache_lectura import cache_lectura, GRUPO_NOTA_SISTEMA
+
+# Resumen de notas del cuaderno: todo menos contenido_html (el cuerpo se pide al abrir la nota)
+CAMPOS_RESUMEN = ("id", "titulo", "previsualización", "palabras_clave", "es_favorita", "es_sistema",
+                  "fecha_creacion", "fecha_actualizacion", "version")
+LIMITE_PAGINA_NOTAS_MAX = 500
+
+# Las lápidas de notas borradas se guardan este tiempo; un cliente que lleve más sin
+# sincronizar recibe reiniciar=True y vuelve a pedir el resumen completo
+NOTAS_RETENCION_ELIMINADAS_DIAS = int(os.getenv("NOTAS_RETENCION_ELIMINADAS_DIAS", "90"))
+LONGITUD_PREVISUALIZACION = 100
+# Campos indexados en notas_fts: si cambia alguno hay que reindexar la nota
+CAMPOS_INDEXADOS = {"titulo", "palabras_clave", "contenido_html"}
+
+# CURRENT_TIMESTAMP de SQLite tiene resolución de segundos: se repite el último segundo
+# de la sincronización anterior (el cliente reemplaza por id, así que no duplica)
+MARGEN_SINCRONIZACION = timedelta(seconds=1)
+
+# Nota de bienvenida global (es_sistema): se siembra o actualiza solo cuando cambia su huella
+NOTA_SISTEMA = {
+    "titulo": "Bienvenido a El Arca (Sistema)",
+    "contenido_html": """
+<h3 class="text-xl font-bold text-amber-500 mb-4">Saludo de Bienvenida</h3>
+<p class="mb-4">Hola, soy <strong>Héctor</strong>, desarrollador de este espacio de estudio bíblico.</p>
+<p class="mb-4">A quien le comparta esta aplicación o tenga acceso, decir que es una idea nacida de la necesidad de tener un lugar de <em>inmersión</em> en el estudio de la Palabra, que por lo general ha sido físico, pero teniendo en cuenta que hoy en día la digitalización es ya parte de nuestras vidas, ¿por qué no tener un espacio como tal?</p>
+<p class="mb-4">Así, inspirado por otras ideas de nivel estratosféricamente profesionales como lo son por ejemplo <em>Logos (Faithlife)</em> o <em>e-Sword</em>, creé esta aplicación web llamada <strong>El Arca</strong>, donde he subido varios archivos digitales recopilados a través del tiempo entre mi familia y amigos. Con un total en el comienzo de 1199 archivos con distintos tipos de libros, tareas, manualidades, etc. Se ha conformado la biblioteca digital.</p>
+<p class="mb-4">Estoy trabajando para poder indexar todos los archivos y poder crear etiquetas que relacione todos los archivos con determinados temas. Por lo pronto, trabajaré en la categorización y renombrado correcto de los archivos para una mejor búsqueda de estos.</p>
+<p class="mb-4">Finalmente, quiero desearles a todos una experiencia enriquecedora y que realmente pueda ser un aporte o un valor agregado al estudio de la Palabra de Dios y el estudio Teológico.</p>
+<hr class="border-gray-700 my-4"/>
+<p class="text-sm text-gray-400 italic">Cualquier comentario para mejorar es bienvenido. Pueden contactarme a través de la opción "Acerca de".</p>
+""",
+    "previsualización": "Nota global del sistema.",
+    "palabras_clave": "sistema, inicio",
+}
+
+class ServicioNotas:
+    @staticmethod
+    def _del_usuario(user_id: Optional[str]):
+        # Sin usuario (caso legacy) se ven las notas sin dueño, igual que en GET /notas
+        return Nota.user_id == user_id if user_id else Nota.user_id.is_(None)
+
+    @staticmethod
+    def ahora(db: Session) -> datetime:
+        """Hora de la base de datos (la misma que escribe fecha_actualizacion)."""
+        ahora = db.query(func.now()).scalar()
+        return datetime.fromisoformat(ahora) if isinstance(ahora, str) else ahora
+
+    @staticmethod
+    def _normalizar(fecha: datetime) -> datetime:
+        # SQLite guarda UTC sin zona: se compara en UTC naive
+        if fecha.tzinfo is not None:
+            fecha = fecha.astimezone(timezone.utc).replace(tzinfo=None)
+        return fecha
+
+    @staticmethod
+    def _columna_fecha(db: Session):
+        # SQLite guarda las fechas como texto ('YYYY-MM-DD HH:MM:SS', escrito por CURRENT_TIMESTAMP) y
+        # un datetime se enviaría con microsegundos: el cursor se compara con el texto tal cual
+        if db.get_bind().dialect.name == "sqlite":
+            return type_coerce(Nota.fecha_actualizacion, String)
+        return Nota.fecha_actualizacion
+
+    @staticmethod
+    def listar_resumen(db: Session, user_id: Optional[str] = None, limite: int = 100, cursor: str = None):
+        """Una página del cuaderno, de la nota modificada más recientemente a la más antigua.
+
+        Paginación por cursor sobre (fecha_actualizacion, id), que recorre el índice
+        ix_notas_user_id_fecha_actualizacion. Devuelve (filas, total, siguiente_cursor).
+        """
+        limite = max(1, min(limite, LIMITE_PAGINA_NOTAS_MAX))
+        filtros = [ServicioNotas._del_usuario(user_id)]
+        total = db.query(func.count(Nota.id)).filter(*filtros).scalar()
+
+        fecha = ServicioNotas._columna_fecha(db)
+        if cursor:
+            valor, ultimo_id = decodificar_cursor(cursor)
+            if valor is None:
+                filtros.append(and_(Nota.fecha_actualizacion.is_(None), Nota.id < ultimo_id))
+            else:
+                if fecha is Nota.fecha_actualizacion:
+                    try:
+                        valor = datetime.fromisoformat(valor)
+                    except (TypeError, ValueError):
+                        raise ValueError("Cursor inválido")
+                filtros.append(or_(fecha < valor, and_(fecha == valor, Nota.id < ultimo_id),
+                                   Nota.fecha_actualizacion.is_(None)))
+
+        filas = db.query(*(getattr(Nota, c) for c in CAMPOS_RESUMEN), fecha.label("orden")).filter(*filtros) \
+            .order_by(Nota.fecha_actualizacion.desc().nulls_last(), Nota.id.desc()) \
+            .limit(limite + 1).all()
+
+        siguiente = None
+        if len(filas) > limite:
+            filas = filas[:limite]
+            orden = filas[-1].orden
+            siguiente = codificar_cursor(orden.isoformat() if isinstance(orden, datetime) else orden, filas[-1].id)
+        return [{c: fila._mapping[c] for c in CAMPOS_RESUMEN} for fila in filas], total, siguiente
+
+    @staticmethod
+    def cambios(db: Session, desde: datetime, user_id: Optional[str] = None):
+        """Notas creadas o modificadas e ids de notas borradas desde `desde`.
+
+        "hasta" es la marca que el cliente debe enviar en la siguiente llamada.
+        Si las lápidas de ese periodo ya se purgaron, reiniciar=True y sin datos.
+        """
+        hasta = ServicioNotas.ahora(db)
+        desde = ServicioNotas._normalizar(desde) - MARGEN_SINCRONIZACION
+        if desde < ServicioNotas._normalizar(hasta) - timedelta(days=NOTAS_RETENCION_ELIMINADAS_DIAS):
+            return {"notas": [], "eliminadas": [], "hasta": hasta, "reiniciar": True}
+
+        notas = db.query(Nota).filter(ServicioNotas._del_usuario(user_id), Nota.fecha_actualizacion >= desde) \
+            .order_by(Nota.fecha_actualizacion, Nota.id).all()
+        usuario = NotaEliminada.user_id == user_id if user_id else NotaEliminada.user_id.is_(None)
+        eliminadas = [nota_id for (nota_id,) in db.query(NotaEliminada.nota_id).filter(
+            usuario, NotaEliminada.fecha_eliminacion >= desde)]
+        return {"notas": notas, "eliminadas": eliminadas, "hasta": hasta, "reiniciar": False}
+
+    @staticmethod
+    def registrar_eliminacion(db: Session, nota: Nota):
+        """Deja la lápida de una nota borrada y purga las que superan la retención. No hace commit."""
+        db.add(NotaEliminada(nota_id=nota.id, user_id=nota.user_id))
+        limite = ServicioNotas._normalizar(ServicioNotas.ahora(db)) - timedelta(days=NOTAS_RETENCION_ELIMINADAS_DIAS)
+        db.query(NotaEliminada).filter(NotaEliminada.fecha_eliminacion < limite).delete(synchronize_session=False)
+
+    @staticmethod
+    def previsualizacion(contenido_html: Optional[str]) -> str:
+        """Primeros caracteres del texto de la nota (lo que muestra la tarjeta del cuaderno)."""
+        texto = texto_de_html(contenido_html)
+        return texto[:LONGITUD_PREVISUALIZACION] + "..." if texto else "Sin contenido..."
+
+    @staticmethod
+    def aplicar_cambios(contenido: Optional[str], cambios) -> str:
+        """Aplica cambios {desde, hasta, texto} con posiciones sobre `contenido` (sin solaparse).
+
+        Las posiciones son unidades UTF-16, como las cadenas del navegador: se trabaja sobre
+        la codificación UTF-16 para que los caracteres fuera del BMP (emojis) no las desplacen.
+        """
+        datos = (contenido or "").encode("utf-16-le")
+        longitud = len(datos) // 2
+        partes, anterior = [], 0
+        for cambio in sorted(cambios, key=lambda c: (c.desde, c.hasta)):
+            if cambio.desde < anterior or cambio.hasta < cambio.desde or cambio.hasta > longitud:
+                raise ValueError("Cambio fuera del documento o solapado con otro")
+            partes.append(datos[2 * anterior:2 * cambio.desde])
+            partes.append(cambio.texto.encode("utf-16-le"))
+            anterior = cambio.hasta
+        partes.append(datos[2 * anterior:])
+        try:
+            return b"".join(partes).decode("utf-16-le")
+        except UnicodeDecodeError:
+            raise ValueError("Cambio que parte un carácter en dos")
+
+    @staticmethod
+    def aplicar_parche(nota: Nota, parche) -> bool:
+        """Aplica un NotaParche asignando solo los campos que cambian (el UPDATE lleva solo esos). No hace flush.
+
+        La previsualización se recalcula aquí a partir del contenido resultante.
+        Devuelve True si cambió algún campo indexado (hay que reindexar la nota).
+        """
+        valores = {campo: getattr(parche, campo) for campo in ("titulo", "palabras_clave", "es_favorita")
+                   if getattr(parche, campo) is not None}
+        if parche.cambios:
+            contenido = ServicioNotas.aplicar_cambios(nota.contenido_html, parche.cambios)
+            valores["contenido_html"] = contenido
+            valores["previsualización"] = ServicioNotas.previsualizacion(contenido)
+        cambiados = {campo for campo, valor in valores.items() if getattr(nota, campo) != valor}
+        for campo in cambiados:
+            setattr(nota, campo, valores[campo])
+        return bool(cambiados & CAMPOS_INDEXADOS)
+
+    @staticmethod
+    def huella_nota_sistema() -> str:
+        return hashlib.sha256(json.dumps(NOTA_SISTEMA, sort_keys=True).encode("utf-8")).hexdigest()
+
+    @staticmethod
+    def sembrar_nota_sistema(db: Session, huella_guardada: Optional[str]) -> bool:
+        """Crea o actualiza la nota de sistema si su contenido cambió (huella en configuracion).
+
+        Con la huella al día no toca la base: ningún arranque reescribe la nota.
+        """
+        huella = ServicioNotas.huella_nota_sistema()
+        if huella_guardada == huella:
+            return False
+        nota = db.query(Nota).filter(Nota.es_sistema == True).first()
+        if not nota:
+            print("🌱 Creando nota de bienvenida del sistema (Nueva)...")
+            nota = Nota(**NOTA_SISTEMA, es_favorita=False, es_sistema=True, user_id=None)
+            db.add(nota)
+        else:
+            print("🔄 Actualizando contenido de nota de sistema...")
+            nota.titulo = NOTA_SISTEMA["titulo"]
+            nota.contenido_html = NOTA_SISTEMA["contenido_html"]
+        db.flush()
+        indice_notas.indexar(db, [nota])
+        guardar_configuracion(db, CLAVE_HUELLA_NOTA_SISTEMA, huella, "Huella de la nota de sistema sembrada")
+        db.commit()
+        cache_lectura.invalidar(GRUPO_NOTA_SISTEMA)
+        return True
@@ -1,20 +1,142 @@
-import chromadb
-from chromadb.config import Settings
 import os
+import time
+import hashlib
+import random
 import logging
+import threading
+from abc import ABC, abstractmethod
+from collections import deque
 from typing import List, Dict, Any
+from cache import CacheLRU, normalizar_texto
+from servicios import registro
 
 logger = logging.getLogger("ArcaVector")
 
+# Límites por defecto del buffer de ingesta (sobrescribibles por entorno)
+LOTE_MAX_FRAGMENTOS = int(os.getenv("VECTOR_BATCH_SIZE", "100"))
+LOTE_MAX_BYTES = int(os.getenv("VECTOR_BATCH_BYTES", str(2 * 1024 * 1024)))
+LOTE_MAX_ESPERA = float(os.getenv("VECTOR_FLUSH_SECONDS", "2.0"))
+
+# Caché de consultas RAG (embedding de la pregunta + top-k)
+CACHE_CONSULTAS_MAX = int(os.getenv("RAG_CACHE_SIZE", "512"))
+CACHE_CONSULTAS_TTL = float(os.getenv("RAG_CACHE_TTL", "3600"))
+
+class BackendVectorial(ABC):
+    """Contrato mínimo de un almacén vectorial usado por ServicioVectorial.
+
+    Un backend al que le falte algún método abstracto falla al instanciarse.
+    """
+
+    @abstractmethod
+    def existentes(self, ids: List[str]) -> set:
+        """IDs de la lista que ya están indexados."""
+        raise NotImplementedError
+
+    @abstractmethod
+    def upsert(self, ids: List[str], documentos: List[str], metadatos: List[Dict[str, Any]]):
+        raise NotImplementedError
+
+    @abstractmethod
+    def embeber(self, textos: List[str]) -> List[List[float]]:
+        raise NotImplementedError
+
+    @abstractmethod
+    def consultar_vector(self, vector: List[float], n_resultados: int) -> Dict[str, Any]:
+        """Resultados con la forma de Chroma: {"ids": [[...]], "documents": [[...]], ...}."""
+        raise NotImplementedError
+
+    def consultar(self, texto: str, n_resultados: int) -> Dict[str, Any]:
+        return self.consultar_vector(self.embeber([texto])[0], n_resultados)
+
+    @abstractmethod
+    def eliminar_libro(self, id_libro: str):
+        raise NotImplementedError
+
+    @abstractmethod
+    def eliminar_legados(self) -> int:
+        """Borra los fragmentos sin id_libro en sus metadatos. Devuelve cuántos."""
+        raise NotImplementedError
+
+    @abstractmethod
+    def heartbeat(self):
+        raise NotImplementedError
+
+class BackendChroma(BackendVectorial):
+    """Colección de Chroma (Cloud o servidor)."""
+
+    def __init__(self, client, collection):
+        self.client = client
+        self.collection = collection
+        self._funcion_embedding = None
+
+    def existentes(self, ids: List[str]) -> set:
+        return set(self.collection.get(ids=ids, include=[])["ids"])
+
+    def upsert(self, ids: List[str], documentos: List[str], metadatos: List[Dict[str, Any]]):
+        self.collection.upsert(ids=ids, documents=documentos, metadatas=metadatos)
+
+    def embeber(self, textos: List[str]) -> List[List[float]]:
+        if self._funcion_embedding is None:
+            # La colección se creó sin función propia: Chroma usa esta en el cliente
+            from chromadb.utils.embedding_functions import DefaultEmbeddingFunction
+            self._funcion_embedding = DefaultEmbeddingFunction()
+        return [list(map(float, v)) for v in self._funcion_embedding(textos)]
+
+    def consultar_vector(self, vector: List[float], n_resultados: int) -> Dict[str, Any]:
+        return self.collection.query(query_embeddings=[vector], n_results=n_resultados)
+
+    def eliminar_libro(self, id_libro: str):
+        self.collection.delete(where={"id_libro": id_libro})
+
+    def eliminar_legados(self, tamano_pagina: int = 1000) -> int:
+        # Chroma no filtra por "clave ausente": se recorre la colección y se borra por ID
+        legados, desplazamiento = [], 0
+        while True:
+            pagina = self.collection.get(include=["metadatas"], limit=tamano_pagina, offset=desplazamiento)
+            if not pagina["ids"]:
+                break
+            legados.extend(i for i, meta in zip(pagina["ids"], pagina["metadatas"])
+                           if not (meta or {}).get("id_libro"))
+            desplazamiento += len(pagina["ids"])
+        for inicio in range(0, len(legados), tamano_pagina):
+            self.collection.delete(ids=legados[inicio:inicio + tamano_pagina])
+        return len(legados)
+
+    def heartbeat(self):
+        return self.client.heartbeat()
+
 class ServicioVectorial:
+    # Versión de la colección compartida por todas las instancias del proceso.
+    # Cada escritura la incrementa y deja obsoletas las consultas cacheadas.
+    _version_coleccion = 0
+    _lock_version = threading.Lock()
+
     def __init__(self):
+        self._cache_embeddings = CacheLRU(CACHE_CONSULTAS_MAX)
+        self._cache_resultados = CacheLRU(CACHE_CONSULTAS_MAX, ttl_segundos=CACHE_CONSULTAS_TTL)
+
+        # VECTOR_BACKEND=local usa el índice embebido en disco (sin red, funciona offline)
+        self.tipo_backend = os.getenv("VECTOR_BACKEND", "chroma").lower()
+        self.backend = None
+        self.client = None
+
+        if self.tipo_backend == "local":
+            try:
+                from indice_local import IndiceLocal
+                self.backend = IndiceLocal(os.getenv("VECTOR_LOCAL_PATH", "./indice_vectorial"))
+                logger.info(f"Índice vectorial local abierto ({self.backend.total()} fragmentos).")
+            except Exception as e:
+                logger.error(f"Error abriendo índice vectorial local: {e}")
+            return
+
         # Configuración de Chroma Cloud (Proporcionada por el usuario)
         self.api_key = os.getenv("CHROMA_API_KEY", "ck-GK4oZxwwX6JaxyKbeXrBFfGABLCrRQzisKK4i96Z9gXs")
         self.tenant = "34c6a845-7f29-408c-a89d-03d8cb287980"
         self.database = "arca_db"
         
         try:
-            # Usamos el cliente oficial de Chroma Cloud
+            # Usamos el cliente oficial de Chroma Cloud (import diferido: chromadb es pesado)
+            import chromadb
             self.client = chromadb.CloudClient(
                 api_key=self.api_key,
                 tenant=self.tenant,
@@ -24,27 +146,243 @@ class ServicioVectorial:
                 name="biblioteca_teologica",
                 metadata={"description": "Embeddings de libros teológicos para RAG"}
             )
+            self.backend = BackendChroma(self.client, self.collection)
             logger.info("Conectado a ChromaDB exitosamente.")
         except Exception as e:
             logger.error(f"Error conectando a ChromaDB: {e}")
             self.client = None
 
+    @staticmethod
+    def generar_id_fragmento(id_libro: str, texto: str, offset: int = 0) -> str:
+        """ID estable y direccionado por contenido: libro + offset + digest del texto.
+
+        A diferencia de hash(), sha1 no cambia entre procesos ni reinicios, así
+        que re-indexar el mismo fragmento produce siempre el mismo ID.
+        """
+        digest = hashlib.sha1(texto.encode("utf-8")).hexdigest()[:16]
+        return f"{id_libro}_{offset}_{digest}"
+
     def indexar_fragmento(self, id_libro: str, texto: str, metadatos: Dict[str, Any]):
         """Indexa un fragmento de texto en la base vectorial."""
-        if not self.client: return
-        
-        self.collection.add(
-            documents=[texto],
-            metadatas=[metadatos],
-            ids=[f"{id_libro}_{hash(texto)}"]
+        self.indexar_fragmentos([{"id_libro": id_libro, "texto": texto, "metadatos": metadatos}])
+
+    def indexar_fragmentos(self, fragmentos: List[Dict[str, Any]]) -> int:
+        """Indexa varios fragmentos en una sola llamada a Chroma (upsert idempotente).
+
+        Cada fragmento es un dict con las claves id_libro, texto y metadatos
+        (offset opcional en metadatos). Los IDs que ya existen en la colección
+        se omiten: su contenido es idéntico por construcción, así que no se
+        recalculan embeddings. Devuelve cuántos fragmentos se escribieron.
+        """
+        if not self.backend or not fragmentos: return 0
+
+        # dict: un mismo fragmento repetido en el lote se escribe una sola vez
+        por_id = {}
+        for f in fragmentos:
+            metadatos = {**f["metadatos"], "id_libro": str(f["id_libro"])}
+            id_fragmento = self.generar_id_fragmento(str(f["id_libro"]), f["texto"], metadatos.get("offset", 0))
+            por_id[id_fragmento] = (f["texto"], metadatos)
+
+        existentes = self.backend.existentes(list(por_id))
+        pendientes = [(i, texto, meta) for i, (texto, meta) in por_id.items() if i not in existentes]
+        if not pendientes:
+            return 0
+
+        self.backend.upsert(
+            [i for i, _, _ in pendientes],
+            [texto for _, texto, _ in pendientes],
+            [meta for _, _, meta in pendientes]
         )
+        self._incrementar_version()
+        return len(pendientes)
+
+    def eliminar_libro(self, id_libro: str):
+        """Borra todos los fragmentos de un libro (p.ej. si el archivo cambió o se eliminó)."""
+        if not self.backend: return
+
+        self.backend.eliminar_libro(str(id_libro))
+        self._incrementar_version()
+
+    def eliminar_fragmentos_legados(self) -> int:
+        """Borra los fragmentos del esquema de IDs anterior ("<id numérico en DB>_<hash()>").
+
+        Se indexaban sin id_libro en los metadatos, así que ni eliminar_libro ni la purga
+        del escáner los alcanzan. Devuelve cuántos se borraron.
+        """
+        if not self.backend: return 0
+
+        borrados = self.backend.eliminar_legados()
+        if borrados:
+            self._incrementar_version()
+        return borrados
+
+    @classmethod
+    def _incrementar_version(cls):
+        with cls._lock_version:
+            cls._version_coleccion += 1
+
+    def buffer_ingesta(self, **opciones) -> "BufferIngesta":
+        """Crea un buffer write-behind que envía fragmentos a esta colección por lotes."""
+        return BufferIngesta(self, **opciones)
 
     def buscar_similitud(self, consulta: str, n_resultados: int = 5):
-        """Busca los fragmentos más relevantes para una consulta."""
-        if not self.client: return []
-        
-        resultados = self.collection.query(
-            query_texts=[consulta],
-            n_results=n_resultados
-        )
+        """Busca los fragmentos más relevantes para una consulta.
+
+        Las preguntas repetidas (misma forma normalizada) se responden desde
+        caché sin tocar el almacén. El embedding de la pregunta sobrevive a
+        las ingestas; los resultados se invalidan con la versión de la colección.
+        El resultado es compartido: no modificarlo.
+        """
+        if not self.backend: return []
+
+        clave_texto = normalizar_texto(consulta)
+        clave = (clave_texto, n_resultados, ServicioVectorial._version_coleccion)
+        resultados = self._cache_resultados.obtener(clave)
+        if resultados is not None:
+            return resultados
+
+        vector = self._cache_embeddings.obtener(clave_texto)
+        if vector is None:
+            vector = self.backend.embeber([consulta])[0]
+            self._cache_embeddings.guardar(clave_texto, vector)
+
+        resultados = self.backend.consultar_vector(vector, n_resultados)
+        self._cache_resultados.guardar(clave, resultados)
         return resultados
+
+    def estadisticas_cache(self) -> Dict[str, Any]:
+        return {
+            "version_coleccion": ServicioVectorial._version_coleccion,
+            "resultados": self._cache_resultados.estadisticas(),
+            "embeddings": self._cache_embeddings.estadisticas(),
+        }
+
+class BufferIngesta:
+    """Buffer write-behind para ingesta en el almacén vectorial.
+
+    Agrupa fragmentos y los envía en segundo plano cuando el lote llega a
+    max_fragmentos, a max_bytes de texto o cuando el lote más antiguo supera
+    max_espera segundos. Los lotes fallidos se reintentan con backoff
+    exponencial. Hay que llamar a flush()/close() (o usarlo como context
+    manager) para vaciarlo al terminar un escaneo.
+    """
+
+    def __init__(self, servicio: "ServicioVectorial", max_fragmentos: int = LOTE_MAX_FRAGMENTOS,
+                 max_bytes: int = LOTE_MAX_BYTES, max_espera: float = LOTE_MAX_ESPERA,
+                 reintentos: int = 3, espera_reintento: float = 0.5, lotes_en_cola: int = 4):
+        self.servicio = servicio
+        self.max_fragmentos = max_fragmentos
+        self.max_bytes = max_bytes
+        self.max_espera = max_espera
+        self.reintentos = reintentos
+        self.espera_reintento = espera_reintento
+        self.lotes_en_cola = lotes_en_cola
+
+        self._cond = threading.Condition()
+        self._lote: List[Dict[str, Any]] = []
+        self._bytes_lote = 0
+        self._inicio_lote = 0.0
+        self._pendientes = deque()  # Lotes sellados esperando envío
+        self._en_envio = 0
+        self._cerrado = False
+
+        self.fragmentos_enviados = 0
+        self.lotes_enviados = 0
+        self.lotes_fallidos = 0
+        self.libros_fallidos = set()  # id_libro con algún fragmento descartado
+
+        self._hilo = threading.Thread(target=self._bucle_envio, name="arca-ingesta", daemon=True)
+        self._hilo.start()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def agregar(self, id_libro: str, texto: str, metadatos: Dict[str, Any]):
+        """Encola un fragmento. Solo bloquea si hay demasiados lotes pendientes (contrapresión)."""
+        with self._cond:
+            if self._cerrado:
+                raise RuntimeError("El buffer de ingesta ya está cerrado.")
+            self._cond.wait_for(lambda: len(self._pendientes) < self.lotes_en_cola)
+            if not self._lote:
+                self._inicio_lote = time.monotonic()
+            self._lote.append({"id_libro": id_libro, "texto": texto, "metadatos": metadatos})
+            self._bytes_lote += len(texto.encode("utf-8"))
+            if len(self._lote) >= self.max_fragmentos or self._bytes_lote >= self.max_bytes:
+                self._sellar()
+
+    def flush(self):
+        """Envía lo acumulado y espera a que todos los lotes pendientes terminen."""
+        with self._cond:
+            self._sellar()
+            self._cond.wait_for(lambda: not self._pendientes and not self._en_envio)
+
+    def close(self):
+        """Vacía el buffer y detiene el hilo de envío."""
+        if self._cerrado:
+            return
+        self.flush()
+        with self._cond:
+            self._cerrado = True
+            self._cond.notify_all()
+        self._hilo.join()
+
+    def estadisticas(self) -> Dict[str, int]:
+        return {
+            "fragmentos_enviados": self.fragmentos_enviados,
+            "lotes_enviados": self.lotes_enviados,
+            "lotes_fallidos": self.lotes_fallidos,
+        }
+
+    def _sellar(self):
+        # Llamar con self._cond tomado
+        if self._lote:
+            self._pendientes.append(self._lote)
+            self._lote = []
+            self._bytes_lote = 0
+            self._cond.notify_all()
+
+    def _bucle_envio(self):
+        while True:
+            with self._cond:
+                while True:
+                    if self._pendientes:
+                        break
+                    if self._lote and time.monotonic() - self._inicio_lote >= self.max_espera:
+                        self._sellar()
+                        break
+                    if self._cerrado:
+                        return
+                    restante = self.max_espera - (time.monotonic() - self._inicio_lote) if self._lote else None
+                    self._cond.wait(timeout=restante)
+                lote = self._pendientes.popleft()
+                self._en_envio += 1
+                self._cond.notify_all()
+            try:
+                self._enviar_con_reintentos(lote)
+            finally:
+                with self._cond:
+                    self._en_envio -= 1
+                    self._cond.notify_all()
+
+    def _enviar_con_reintentos(self, lote: List[Dict[str, Any]]):
+        for intento in range(self.reintentos + 1):
+            try:
+                self.servicio.indexar_fragmentos(lote)
+                self.fragmentos_enviados += len(lote)
+                self.lotes_enviados += 1
+                return
+            except Exception as e:
+                if intento == self.reintentos:
+                    self.lotes_fallidos += 1
+                    self.libros_fallidos.update(f["id_libro"] for f in lote)
+                    logger.error(f"Lote de {len(lote)} fragmentos descartado tras {intento + 1} intentos: {e}")
+                    return
+                espera = self.espera_reintento * (2 ** intento) * random.uniform(0.8, 1.2)
+                logger.warning(f"Fallo enviando lote a Chroma (intento {intento + 1}), reintento en {espera:.1f} s: {e}")
+                time.sleep(espera)
+
+# Instancia compartida por la API, la biblioteca y el escáner (una sola conexión a Chroma)
+servicio_vectorial = registro.registrar("vectorial", ServicioVectorial)
@@ -0,0 +1,73 @@
+"""Registro de servicios compartidos (IA, Drive, base vectorial) creados bajo demanda.
+
+Importar main no construye nada caro: cada servicio se crea la primera vez que se usa,
+o al precalentarlo en segundo plano tras el arranque, y todos los módulos comparten la
+misma instancia (antes main y servicio_biblioteca abrían cada uno su ServicioVectorial).
+"""
+import time
+import logging
+import threading
+from typing import Any, Callable, Dict, Iterable, Optional
+
+logger = logging.getLogger("ArcaRegistro")
+
+class RegistroServicios:
+    def __init__(self):
+        self._fabricas: Dict[str, Callable[[], Any]] = {}
+        self._instancias: Dict[str, Any] = {}
+        self._locks: Dict[str, threading.Lock] = {}
+        self.tiempos: Dict[str, float] = {}
+
+    def registrar(self, nombre: str, fabrica: Callable[[], Any]) -> "ServicioPerezoso":
+        """Registra la fábrica del servicio y devuelve el objeto que lo representa hasta crearlo."""
+        self._fabricas[nombre] = fabrica
+        self._locks[nombre] = threading.Lock()
+        return ServicioPerezoso(self, nombre)
+
+    def obtener(self, nombre: str) -> Any:
+        """Instancia del servicio; la crea (una sola vez, aunque la pidan varios hilos a la vez)."""
+        if nombre in self._instancias:
+            return self._instancias[nombre]
+        with self._locks[nombre]:
+            if nombre not in self._instancias:
+                inicio = time.perf_counter()
+                self._instancias[nombre] = self._fabricas[nombre]()
+                self.tiempos[nombre] = time.perf_counter() - inicio
+                logger.info(f"Servicio '{nombre}' listo en {self.tiempos[nombre] * 1000:.0f} ms")
+            return self._instancias[nombre]
+
+    def creado(self, nombre: str) -> bool:
+        return nombre in self._instancias
+
+    def precalentar(self, nombres: Optional[Iterable[str]] = None):
+        """Crea los servicios indicados (todos por defecto). Pensado para un hilo en segundo plano."""
+        for nombre in nombres or list(self._fabricas):
+            try:
+                self.obtener(nombre)
+            except Exception as e:
+                logger.error(f"Error precalentando el servicio '{nombre}': {e}")
+
+    def estadisticas(self) -> Dict[str, Any]:
+        return {nombre: {"creado": self.creado(nombre),
+                         "ms_creacion": round(self.tiempos[nombre] * 1000, 1) if nombre in self.tiempos else None}
+                for nombre in self._fabricas}
+
+class ServicioPerezoso:
+    """Se comporta como el servicio: el primer acceso a un atributo lo crea."""
+    __slots__ = ("_registro", "_nombre")
+
+    def __init__(self, registro: RegistroServicios, nombre: str):
+        object.__setattr__(self, "_registro", registro)
+        object.__setattr__(self, "_nombre", nombre)
+
+    def __getattr__(self, atributo):
+        return getattr(self._registro.obtener(self._nombre), atributo)
+
+    def __setattr__(self, atributo, valor):
+        setattr(self._registro.obtener(self._nombre), atributo, valor)
+
+    def __repr__(self):
+        estado = "creado" if self._registro.creado(self._nombre) else "pendiente"
+        return f"<servicio {self._nombre} ({estado})>"
+
+registro = RegistroServicios()
@@ -7,7 +7,7 @@ import { auth } from "./firebase";
 
 const API_BASE_URL = import.meta.env.VITE_API_BASE_URL || "http://127.0.0.1:8000";
 
-async function peticion(endpoint, opciones = {}) {
+async function peticionRespuesta(endpoint, opciones = {}) {
     // Inyectar user_id
     const user = auth.currentUser;
     const userId = user ? user.email : localStorage.getItem("arca_usuario");
@@ -27,16 +27,84 @@ async function peticion(endpoint, opciones = {}) {
 
     if (!respuesta.ok) {
         const error = await respuesta.json().catch(() => ({ detail: "Error desconocido" }));
-        throw new Error(error.detail || "Error en la petición al servidor");
+        // detail puede ser un objeto (p.ej. 409 de notas: { mensaje, version })
+        const mensaje = typeof error.detail === "string" ? error.detail : error.detail?.mensaje;
+        const excepcion = new Error(mensaje || "Error en la petición al servidor");
+        excepcion.status = respuesta.status;
+        excepcion.detalle = error.detail;
+        throw excepcion;
     }
 
+    return respuesta;
+}
+
+async function peticion(endpoint, opciones = {}) {
+    const respuesta = await peticionRespuesta(endpoint, opciones);
     return respuesta.json();
 }
 
+/**
+ * Recorre un listado paginado por cursor (cabecera X-Siguiente-Cursor) y devuelve todas las filas.
+ * alResponder(respuesta) se llama con cada página (p.ej. para leer otras cabeceras).
+ */
+async function peticionPaginada(endpoint, alResponder = () => {}) {
+    const filas = [];
+    let cursor = null;
+    do {
+        const separador = endpoint.includes("?") ? "&" : "?";
+        const pagina = cursor ? `${endpoint}${separador}cursor=${encodeURIComponent(cursor)}` : endpoint;
+        const respuesta = await peticionRespuesta(pagina);
+        alResponder(respuesta);
+        filas.push(...(await respuesta.json()));
+        cursor = respuesta.headers.get("X-Siguiente-Cursor");
+    } while (cursor);
+    return filas;
+}
+
+// Columnas que usa la tabla de la biblioteca (sin la descripción, que es lo más pesado)
+const CAMPOS_TABLA = "id,ruta,nombre_archivo,titulo,autor,formato,tamano_bytes,categoria,etiquetas,hash_md5,num_paginas";
+
+/**
+ * Petición a un endpoint Server-Sent Events (POST o GET).
+ * Llama a alEvento(nombre, datos) por cada evento recibido ("fuentes", "token", "fin", "error").
+ */
+async function peticionStream(endpoint, opciones = {}, alEvento = () => {}) {
+    // Mismo user_id y mismos errores que el resto de peticiones
+    const respuesta = await peticionRespuesta(endpoint, {
+        ...opciones,
+        headers: { Accept: "text/event-stream", ...opciones.headers },
+    });
+
+    const lector = respuesta.body.getReader();
+    const decodificador = new TextDecoder();
+    let buffer = "";
+
+    while (true) {
+        const { value, done } = await lector.read();
+        if (done) break;
+        buffer += decodificador.decode(value, { stream: true });
+
+        // Cada evento SSE termina con una línea en blanco
+        let fin;
+        while ((fin = buffer.indexOf("\n\n")) !== -1) {
+            const bloque = buffer.slice(0, fin);
+            buffer = buffer.slice(fin + 2);
+            let nombre = "message";
+            let datos = "";
+            for (const linea of bloque.split("\n")) {
+                if (linea.startsWith("event: ")) nombre = linea.slice(7);
+                else if (linea.startsWith("data: ")) datos += linea.slice(6);
+            }
+            alEvento(nombre, datos ? JSON.parse(datos) : null);
+        }
+    }
+}
+
 export const api = {
     // Libros Digitales
     libros: {
-        listar: () => peticion("/libros/digitales"),
+        listar: () => peticionPaginada(`/libros/digitales?limite=1000&campos=${CAMPOS_TABLA}`),
+        pagina: (parametros = {}) => peticion(`/libros/digitales?${new URLSearchParams(parametros)}`),
         escanear: () => peticion("/libros/digitales/escanear", { method: "POST" }),
         sincronizarDrive: () => peticion("/libros/digitales/sincronizar-drive", { method: "POST" }),
     },
@@ -51,6 +119,22 @@ export const api = {
     // Notas (Cuaderno)
     notas: {
         listar: () => peticion("/notas"),
+        // Sin cuerpos; "hasta" es la marca para pedir después solo los cambios
+        resumen: async () => {
+            let hasta = null;
+            const notas = await peticionPaginada("/notas/resumen?limite=500", (respuesta) => {
+                hasta = hasta || respuesta.headers.get("X-Sincronizado-Hasta");
+            });
+            return { notas, hasta };
+        },
+        obtener: (id) => peticion(`/notas/${id}`),
+        cambios: (desde) => peticion(`/notas/cambios?since=${encodeURIComponent(desde)}`),
+        // Autoguardado: { version, cambios: [{ desde, hasta, texto }], titulo?, palabras_clave?, es_favorita? }
+        parchear: (id, parche) => peticion(`/notas/${id}`, {
+            method: "PATCH",
+            body: JSON.stringify(parche),
+        }),
+        buscar: (q, limite = 20) => peticion(`/notas/buscar?q=${encodeURIComponent(q)}&limite=${limite}`),
         crear: (nota) => peticion("/notas", { method: "POST", body: JSON.stringify(nota) }),
         actualizar: (id, nota) => peticion(`/notas/${id}`, { method: "PUT", body: JSON.stringify(nota) }),
         eliminar: (id) => peticion(`/notas/${id}`, { method: "DELETE" }),
@@ -58,12 +142,13 @@ export const api = {
 
     // Diccionario Teológico
     diccionario: {
-        consultar: (termino, perspectiva = "reformado") =>
-            peticion(`/diccionario/${encodeURIComponent(termino)}?perspectiva=${perspectiva}`),
+        consultarStream: (termino, perspectiva = "reformado", alEvento) =>
+            peticionStream(`/diccionario/${encodeURIComponent(termino)}/stream?perspectiva=${perspectiva}`, {}, alEvento),
     },
 
     // Asistente IA (RAG)
     asistente: {
-        preguntar: (pregunta) => peticion("/preguntar", { method: "POST", body: JSON.stringify({ pregunta }) }),
+        preguntarStream: (pregunta, alEvento) =>
+            peticionStream("/preguntar/stream", { method: "POST", body: JSON.stringify({ pregunta }) }, alEvento),
     },
 };
@@ -1,4 +1,4 @@
-import { writable } from 'svelte/store';
+import { writable, get } from 'svelte/store';
 import { api } from './api';
 
 // --- ESTADO DE UI ---
@@ -17,14 +17,13 @@ export const cargando = writable(false);
 export async function cargarTodo() {
     cargando.set(true);
     try {
-        const [librosData, fisicosData, notasData] = await Promise.all([
+        const [librosData, fisicosData] = await Promise.all([
             api.libros.listar(),
             api.fisicos.listar(),
-            api.notas.listar()
+            sincronizarNotas({ completa: true })
         ]);
         biblioteca.set(librosData);
         librosFisicos.set(fisicosData);
-        notas.set(notasData);
     } catch (error) {
         console.error("Error cargando datos:", error);
     } finally {
@@ -32,11 +31,86 @@ export async function cargarTodo() {
     }
 }
 
-export async function sincronizarNotas() {
+// Marca del servidor de la última sincronización de notas: después solo se piden los cambios
+let notasHasta = null;
+
+function ordenarNotas(lista) {
+    return lista.sort((a, b) => (b.fecha_actualizacion || "").localeCompare(a.fecha_actualizacion || ""));
+}
+
+export function reiniciarNotas() {
+    notasHasta = null;
+    notas.set([]);
+}
+
+/**
+ * Primera vez (o completa): resumen de notas sin cuerpos. Después: solo notas cambiadas y borradas.
+ */
+export async function sincronizarNotas({ completa = false } = {}) {
     try {
-        const data = await api.notas.listar();
-        notas.set(data);
+        if (completa || !notasHasta) {
+            const { notas: resumen, hasta } = await api.notas.resumen();
+            notas.set(resumen);
+            notasHasta = hasta;
+            return;
+        }
+        const cambios = await api.notas.cambios(notasHasta);
+        if (cambios.reiniciar) {
+            return sincronizarNotas({ completa: true });
+        }
+        notas.update((lista) => {
+            const porId = new Map(lista.map((nota) => [nota.id, nota]));
+            cambios.eliminadas.forEach((id) => porId.delete(id));
+            cambios.notas.forEach((nota) => porId.set(nota.id, nota));
+            return ordenarNotas([...porId.values()]);
+        });
+        notasHasta = cambios.hasta;
     } catch (error) {
         console.error("Error sincronizando notas:", error);
     }
 }
+
+/**
+ * Nota completa (con contenido_html). Las del resumen se piden una vez y quedan en el store.
+ */
+export async function cargarNota(id) {
+    const enStore = get(notas).find((nota) => nota.id === id);
+    if (enStore && enStore.contenido_html !== undefined) return enStore;
+    const nota = await api.notas.obtener(id);
+    notas.update((lista) => lista.map((n) => (n.id === id ? nota : n)));
+    return nota;
+}
+
+/**
+ * Tramo que cambió entre dos textos (prefijo y sufijo comunes fuera): un único cambio
+ * { desde, hasta, texto } sobre `anterior`, o ninguno si son iguales.
+ */
+function diferenciaTexto(anterior, nuevo) {
+    if (anterior === nuevo) return [];
+    const minimo = Math.min(anterior.length, nuevo.length);
+    let inicio = 0;
+    while (inicio < minimo && anterior[inicio] === nuevo[inicio]) inicio++;
+    let fin = 0;
+    while (fin < minimo - inicio && anterior[anterior.length - 1 - fin] === nuevo[nuevo.length - 1 - fin]) fin++;
+    return [{ desde: inicio, hasta: anterior.length - fin, texto: nuevo.slice(inicio, nuevo.length - fin) }];
+}
+
+/**
+ * Autoguardado de una nota: envía solo lo que cambió respecto a `base` ({ contenido_html, version }
+ * de la última versión guardada). Si el servidor responde 409 pero el contenido no cambió allí
+ * (p.ej. solo se marcó como favorita) se reintenta sobre la versión nueva; si no, se lanza el error.
+ */
+export async function guardarNota(id, base, contenido, campos = {}) {
+    const parche = { version: base.version, cambios: diferenciaTexto(base.contenido_html || "", contenido), ...campos };
+    let guardada;
+    try {
+        guardada = await api.notas.parchear(id, parche);
+    } catch (error) {
+        if (error.status !== 409) throw error;
+        const actual = await api.notas.obtener(id);
+        if (actual.contenido_html !== base.contenido_html) throw error;
+        guardada = await api.notas.parchear(id, { ...parche, version: actual.version });
+    }
+    notas.update((lista) => lista.map((n) => (n.id === id ? { ...n, ...campos, ...guardada, contenido_html: contenido } : n)));
+    return guardada;
+}